@@ -29,6 +29,34 @@ export const useChat = (roomId: string, username: string) => {
     }));
   }, []);
 
+  // Streamed agent replies arrive as chunks sharing one id: append to that bubble
+  const applyStreamChunk = useCallback((chunk: { id: string; text: string; sender: string; stream: 'delta' | 'end' }) => {
+    setChatState(prev => {
+      const index = prev.messages.findIndex(m => m.id === chunk.id);
+
+      if (index === -1) {
+        if (chunk.stream === 'end') return prev;
+        const newMessage: Message = {
+          id: chunk.id,
+          text: chunk.text,
+          sender: chunk.sender,
+          timestamp: new Date(),
+          isAI: true,
+          isStreaming: true
+        };
+        return { ...prev, messages: [...prev.messages, newMessage] };
+      }
+
+      const messages = [...prev.messages];
+      messages[index] = {
+        ...messages[index],
+        text: messages[index].text + chunk.text,
+        isStreaming: chunk.stream !== 'end'
+      };
+      return { ...prev, messages };
+    });
+  }, []);
+
   const updateParticipants = useCallback((participants: Participant[]) => {
     setChatState(prev => ({
       ...prev,
@@ -73,7 +101,9 @@ export const useChat = (roomId: string, username: string) => {
       const livekitClient = new LiveKitClient();
 
       livekitClient.onMessage((messageData) => {
-        if (messageData.sender !== username) {
+        if (messageData.stream && messageData.id) {
+          applyStreamChunk(messageData);
+        } else if (messageData.sender !== username) {
           addMessage(messageData);
         }
       });
@@ -109,7 +139,7 @@ export const useChat = (roomId: string, username: string) => {
     } finally {
       setIsConnecting(false);
     }
-  }, [roomId, username, addMessage, updateParticipants, isConnecting, chatState.isConnected]);
+  }, [roomId, username, addMessage, applyStreamChunk, updateParticipants, isConnecting, chatState.isConnected]);
 
   const disconnect = useCallback(() => {
     if (client) {
@@ -0,0 +1,216 @@
+import asyncio
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from .config import Config
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_model_call_slots = None
+
+def model_call_slots() -> asyncio.Semaphore:
+    """Process-wide semaphore bounding concurrent model calls across all rooms"""
+    global _model_call_slots
+    if _model_call_slots is None:
+        _model_call_slots = asyncio.Semaphore(Config.MAX_CONCURRENT_MODEL_CALLS)
+    return _model_call_slots
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        """Take one token if available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class PendingTurn:
+    """One queued model turn for a user, possibly made of several coalesced messages"""
+
+    __slots__ = ("username", "messages", "chars", "first_at")
+
+    def __init__(self, username: str, message: str):
+        self.username = username
+        self.messages = [message]
+        self.chars = len(message)
+        self.first_at = time.monotonic()
+
+    def add(self, message: str):
+        """Append a follow-up message"""
+        self.messages.append(message)
+        self.chars += len(message) + 1
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.messages)
+
+class RoomAdmission:
+    """
+    Admission control for one room's @agent mentions.
+
+    Mentions go through a per-user token bucket, then into a bounded queue
+    drained by a fixed number of workers. While a user's turn is still queued,
+    further messages from them are appended to it instead of becoming new
+    turns, so a burst of rapid messages costs one model call. Follow-ups
+    still spend the user's tokens, and a turn stops growing at
+    max_coalesced messages or max_turn_chars characters.
+
+    With a batch_handler, a worker that picks up a turn also waits
+    batch_window for other users' turns and hands up to max_batch of them
+    to the batch handler together.
+    """
+
+    def __init__(self, handler: Callable[[str, str], Awaitable[None]], queue_size: int = 20, workers: int = 2,
+                 user_rate: float = 0.5, user_burst: float = 3, coalesce_window: float = 0.15,
+                 batch_handler: Optional[Callable[[List[Tuple[str, str]]], Awaitable[None]]] = None,
+                 batch_window: float = 0.2, max_batch: int = 8, max_coalesced: int = 5,
+                 max_turn_chars: int = 4000):
+        """
+        Args:
+            handler: Coroutine called with (username, message) for each admitted turn
+            queue_size: Turns that may wait in this room before new ones are dropped
+            workers: Turns processed concurrently in this room
+            user_rate: Turns per second each user may start
+            user_burst: Turns a user may start back to back
+            coalesce_window: Seconds a fresh turn waits for follow-up messages before it starts
+            batch_handler: Coroutine called with a list of (username, message) turns, enables micro-batching
+            batch_window: Seconds a worker collects turns for a batch
+            max_batch: Maximum turns per batch
+            max_coalesced: Messages a queued turn may collect before follow-ups are dropped
+            max_turn_chars: Characters a queued turn may collect before follow-ups are dropped
+        """
+        self.handler = handler
+        self.workers = workers
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.coalesce_window = coalesce_window
+        self.batch_handler = batch_handler
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_coalesced = max_coalesced
+        self.max_turn_chars = max_turn_chars
+
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._pending = {}  # username -> PendingTurn not yet picked up by a worker
+        self._buckets = {}  # username -> TokenBucket
+        self._worker_tasks: List[asyncio.Task] = []
+
+        self.admitted = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.dropped = 0
+        self.completed = 0
+        self.batches = 0
+
+    def submit(self, username: str, message: str) -> str:
+        """
+        Offer a mention for processing
+
+        Returns:
+            "coalesced", "queued", "rate_limited" or "dropped"
+        """
+        pending = self._pending.get(username)
+        if pending is not None and (len(pending.messages) >= self.max_coalesced
+                                    or pending.chars + len(message) + 1 > self.max_turn_chars):
+            self.dropped += 1
+            return "dropped"
+
+        # Follow-ups are charged too: they still grow the prompt
+        bucket = self._buckets.get(username)
+        if bucket is None:
+            bucket = self._buckets[username] = TokenBucket(self.user_rate, self.user_burst)
+        if not bucket.try_acquire():
+            self.rate_limited += 1
+            return "rate_limited"
+
+        if pending is not None:
+            pending.add(message)
+            self.coalesced += 1
+            return "coalesced"
+
+        turn = PendingTurn(username, message)
+        try:
+            self._queue.put_nowait(turn)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return "dropped"
+
+        self._pending[username] = turn
+        self.admitted += 1
+        return "queued"
+
+    def start(self):
+        """Start the room's workers (must run inside the event loop)"""
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.create_task(self._run_worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers; queued turns are discarded"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def _run_worker(self):
+        """Process queued turns, one at a time or in micro-batches"""
+        while True:
+            turns = [await self._queue.get()]
+            try:
+                # Give the user a moment to send follow-ups that join this turn,
+                # and in batch mode give other users' mentions time to arrive
+                window = max(self.coalesce_window, self.batch_window if self.batch_handler else 0)
+                wait = window - (time.monotonic() - turns[0].first_at)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                if self.batch_handler:
+                    while len(turns) < self.max_batch and not self._queue.empty():
+                        turns.append(self._queue.get_nowait())
+
+                for turn in turns:
+                    if self._pending.get(turn.username) is turn:
+                        del self._pending[turn.username]
+                    # Includes the coalescing/batch window, which is deliberate wait
+                    metrics.observe_stage("queue_wait", time.monotonic() - turn.first_at)
+
+                if len(turns) > 1:
+                    await self.batch_handler([(turn.username, turn.text) for turn in turns])
+                    self.batches += 1
+                else:
+                    await self.handler(turns[0].username, turns[0].text)
+                self.completed += len(turns)
+            except Exception as e:
+                metrics.error("turn")
+                logger.error(f"Error handling turns for {', '.join(turn.username for turn in turns)}: {e}")
+            finally:
+                for _ in turns:
+                    self._queue.task_done()
+
+    @property
+    def queue_depth(self) -> int:
+        """Turns waiting for a worker"""
+        return self._queue.qsize()
+
+    def stats(self) -> Dict:
+        """Get admission counters"""
+        return {
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "coalesced": self.coalesced,
+            "rate_limited": self.rate_limited,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "batches": self.batches
+        }
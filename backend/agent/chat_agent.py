@@ -1,20 +1,54 @@
 import asyncio
 import json
 import logging
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from livekit import agents, rtc
 from livekit.agents import AutoSubscribe, WorkerOptions, cli, JobContext
 from .config import Config
-from .gemini_service import GeminiService
-from .memory_service import MemoryService
+from .admission import RoomAdmission, model_call_slots
+from .metrics import metrics, start_exporters
+from .packet_filter import mentions_trigger, strip_trigger
+from .room_transcript import RoomTranscript
+from .services import Services, get_services
+from .wire import WIRE_TOPIC, Outbox, decode
 
 logger = logging.getLogger(__name__)
 
 class ChatAgent:
-    def __init__(self):
-        # Initialize services
-        self.gemini = GeminiService()
-        self.memory = MemoryService()
+    def __init__(self, services: Optional[Services] = None):
+        # Service clients and caches are shared by every room in this process
+        services = services or get_services()
+        self.gemini = services.gemini
+        self.memory = services.memory
         self.room = None
+        self.outbox = None
+        
+        # Wire version each participant announced; batch packets are only
+        # sent while every participant in the room understands them
+        self.peer_wire_versions: Dict[str, int] = {}
+        
+        # Recent room chat, so answers can refer to what others said
+        self.transcript = (
+            RoomTranscript(Config.ROOM_TRANSCRIPT_SIZE, Config.ROOM_TRANSCRIPT_MAX_BYTES)
+            if Config.ROOM_TRANSCRIPT_SIZE > 0 else None
+        )
+        
+        # Bounded, rate-limited queue of @agent turns for this room
+        self.admission = RoomAdmission(
+            self.respond,
+            queue_size=Config.ROOM_QUEUE_SIZE,
+            workers=Config.ROOM_WORKERS,
+            user_rate=Config.USER_RATE_LIMIT,
+            user_burst=Config.USER_RATE_BURST,
+            coalesce_window=Config.COALESCE_WINDOW,
+            batch_handler=self.respond_batch if Config.MICRO_BATCHING else None,
+            batch_window=Config.BATCH_WINDOW,
+            max_batch=Config.MAX_BATCH_SIZE,
+            max_coalesced=Config.MAX_COALESCED_MESSAGES,
+            max_turn_chars=Config.MAX_TURN_CHARS
+        )
         
         logger.info("ChatAgent initialized")
     
@@ -24,6 +58,12 @@ class ChatAgent:
         
         # Store room reference
         self.room = ctx.room
+        self.outbox = Outbox(
+            self.publish_packet,
+            max_bytes=Config.WIRE_MAX_PACKET_BYTES,
+            window=Config.WIRE_COALESCE_WINDOW,
+            can_batch=self.peers_support_batches
+        )
         
         # Set up event handlers BEFORE connecting
         @self.room.on("data_received")
@@ -32,7 +72,20 @@ class ChatAgent:
             try:
                 # Extract the actual data bytes from the DataPacket
                 data_bytes = data_packet.data
-                logger.debug(f"Received DataPacket with {len(data_bytes)} bytes from participant: {participant.identity if participant else 'unknown'}")
+                
+                # Clients announce the wire version they speak on their own topic
+                if getattr(data_packet, "topic", None) == WIRE_TOPIC:
+                    self.handle_wire_hello(data_bytes, participant)
+                    return
+                
+                # Keep every chat packet, undecoded, for room-aware answers
+                if self.transcript is not None:
+                    self.transcript.record(data_bytes, participant.identity if participant else None)
+                
+                # Fast path: most room traffic never mentions the agent, so reject
+                # it on the raw bytes before any decoding, parsing or logging
+                if not mentions_trigger(data_bytes):
+                    return
                 
                 # Handle the message asynchronously
                 asyncio.create_task(self.handle_data_message(data_bytes, participant))
@@ -46,10 +99,16 @@ class ChatAgent:
         
         @self.room.on("participant_disconnected") 
         def on_participant_disconnected(participant: rtc.RemoteParticipant):
+            self.peer_wire_versions.pop(participant.identity, None)
             logger.info(f"Participant left: {participant.identity}")
         
         # Connect to room
         await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+        self.admission.start()
+        
+        # Warm memory for participants who were already in the room
+        for participant in self.room.remote_participants.values():
+            asyncio.create_task(self.memory.prefetch(participant.identity))
         
         # Send welcome message
         await self.send_chat_message("🤖 AI Assistant has joined the chat! Mention @agent to talk to me.")
@@ -61,12 +120,18 @@ class ChatAgent:
             # Wait indefinitely - the session will end when all participants leave
             await asyncio.Future()
         except asyncio.CancelledError:
-            logger.info("Agent session ended")
+            logger.info(f"Agent session ended ({self.admission.stats()})")
+            logger.info(f"Model routes: {self.gemini.router.stats()}")
+            await self.admission.stop()
+            await self.outbox.flush()
     
     async def handle_participant_joined(self, participant: rtc.RemoteParticipant):
         """Handle new participant joining"""
         logger.info(f"Participant joined: {participant.identity}")
         
+        # Warm this user's context so their first @agent message skips retrieval
+        prefetch = asyncio.create_task(self.memory.prefetch(participant.identity))
+        
         # Send personalized welcome if we have history with this user
         try:
             stats = self.memory.get_user_stats(participant.identity)
@@ -76,16 +141,19 @@ class ChatAgent:
                 )
         except Exception as e:
             logger.error(f"Error sending welcome message: {e}")
+        
+        await prefetch
     
     async def handle_data_message(self, data: bytes, participant: rtc.RemoteParticipant = None):
         """
         Handle incoming data messages from chat
-        Only responds if message contains @agent mention
+        Only responds if message contains @agent mention; callers are expected
+        to have dropped packets without the trigger via mentions_trigger()
         """
         try:
             # Decode message
-            message_str = data.decode('utf-8')
-            message_data = json.loads(message_str)
+            with metrics.stage("decode"):
+                message_data = decode(data)
             
             # Get username - handle case where participant might be None
             if participant:
@@ -97,47 +165,101 @@ class ChatAgent:
             
             message_text = message_data.get("text", "")
             
-            logger.info(f"🔍 RECEIVED MESSAGE FROM {username}: '{message_text}'")
-            logger.info(f"📋 Full message_data: {message_data}")
+            logger.debug("Received message from %s: %r", username, message_data)
             
             # Skip messages from the AI agent itself
             if message_data.get("type") == "ai" or message_data.get("sender") == Config.AGENT_NAME:
-                logger.info("✅ Ignoring message from AI agent itself")
+                logger.debug("Ignoring message from AI agent itself")
                 return
             
-            # DEBUG: Log the exact values for trigger comparison
-            logger.info(f"🎯 TRIGGER DEBUG:")
-            logger.info(f"   - Message text: '{message_text}'")
-            logger.info(f"   - AGENT_TRIGGER: '{Config.AGENT_TRIGGER}'")
-            logger.info(f"   - Message lower: '{message_text.lower()}'")
-            logger.info(f"   - Trigger lower: '{Config.AGENT_TRIGGER.lower()}'")
-            logger.info(f"   - Contains trigger: {Config.AGENT_TRIGGER.lower() in message_text.lower()}")
-            
-            # Check if agent is mentioned
+            # The raw bytes matched, but the trigger may sit in another field
             if Config.AGENT_TRIGGER.lower() not in message_text.lower():
-                logger.info(f"❌ Agent not mentioned, ignoring message from {username}")
+                logger.debug("Agent not mentioned in text, ignoring message from %s", username)
                 return
             
-            logger.info(f"✅ Agent mentioned! Processing message from {username}")
-            
             # Remove agent mention from message
-            cleaned_message = message_text.replace(Config.AGENT_TRIGGER, "").strip()
+            cleaned_message = strip_trigger(message_text)
             if not cleaned_message:
                 cleaned_message = "Hello"
             
-            logger.info(f"🧹 Cleaned message: '{cleaned_message}'")
+            logger.info(f"✅ Agent mentioned by {username}: '{cleaned_message}'")
             
-            # Get relevant context from memory
-            context = await self.memory.get_relevant_context(username, cleaned_message)
+            outcome = self.admission.submit(username, cleaned_message)
+            metrics.inc("agent_mentions_total", outcome=outcome)
+            if outcome in ("rate_limited", "dropped"):
+                logger.warning(f"🚦 Message from {username} {outcome.replace('_', ' ')} ({self.admission.stats()})")
+            else:
+                logger.info(f"📥 Message from {username} {outcome} (queue depth {self.admission.queue_depth})")
             
-            # Generate AI response
-            ai_response = await self.gemini.generate_response(
-                message=cleaned_message,
-                context=context,
-                username=username
-            )
+        except json.JSONDecodeError as e:
+            metrics.error("decode")
+            logger.error(f"❌ Failed to decode message JSON: {e}")
+            logger.error(f"❌ Raw message: {data}")
+        except Exception as e:
+            logger.error(f"❌ Error processing message: {e}")
+    
+    def handle_wire_hello(self, data: bytes, participant: rtc.RemoteParticipant = None):
+        """Record the wire version a participant announced"""
+        try:
+            hello = decode(data)
+            if participant and hello.get("type") == "hello":
+                self.peer_wire_versions[participant.identity] = int(hello.get("v", 0))
+                logger.debug(f"{participant.identity} speaks wire v{hello.get('v')}")
+        except Exception as e:
+            logger.debug(f"Ignoring malformed wire packet: {e}")
+    
+    def peers_support_batches(self) -> bool:
+        """Whether every participant in the room can unpack batch packets"""
+        participants = self.room.remote_participants if self.room else {}
+        return bool(participants) and all(
+            self.peer_wire_versions.get(identity, 0) >= 1 for identity in participants
+        )
+    
+    async def respond(self, username: str, cleaned_message: str):
+        """
+        Answer one admitted turn: retrieve context, generate, send and save
+        
+        Args:
+            username: User who mentioned the agent
+            cleaned_message: Their message(s) with the trigger removed
+        """
+        started = time.perf_counter()
+        try:
+            # Get relevant context from memory (usually already warmed on join)
+            with metrics.stage("retrieval"):
+                context = await self.memory.get_relevant_context(username, cleaned_message)
+            room_context = self.room_context(username, cleaned_message)
+            
+            # Generate AI response (bounded across all rooms in this process)
+            with metrics.stage("model_slot_wait"):
+                await model_call_slots().acquire()
+            try:
+                if Config.STREAM_RESPONSES:
+                    # Chunks are published to the room as they arrive
+                    ai_response = await self.stream_chat_message(
+                        self.gemini.stream_response(
+                            message=cleaned_message,
+                            context=context,
+                            username=username,
+                            room_context=room_context
+                        )
+                    )
+                else:
+                    ai_response = await self.gemini.generate_response(
+                        message=cleaned_message,
+                        context=context,
+                        username=username,
+                        room_context=room_context
+                    )
+            finally:
+                model_call_slots().release()
             
-            # Save the conversation to memory
+            # Send response to chat
+            if not Config.STREAM_RESPONSES:
+                await self.send_chat_message(ai_response)
+            self.record_reply(ai_response)
+            
+            # Queue the conversation for saving; persistence happens in the background
             await self.memory.save_conversation(
                 username=username,
                 user_message=cleaned_message,
@@ -145,15 +267,14 @@ class ChatAgent:
                 room_id=self.room.name if self.room else "unknown"
             )
             
-            # Send response to chat
-            await self.send_chat_message(ai_response)
+            # Keep this user's context fresh for their next message
+            self.memory.refresh_in_background(username, cleaned_message)
             
+            metrics.observe_stage("turn", time.perf_counter() - started)
             logger.info(f"✅ Sent response to {username}")
             
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Failed to decode message JSON: {e}")
-            logger.error(f"❌ Raw message: {data}")
         except Exception as e:
+            metrics.error("turn")
             logger.error(f"❌ Error processing message: {e}")
             # Send error message to chat
             try:
@@ -161,32 +282,152 @@ class ChatAgent:
             except:
                 pass
     
-    async def send_chat_message(self, message: str):
-        """Send a message to the chat room"""
+    async def respond_batch(self, turns: List[Tuple[str, str]]):
+        """
+        Answer several users' turns with one model call
+        
+        Args:
+            turns: (username, cleaned_message) pairs collected in the batch window
+        """
+        with metrics.stage("retrieval"):
+            contexts = await asyncio.gather(*(
+                self.memory.get_relevant_context(username, message) for username, message in turns
+            ))
+        requests = [
+            {"username": username, "message": message, "context": context}
+            for (username, message), context in zip(turns, contexts)
+        ]
+        
+        # The batch comes from one room, so everyone shares its recent chat
+        room_context = self.room_context(turns[0][0], " ".join(message for _, message in turns))
+        
+        async with model_call_slots():
+            replies = await self.gemini.generate_batch_responses(requests, room_context)
+        logger.info(f"📦 Answered {len(turns)} mentions with one model call")
+        
+        for request, reply in zip(requests, replies):
+            try:
+                # Anything the batch call could not answer falls back to a single call
+                if reply is None:
+                    async with model_call_slots():
+                        reply = await self.gemini.generate_response(
+                            message=request["message"],
+                            context=request["context"],
+                            username=request["username"],
+                            room_context=room_context
+                        )
+                
+                await self.send_chat_message(reply)
+                self.record_reply(reply)
+                await self.memory.save_conversation(
+                    username=request["username"],
+                    user_message=request["message"],
+                    ai_response=reply,
+                    room_id=self.room.name if self.room else "unknown"
+                )
+                self.memory.refresh_in_background(request["username"], request["message"])
+                
+            except Exception as e:
+                metrics.error("turn")
+                logger.error(f"❌ Error sending batched reply to {request['username']}: {e}")
+    
+    def room_context(self, username: str, message: str) -> str:
+        """
+        Recent room chat relevant to a turn, sliced from the in-memory transcript
+        
+        Args:
+            username: User being answered
+            message: Their message, used to pick out participants they name
+            
+        Returns:
+            "sender: text" lines, oldest first; empty if there is no transcript
+        """
+        if self.transcript is None:
+            return ""
+        
+        try:
+            with metrics.stage("room_context"):
+                return self.transcript.context_for(
+                    username,
+                    message,
+                    max_lines=Config.ROOM_TRANSCRIPT_LINES,
+                    max_chars=Config.ROOM_TRANSCRIPT_MAX_CHARS,
+                    max_age=Config.ROOM_TRANSCRIPT_MAX_AGE
+                )
+        except Exception as e:
+            logger.error(f"Error reading room transcript: {e}")
+            return ""
+    
+    def record_reply(self, reply: str):
+        """Add the agent's own reply to the transcript (it never comes back as a packet)"""
+        if self.transcript is not None and reply:
+            self.transcript.record_text(Config.AGENT_NAME, reply)
+    
+    async def stream_chat_message(self, chunks: AsyncIterator[str]) -> str:
+        """
+        Publish a reply incrementally as it is generated
+        
+        Every chunk is sent with the same message id and stream="delta" so the
+        frontend can append it to one bubble; a final stream="end" packet marks
+        the message complete.
+        
+        Args:
+            chunks: Async iterator of response text chunks
+            
+        Returns:
+            The full reply text
+        """
+        message_id = uuid.uuid4().hex
+        parts = []
+        
+        async for chunk in chunks:
+            parts.append(chunk)
+            await self.send_chat_message(chunk, message_id=message_id, stream="delta")
+        
+        await self.send_chat_message("", message_id=message_id, stream="end")
+        
+        return "".join(parts).strip()
+    
+    async def send_chat_message(self, message: str, message_id: Optional[str] = None, stream: Optional[str] = None):
+        """
+        Send a message to the chat room
+        
+        Args:
+            message: Message text (or a chunk of it when streaming)
+            message_id: Id shared by all chunks of a streamed message
+            stream: "delta" for a partial chunk, "end" to close a streamed message
+        """
         if not self.room:
             logger.error("Cannot send message: room not connected")
             return
         
         try:
-            # Create message data
+            # Create message data; the outbox splits, coalesces and publishes it
             chat_message = {
                 "text": message,
                 "timestamp": int(asyncio.get_event_loop().time() * 1000),
                 "sender": Config.AGENT_NAME,
                 "type": "ai"
             }
+            if message_id:
+                chat_message["id"] = message_id
+            if stream:
+                chat_message["stream"] = stream
             
-            # Send as data message
-            message_json = json.dumps(chat_message)
-            await self.room.local_participant.publish_data(
-                message_json.encode('utf-8'),
-                reliable=True
-            )
+            self.outbox.send(chat_message)
             
-            logger.info(f"📤 Sent message: {message[:100]}...")
+            if stream:
+                logger.debug(f"📤 Sent stream {stream} for {message_id}: {message[:100]}")
+            else:
+                logger.info(f"📤 Sent message: {message[:100]}...")
             
         except Exception as e:
+            metrics.error("publish")
             logger.error(f"Error sending chat message: {e}")
+    
+    async def publish_packet(self, payload: bytes):
+        """Publish one encoded packet to the room"""
+        await self.room.local_participant.publish_data(payload, reliable=True)
 
 # Agent entry point for LiveKit - this is the main entrypoint
 async def entrypoint(ctx: JobContext):
@@ -195,8 +436,18 @@ async def entrypoint(ctx: JobContext):
         # Validate configuration
         Config.validate()
         
-        # Create and start agent session
-        agent = ChatAgent()
+        # Expose this process's pipeline metrics (endpoint and/or log digest)
+        start_exporters()
+        
+        # Create and start agent session on the process-wide services
+        # (built by prewarm, or on first use if prewarm did not run)
+        agent = ChatAgent(ctx.proc.userdata.get("services"))
+        
+        # Persist queued conversations before the job exits; the shared
+        # clients stay open for the next room this process handles and are
+        # released when the process exits (see get_services)
+        ctx.add_shutdown_callback(agent.memory.flush)
+        
         await agent.start_session(ctx)
         
     except Exception as e:
@@ -13,9 +13,79 @@ class Config:
     # Gemini Configuration
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     GEMINI_MODEL = "gemini-2.5-flash"  # Updated to latest model
+    GEMINI_LIGHT_MODEL = os.getenv("GEMINI_LIGHT_MODEL", "gemini-2.5-flash-lite")  # Fast model for short chit-chat
+    MODEL_ROUTING = os.getenv("MODEL_ROUTING", "true").lower() == "true"  # Send simple turns to GEMINI_LIGHT_MODEL
+    ROUTER_LIGHT_MAX_WORDS = 12  # Longest message the light model answers
+    ROUTER_LIGHT_MAX_CONTEXT_TOKENS = 400  # Largest memory context plus room chat the light model is given
+    MODEL_PRICES = {  # USD per 1M (input, output) tokens, for per-route cost estimates
+        "gemini-2.5-flash": (0.30, 2.50),
+        "gemini-2.5-flash-lite": (0.10, 0.40)
+    }
+    STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"  # Publish replies chunk by chunk
+    RESPONSE_CACHE_ENABLED = True  # Reuse replies to common prompts (answered without user history) and exact repeats
+    RESPONSE_CACHE_SIZE = 2000
+    RESPONSE_CACHE_TTL = 600  # Seconds a cached reply is reused
+    RESPONSE_CACHE_NEAR_DUPLICATES = os.getenv("RESPONSE_CACHE_NEAR_DUPLICATES", "false").lower() == "true"
+    RESPONSE_CACHE_NEAR_DUPLICATE_THRESHOLD = 0.8  # Minimum word-set similarity for a near-duplicate hit
+    RESPONSE_CACHE_SHARED_PROMPTS = [  # Prompts answered the same for every user, without their history or the room chat
+        prompt.strip() for prompt in os.getenv(
+            "RESPONSE_CACHE_SHARED_PROMPTS",
+            "hello,hi,hey,help,what can you do,who are you,what are you"
+        ).split(",") if prompt.strip()
+    ]
+    PROMPT_CACHE_ENABLED = True  # Keep the system prompt in Gemini's context cache (once it is large enough to qualify)
+    PROMPT_CACHE_TTL = 3600  # Seconds a cached system prompt lives; extended in the background while in use
+    PROMPT_CACHE_MIN_TOKENS = 1024  # Smallest prompt the API accepts for caching (model dependent)
+    GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "20"))  # Seconds per attempt (per chunk when streaming)
+    GEMINI_MAX_RETRIES = 2  # Extra attempts after a 429/5xx, timeout or connection error
+    GEMINI_RETRY_BASE_DELAY = 0.25  # Seconds before the first retry, doubling with full jitter
+    GEMINI_RETRY_MAX_DELAY = 4.0  # Longest wait between attempts
+    GEMINI_HEDGING = os.getenv("GEMINI_HEDGING", "false").lower() == "true"  # Duplicate slow non-streaming calls (costs extra calls)
+    GEMINI_HEDGE_QUANTILE = 0.95  # Recent-latency quantile after which a call is hedged
+    GEMINI_HEDGE_MIN_DELAY = 1.0  # Seconds a call runs before it may be hedged
+    GEMINI_FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL")  # Cheaper model used while the circuit is open (unset fails fast)
+    GEMINI_BREAKER_ERROR_RATE = 0.5  # Failure fraction that opens the circuit
+    GEMINI_BREAKER_MIN_CALLS = 10  # Calls in the window before the circuit can open
+    GEMINI_BREAKER_WINDOW = 30  # Seconds of calls the error rate is measured over
+    GEMINI_BREAKER_COOLDOWN = 15  # Seconds the circuit stays open before a probe call
+    GEMINI_BREAKER_PROBE_TIMEOUT = 60  # Seconds before a probe that never reported back is given up on
     
     # Memory Configuration
     MEM0_API_KEY = os.getenv("MEM0_API_KEY")
+    MEM0_MAX_WORKERS = 4  # Concurrent mem0 calls per process
+    MEM0_SEARCH_TIMEOUT = 2.0  # Seconds before falling back to the local store
+    MEM0_SAVE_TIMEOUT = 10.0  # Seconds before giving up on a mem0 save
+    MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "memory_storage.db")
+    MEMORY_JSON_PATH = "memory_storage.json"  # Legacy store, migrated into MEMORY_DB_PATH once
+    MEMORY_SHARDS = int(os.getenv("MEMORY_SHARDS", "1"))  # SQLite files users are spread over (change it with memory_cli.py reshard)
+    MEMORY_BUSY_TIMEOUT = 10.0  # Seconds a write waits for another worker process's write
+    MEMORY_ARCHIVE_DIR = os.getenv("MEMORY_ARCHIVE_DIR", "memory_archive")  # Compressed segments of idle users' history
+    MEMORY_ARCHIVE_AFTER_DAYS = float(os.getenv("MEMORY_ARCHIVE_AFTER_DAYS", "30"))  # Idle days before history is archived (0 disables)
+    MEMORY_PURGE_AFTER_DAYS = float(os.getenv("MEMORY_PURGE_AFTER_DAYS", "0"))  # Days archived before history is deleted (0 keeps it)
+    MEMORY_SWEEP_INTERVAL = 3600  # Seconds between retention sweeps
+    MEMORY_ARCHIVE_SEGMENT_USERS = 200  # Users written per archive segment
+    MAX_CONVERSATIONS_PER_USER = int(os.getenv("MAX_CONVERSATIONS_PER_USER", "50"))
+    MEMORY_COMPACT_EVERY = 100  # Saves between compaction passes
+    CONTEXT_WINDOW_TURNS = 3  # Recent conversations included as context
+    CONTEXT_CACHE_SIZE = 1000  # Users whose context window is kept in memory
+    CONTEXT_CACHE_TTL = 300  # Seconds before a cached window is reloaded
+    LOCAL_SEMANTIC_SEARCH = True  # Rank older local turns by similarity (requires numpy)
+    LOCAL_INDEX_DIM = 256  # Hashed embedding size
+    LOCAL_SEARCH_TOP_K = 3  # Related older turns added to the context
+    LOCAL_SEARCH_MIN_SCORE = 0.2  # Minimum cosine similarity for a related turn
+    SUMMARIZE_HISTORY = True  # Fold older turns into a per-user running summary
+    SUMMARY_INTERVAL = 60  # Seconds between summary passes
+    SUMMARY_BATCH_USERS = 20  # Users summarized per pass
+    SUMMARY_KEEP_RECENT = 6  # Newest turns always kept verbatim
+    SUMMARY_MIN_TURNS = 4  # Unsummarized older turns needed before folding
+    SUMMARY_MAX_WORDS = 80  # Target length of a running summary
+    PREFETCH_QUERY = "What do I know about {username}?"  # mem0 query used to warm a joining user's context
+    WRITE_QUEUE_MAX_SIZE = 10000  # Pending saves before save_conversation applies backpressure
+    WRITE_BATCH_SIZE = 100  # Conversations persisted per batch
+    WRITE_BATCH_DELAY = 0.05  # Seconds the writer waits for a batch to fill
+    WRITE_MAX_RETRIES = 5  # Further attempts at a batch the local store rejected before it is dropped
+    WRITE_RETRY_BASE_DELAY = 0.5  # Backoff (seconds) before the first retry, doubling and jittered
+    WRITE_RETRY_MAX_DELAY = 10  # Longest backoff (seconds) between attempts at a failed batch
     
     # Supabase Configuration (optional)
     SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -24,7 +94,36 @@ class Config:
     # Agent Configuration
     AGENT_NAME = "AI Assistant"
     AGENT_TRIGGER = "@agent"  # Users must mention this to get responses
+    STARTUP_PROBE = os.getenv("AGENT_STARTUP_PROBE", "off").lower()  # Service check before registering: off, background or blocking
+    PREWARM_CLIENTS = True  # Import SDKs and create clients off the event loop as soon as a worker process starts
+    MAX_CONCURRENT_MODEL_CALLS = 16  # Gemini calls in flight per worker process, across rooms
+    ROOM_QUEUE_SIZE = 20  # Pending @agent turns per room before new ones are dropped
+    ROOM_WORKERS = 2  # Turns answered concurrently per room
+    USER_RATE_LIMIT = 0.5  # Turns per second a user may start
+    USER_RATE_BURST = 3  # Turns a user may start back to back
+    COALESCE_WINDOW = 0.15  # Seconds a turn waits for follow-up messages from the same user
+    MAX_COALESCED_MESSAGES = 5  # Messages one queued turn may collect
+    MAX_TURN_CHARS = 4000  # Characters one queued turn may collect
+    MICRO_BATCHING = os.getenv("MICRO_BATCHING", "false").lower() == "true"  # Answer concurrent mentions in one call
+    BATCH_WINDOW = 0.2  # Seconds to collect mentions for a batch
+    MAX_BATCH_SIZE = 8  # Mentions answered per batched call
     MAX_CONTEXT_LENGTH = 4000  # Characters to include from memory
+    CONTEXT_TOKEN_BUDGET = 1000  # Estimated tokens to include from memory
+    ROOM_TRANSCRIPT_SIZE = int(os.getenv("ROOM_TRANSCRIPT_SIZE", "200"))  # Recent room messages kept in memory (0 disables)
+    ROOM_TRANSCRIPT_MAX_BYTES = 2048  # Larger packets are trimmed before they are kept
+    ROOM_TRANSCRIPT_LINES = int(os.getenv("ROOM_TRANSCRIPT_LINES", "12"))  # Recent room messages added to a prompt
+    ROOM_TRANSCRIPT_MAX_CHARS = 1500  # Characters of room chat to include in a prompt
+    ROOM_TRANSCRIPT_MAX_AGE = 900  # Seconds before a room message is too old to include
+    
+    # Wire Configuration
+    WIRE_MAX_PACKET_BYTES = 14000  # Largest packet published (LiveKit reliable packets top out near 15KiB); longer replies are split
+    WIRE_COALESCE_WINDOW = 0.01  # Seconds outbound messages wait to be coalesced into one packet
+    
+    # Metrics Configuration
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Prometheus /metrics endpoint (0 disables)
+    METRICS_PORT_RANGE = 16  # Ports tried from METRICS_PORT on, one per job process
+    METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+    METRICS_LOG_INTERVAL = int(os.getenv("METRICS_LOG_INTERVAL", "60"))  # Seconds between metric digests in the log (0 disables)
     
     @classmethod
     def validate(cls):
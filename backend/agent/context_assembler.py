@@ -0,0 +1,99 @@
+import math
+import re
+from typing import Dict, List, Tuple
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local estimate of how many model tokens a text uses
+
+    Words count one token per ~4 characters and each punctuation mark counts
+    as one, which tracks SentencePiece-style tokenizers closely enough for
+    budgeting without calling the API.
+    """
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _PIECE_RE.findall(text))
+
+class ContextAssembler:
+    """
+    Packs ranked memory candidates into a fixed token and character budget.
+
+    Candidates are dicts with "section" (heading), "text", "score" and
+    "order" (position inside its section). The highest scoring candidates are
+    kept first; one that does not fit is truncated if enough budget remains,
+    otherwise dropped. Kept candidates are rendered grouped by section in
+    their original order.
+    """
+
+    def __init__(self, token_budget: int, char_budget: int, min_fragment_tokens: int = 32):
+        """
+        Args:
+            token_budget: Maximum estimated tokens of assembled context
+            char_budget: Maximum characters of assembled context
+            min_fragment_tokens: Smallest truncated candidate worth including
+        """
+        self.token_budget = token_budget
+        self.char_budget = char_budget
+        self.min_fragment_tokens = min_fragment_tokens
+
+    def assemble(self, candidates: List[Dict]) -> Tuple[str, Dict]:
+        """
+        Build the context string for a request
+
+        Args:
+            candidates: Memory candidates to choose from
+
+        Returns:
+            Tuple of (context text, stats dict with tokens, chars, kept, truncated and dropped counts)
+        """
+        # Section order follows first appearance in the candidate list
+        sections = {}
+        for candidate in candidates:
+            sections.setdefault(candidate["section"], len(sections))
+
+        tokens_left = self.token_budget
+        chars_left = self.char_budget
+        kept = []
+        truncated = 0
+        dropped = 0
+
+        for candidate in sorted(candidates, key=lambda c: c["score"], reverse=True):
+            # Every kept candidate may add a section heading and separators
+            overhead = len(candidate["section"]) + 4
+            text = candidate["text"]
+            tokens = estimate_tokens(text)
+
+            if tokens <= tokens_left and len(text) + overhead <= chars_left:
+                kept.append(candidate)
+            elif min(tokens_left, (chars_left - overhead) // 4) >= self.min_fragment_tokens:
+                max_chars = min(tokens_left * 4, chars_left - overhead) - 1
+                text = text[:max_chars].rstrip() + "…"
+                tokens = estimate_tokens(text)
+                # Punctuation-heavy text can estimate above 4 chars/token: shrink until it fits
+                while tokens > tokens_left:
+                    max_chars = int(max_chars * 0.9)
+                    text = text[:max_chars].rstrip() + "…"
+                    tokens = estimate_tokens(text)
+                kept.append({**candidate, "text": text})
+                truncated += 1
+            else:
+                dropped += 1
+                continue
+
+            tokens_left -= tokens
+            chars_left -= len(text) + overhead
+
+        grouped = {}
+        for candidate in sorted(kept, key=lambda c: (sections[c["section"]], c["order"])):
+            grouped.setdefault(candidate["section"], []).append(candidate["text"])
+
+        context = "\n\n".join(f"{section}:\n" + "\n".join(texts) for section, texts in grouped.items())
+
+        stats = {
+            "tokens": estimate_tokens(context) if context else 0,
+            "chars": len(context),
+            "kept": len(kept),
+            "truncated": truncated,
+            "dropped": dropped
+        }
+        return context, stats
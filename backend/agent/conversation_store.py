@@ -0,0 +1,1186 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional, Iterable, Iterator, Tuple
+import logging
+from .json_stream import iter_legacy_conversations
+
+if TYPE_CHECKING:
+    from .memory_archive import ColdArchive
+
+logger = logging.getLogger(__name__)
+
+_INSERT = (
+    "INSERT INTO conversations (username, user_message, ai_response, timestamp, room_id) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+_TOUCH = (
+    "INSERT INTO activity (username, last_active) VALUES (?, ?) "
+    "ON CONFLICT(username) DO UPDATE SET last_active = max(last_active, excluded.last_active)"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    user_message TEXT NOT NULL,
+    ai_response TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    room_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (username, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    username TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    through_id INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS activity (
+    username TEXT PRIMARY KEY,
+    last_active TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_activity_last_active ON activity (last_active);
+CREATE TABLE IF NOT EXISTS archived (
+    username TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    turns INTEGER NOT NULL,
+    first_seen TEXT,
+    last_seen TEXT,
+    archived_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_archived_segment ON archived (segment);
+"""
+
+def shard_for(username: str, shards: int) -> int:
+    """
+    Shard index for a user
+
+    Uses a fixed digest rather than hash(), which is salted per process and
+    would send the same user to different shards in different workers.
+    """
+    if shards <= 1:
+        return 0
+    digest = hashlib.blake2b(username.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+def shard_paths(db_path: str, shards: int) -> List[str]:
+    """Files of a sharded layout: memory_storage.db becomes memory_storage.0.db, memory_storage.1.db, ..."""
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}.{index}{ext or '.db'}" for index in range(shards)]
+
+def _holds_data(path: str) -> bool:
+    """Whether a store file has any conversations, summaries or archived users (never creates it)"""
+    if not os.path.exists(path):
+        return False
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for table in ("conversations", "summaries", "archived"):
+            try:
+                if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                    return True
+            except sqlite3.OperationalError:
+                continue  # Written before the table existed
+        return False
+    finally:
+        conn.close()
+
+def _stored_shards(db_path: str) -> int:
+    """Shard count recorded in the first shard file next to db_path, or 0 if there is none"""
+    first = shard_paths(db_path, 1)[0]
+    if not os.path.exists(first):
+        return 0
+    conn = sqlite3.connect(f"file:{first}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'shard'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return int(row[0].split("/")[1]) if row else 0
+
+class PartialWriteError(Exception):
+    """Some shards of a batch were written and others failed; `remaining` holds the unwritten turns"""
+
+    def __init__(self, remaining: List[Tuple[str, Dict]], error: Exception):
+        super().__init__(f"{len(remaining)} turns not written: {error}")
+        self.remaining = remaining
+
+class ConversationStore:
+    """
+    Append-only conversation log backed by SQLite in WAL mode.
+
+    Every turn is a single INSERT and lookups go through the (username, id)
+    index, so saving and reading a user's history costs the same no matter
+    how many users are stored. Rows beyond the per-user cap are removed by a
+    periodic compaction pass instead of on every write.
+
+    Several worker processes may open the same file. Readers never block in
+    WAL mode; writers take the database write lock up front (BEGIN
+    IMMEDIATE) and wait up to busy_timeout for it, so concurrent saves queue
+    instead of failing with "database is locked" or deadlocking on a
+    read-to-write upgrade.
+
+    Each user's last activity is tracked so long-idle users can be moved to
+    a ColdArchive (archive_idle) and brought back on their next visit
+    (rehydrate), keeping the database sized by active users.
+    """
+
+    def __init__(self, db_path: str, max_conversations: int = 50, compact_every: int = 100,
+                 busy_timeout: float = 10.0):
+        """
+        Open (or create) the store
+
+        Args:
+            db_path: Path to the SQLite database file
+            max_conversations: Conversations kept per user
+            compact_every: Number of appends between compaction passes
+            busy_timeout: Seconds to wait for another process's write to finish
+        """
+        self.db_path = db_path
+        self.max_conversations = max_conversations
+        self.compact_every = compact_every
+
+        self._lock = threading.Lock()
+        self._dirty_users = set()
+        self._appends_since_compact = 0
+
+        self._conn = sqlite3.connect(
+            db_path, timeout=busy_timeout, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        # Only takes effect for new files (or after a VACUUM): lets archiving give space back
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._backfill_activity_once()
+
+    def append(self, username: str, conversation: Dict):
+        """
+        Append one conversation turn for a user
+
+        Args:
+            username: User's username
+            conversation: Dict with user_message, ai_response, timestamp and room_id
+        """
+        self.append_many([(username, conversation)])
+
+    def append_many(self, items: List[Tuple[str, Dict]]):
+        """
+        Append several conversation turns in a single transaction
+
+        Args:
+            items: List of (username, conversation) pairs
+        """
+        if not items:
+            return
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    _INSERT,
+                    [
+                        (
+                            username,
+                            conversation["user_message"],
+                            conversation["ai_response"],
+                            conversation["timestamp"],
+                            conversation["room_id"],
+                        )
+                        for username, conversation in items
+                    ]
+                )
+                latest: Dict[str, str] = {}
+                for username, conversation in items:
+                    latest[username] = max(latest.get(username, ""), conversation["timestamp"])
+                self._conn.executemany(_TOUCH, list(latest.items()))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            self._dirty_users.update(username for username, _ in items)
+            self._appends_since_compact += len(items)
+
+            if self._appends_since_compact >= self.compact_every:
+                # The turns are committed; a failed trim is retried on a later append
+                # rather than raised, which would make the caller write them again
+                try:
+                    self._compact_locked(self._dirty_users)
+                    self._dirty_users = set()
+                    self._appends_since_compact = 0
+                except sqlite3.Error as e:
+                    logger.warning(f"Compaction after append failed, will retry: {e}")
+
+    def recent(self, username: str, limit: int) -> List[Dict]:
+        """
+        Get a user's most recent conversations, oldest first
+
+        Args:
+            username: User's username
+            limit: Maximum number of conversations to return
+
+        Returns:
+            List of conversation dicts
+        """
+        limit = min(limit, self.max_conversations)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_message, ai_response, timestamp, room_id FROM conversations "
+                "WHERE username = ? ORDER BY id DESC LIMIT ?",
+                (username, limit)
+            ).fetchall()
+
+        return [dict(row) for row in reversed(rows)]
+
+    def turns_after(self, username: str, after_id: int) -> List[Dict]:
+        """
+        Get a user's retained conversations newer than a row id, oldest first
+
+        Args:
+            username: User's username
+            after_id: Only rows with a larger id are returned
+
+        Returns:
+            List of conversation dicts including their "id"
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, user_message, ai_response, timestamp, room_id FROM conversations "
+                "WHERE username = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                (username, after_id, self.max_conversations)
+            ).fetchall()
+
+        return [dict(row) for row in reversed(rows)]
+
+    def latest_timestamp(self, username: str) -> Optional[str]:
+        """Timestamp of a user's newest stored turn, archived ones included, or None if there is none"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(latest) FROM (SELECT MAX(timestamp) AS latest FROM conversations WHERE username = ? "
+                "UNION ALL SELECT last_seen FROM archived WHERE username = ?)",
+                (username, username)
+            ).fetchone()
+        return row[0]
+
+    def get_summary(self, username: str) -> Optional[Dict]:
+        """
+        Get a user's running summary
+
+        Returns:
+            Dict with summary, through_id (last folded row) and updated_at, or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, through_id, updated_at FROM summaries WHERE username = ?",
+                (username,)
+            ).fetchone()
+
+        return dict(row) if row else None
+
+    def set_summary(self, username: str, summary: str, through_id: int, updated_at: str):
+        """
+        Store a user's running summary
+
+        A summary covering fewer turns than the stored one is ignored, so a
+        slower worker summarizing the same user cannot move it backwards.
+
+        Args:
+            username: User's username
+            summary: Summary text covering every turn up to through_id
+            through_id: Id of the newest conversation folded into the summary
+            updated_at: ISO timestamp of the update
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO summaries (username, summary, through_id, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET summary = excluded.summary, "
+                "through_id = excluded.through_id, updated_at = excluded.updated_at "
+                "WHERE excluded.through_id >= summaries.through_id",
+                (username, summary, through_id, updated_at)
+            )
+
+    def stats(self, username: str) -> Dict:
+        """
+        Get conversation count and first/last timestamps within the retained window
+
+        Args:
+            username: User's username
+
+        Returns:
+            Dict with total_conversations, first_seen and last_seen
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS total, MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen "
+                "FROM (SELECT timestamp FROM conversations WHERE username = ? ORDER BY id DESC LIMIT ?)",
+                (username, self.max_conversations)
+            ).fetchone()
+
+            if not row["total"]:
+                # Not rehydrated yet: answer from the archive record
+                archived = self._conn.execute(
+                    "SELECT MIN(turns, ?) AS total, first_seen, last_seen FROM archived WHERE username = ?",
+                    (self.max_conversations, username)
+                ).fetchone()
+                row = archived or row
+
+        return {
+            "total_conversations": row["total"],
+            "first_seen": row["first_seen"],
+            "last_seen": row["last_seen"]
+        }
+
+    def compact(self, usernames: Optional[Iterable[str]] = None) -> int:
+        """
+        Drop conversations beyond the per-user cap
+
+        Args:
+            usernames: Users to compact, or None for every user
+
+        Returns:
+            Number of rows deleted
+        """
+        with self._lock:
+            if usernames is None:
+                usernames = [row[0] for row in self._conn.execute("SELECT DISTINCT username FROM conversations")]
+            return self._compact_locked(usernames)
+
+    def _compact_locked(self, usernames: Iterable[str]) -> int:
+        """Delete rows older than the newest max_conversations for each user (lock held)"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = self._trim_users(usernames)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        if deleted:
+            logger.debug(f"Compacted {deleted} old conversations")
+        return deleted
+
+    def _trim_users(self, usernames: Iterable[str]) -> int:
+        """Delete rows beyond the per-user cap inside the caller's transaction"""
+        deleted = 0
+        for username in usernames:
+            cursor = self._conn.execute(
+                "DELETE FROM conversations WHERE username = ? AND id <= ("
+                "SELECT id FROM conversations WHERE username = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (username, username, self.max_conversations)
+            )
+            deleted += cursor.rowcount
+        return deleted
+
+    def _backfill_activity_once(self):
+        """Give users stored before activity tracking existed their last turn as last activity"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = self._conn.execute("SELECT 1 FROM meta WHERE key = 'activity_backfilled'").fetchone()
+            if not done:
+                self._backfill_activity()
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('activity_backfilled', '1')")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _backfill_activity(self):
+        """Add missing activity rows from stored turns, inside the caller's transaction"""
+        self._conn.execute(
+            "INSERT OR IGNORE INTO activity (username, last_active) "
+            "SELECT username, MAX(timestamp) FROM conversations GROUP BY username"
+        )
+
+    def archive_idle(self, archive: "ColdArchive", idle_before: str, limit: int = 200) -> Tuple[int, int]:
+        """
+        Move up to `limit` users idle since before idle_before into one archive segment
+
+        The segment is written first; the database then drops the users'
+        rows in one transaction, re-checking that each is still idle, so a
+        user who came back meanwhile (here or in another worker) keeps
+        their history in place. Running turn ids are kept so rolling
+        summaries still line up after rehydration.
+
+        Args:
+            archive: Destination for the history
+            idle_before: ISO timestamp; users last active earlier are archived
+            limit: Users per segment
+
+        Returns:
+            (users selected, users archived)
+        """
+        with self._lock:
+            usernames = [row[0] for row in self._conn.execute(
+                "SELECT username FROM activity WHERE last_active < ? ORDER BY last_active LIMIT ?",
+                (idle_before, limit)
+            )]
+            users = []
+            for username in usernames:
+                rows = self._conn.execute(
+                    "SELECT id, user_message, ai_response, timestamp, room_id FROM conversations "
+                    "WHERE username = ? ORDER BY id",
+                    (username,)
+                ).fetchall()
+                users.append((username, [dict(row) for row in rows]))
+
+        if not usernames:
+            return 0, 0
+
+        segment, entries = archive.write_segment(users)
+        turns_by_user = dict(users)
+        archived_at = datetime.now().isoformat()
+        archived = 0
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for username, offset, length in entries:
+                    turns = turns_by_user[username]
+                    max_id = turns[-1]["id"] if turns else 0
+                    still_idle = self._conn.execute(
+                        "SELECT 1 FROM activity WHERE username = ? AND last_active < ?",
+                        (username, idle_before)
+                    ).fetchone()
+                    newer = self._conn.execute(
+                        "SELECT 1 FROM conversations WHERE username = ? AND id > ? LIMIT 1",
+                        (username, max_id)
+                    ).fetchone()
+                    already = self._conn.execute(
+                        "SELECT 1 FROM archived WHERE username = ?", (username,)
+                    ).fetchone()
+                    if not still_idle or newer or already:
+                        continue
+
+                    self._conn.execute(
+                        "INSERT INTO archived (username, segment, offset, length, turns, first_seen, last_seen, archived_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            username, segment, offset, length, len(turns),
+                            turns[0]["timestamp"] if turns else None,
+                            turns[-1]["timestamp"] if turns else None,
+                            archived_at
+                        )
+                    )
+                    self._conn.execute(
+                        "DELETE FROM conversations WHERE username = ? AND id <= ?", (username, max_id)
+                    )
+                    self._conn.execute("DELETE FROM activity WHERE username = ?", (username,))
+                    archived += 1
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                archive.delete(segment)
+                raise
+
+        if not archived:
+            archive.delete(segment)
+        else:
+            logger.info(f"Archived {archived} idle users to {segment}")
+        return len(usernames), archived
+
+    def rehydrate(self, username: str, archive: "ColdArchive") -> int:
+        """
+        Bring an archived user's history back into the store
+
+        Cheap when the user is not archived (one primary-key lookup), so it
+        can run on every cache miss. Safe to race with other workers: only
+        the one that still finds the archive record inserts the turns.
+
+        Args:
+            username: User's username
+            archive: Where the history was archived
+
+        Returns:
+            Number of turns restored
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT segment, offset, length FROM archived WHERE username = ?", (username,)
+            ).fetchone()
+        if not row:
+            return 0
+
+        turns = archive.read(row["segment"], row["offset"], row["length"])
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not self._conn.execute("SELECT 1 FROM archived WHERE username = ?", (username,)).fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return 0
+
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO conversations (id, username, user_message, ai_response, timestamp, room_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (turn["id"], username, turn["user_message"], turn["ai_response"], turn["timestamp"], turn["room_id"])
+                        for turn in turns
+                    ]
+                )
+                self._conn.execute("DELETE FROM archived WHERE username = ?", (username,))
+                self._conn.execute(_TOUCH, (username, datetime.now().isoformat()))
+                self._trim_users([username])
+                remaining = self._conn.execute(
+                    "SELECT 1 FROM archived WHERE segment = ? LIMIT 1", (row["segment"],)
+                ).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if not remaining:
+            archive.delete(row["segment"])
+        return len(turns)
+
+    def purge_archive(self, archive: "ColdArchive", archived_before: str) -> int:
+        """
+        Forget users archived before a cutoff, with their summaries
+
+        Returns:
+            Number of users purged
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT username, segment FROM archived WHERE archived_at < ?", (archived_before,)
+                ).fetchall()
+                self._conn.executemany(
+                    "DELETE FROM archived WHERE username = ?", [(row["username"],) for row in rows]
+                )
+                self._conn.executemany(
+                    "DELETE FROM summaries WHERE username = ?", [(row["username"],) for row in rows]
+                )
+                empty = [
+                    segment for segment in {row["segment"] for row in rows}
+                    if not self._conn.execute("SELECT 1 FROM archived WHERE segment = ? LIMIT 1", (segment,)).fetchone()
+                ]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        for segment in empty:
+            archive.delete(segment)
+        return len(rows)
+
+    def release_space(self):
+        """Return free pages to the filesystem (files created with incremental auto-vacuum)"""
+        with self._lock:
+            self._conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+    def dedupe(self) -> int:
+        """
+        Delete repeated turns, keeping the first copy
+
+        Turns are duplicates when user, timestamp and both messages match
+        (typically from importing the same export twice). SQLite groups on
+        disk, so this runs in bounded memory on any size of store.
+
+        Returns:
+            Number of rows deleted
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = self._conn.execute(
+                    "DELETE FROM conversations WHERE id NOT IN ("
+                    "SELECT MIN(id) FROM conversations "
+                    "GROUP BY username, timestamp, user_message, ai_response)"
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def vacuum(self):
+        """Rebuild the database file to return space freed by deletes"""
+        with self._lock:
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def iter_conversations(self, page_size: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        """
+        Stream every stored turn, grouped by user and oldest first within a user
+
+        Reads one page at a time by (username, id), without holding the lock
+        or a read transaction between pages, so live workers keep writing.
+
+        Args:
+            page_size: Rows fetched per query
+
+        Yields:
+            (username, conversation dict) pairs
+        """
+        last = ("", 0)
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, username, user_message, ai_response, timestamp, room_id FROM conversations "
+                    "WHERE (username, id) > (?, ?) ORDER BY username, id LIMIT ?",
+                    (*last, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                conversation = dict(row)
+                del conversation["id"], conversation["username"]
+                yield row["username"], conversation
+            last = (rows[-1]["username"], rows[-1]["id"])
+
+    def check_shard(self, index: int, shards: int, unsharded_path: Optional[str] = None):
+        """
+        Record this file's place in a sharded layout, refusing a different one
+
+        Users are assigned to shards by hash, so reopening the files with a
+        different shard count would hide every user that moved. The
+        unsharded file is layout 0/1. Switching between it and shard files
+        (MEMORY_SHARDS changed from or to 1) is refused too while the files
+        being left behind hold data; `memory_cli.py reshard` moves it.
+
+        Args:
+            index: This file's shard index
+            shards: Total number of shards
+            unsharded_path: For shard files, the unsharded file they replace
+
+        Raises:
+            ValueError: If the file was created for a different layout, or
+                the other layout's files still hold data
+        """
+        layout = f"{index}/{shards}"
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('shard', ?)", (layout,))
+            stored = self._conn.execute("SELECT value FROM meta WHERE key = 'shard'").fetchone()[0]
+        if stored != layout:
+            raise ValueError(f"{self.db_path} is shard {stored}, not {layout}; MEMORY_SHARDS was changed")
+
+        if shards == 1:
+            left_behind = [path for path in shard_paths(self.db_path, _stored_shards(self.db_path)) if _holds_data(path)]
+        else:
+            left_behind = [unsharded_path] if unsharded_path and _holds_data(unsharded_path) else []
+        if left_behind:
+            raise ValueError(
+                f"Conversations are still stored in {', '.join(left_behind)} but MEMORY_SHARDS={shards}; "
+                f"run `python memory_cli.py reshard` with the new MEMORY_SHARDS to move them first"
+            )
+
+    def set_shard(self, index: int, shards: int):
+        """Overwrite this file's recorded layout (only for reshard, on files holding no data)"""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('shard', ?)", (f"{index}/{shards}",))
+
+    def has_archived(self) -> bool:
+        """Whether any user's history is in the cold archive"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM archived LIMIT 1").fetchone() is not None
+
+    def checkpoint(self):
+        """Fold the write-ahead log into the database file"""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def usernames(self, page_size: int = 1000) -> Iterator[str]:
+        """Every user with turns, a summary, an activity record or an archived history"""
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT username FROM (SELECT username FROM conversations UNION SELECT username FROM summaries "
+                    "UNION SELECT username FROM activity UNION SELECT username FROM archived) "
+                    "WHERE username > ? ORDER BY username LIMIT ?",
+                    (last, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
+            last = rows[-1][0]
+
+    def export_user(self, username: str) -> Dict:
+        """
+        A user's stored state, for moving them to another file
+
+        Returns:
+            Dict with "turns" (including ids, oldest first), "summary" (or None)
+            and "last_active" (or None)
+        """
+        with self._lock:
+            turns = [dict(row) for row in self._conn.execute(
+                "SELECT id, user_message, ai_response, timestamp, room_id FROM conversations "
+                "WHERE username = ? ORDER BY id",
+                (username,)
+            )]
+            activity = self._conn.execute(
+                "SELECT last_active FROM activity WHERE username = ?", (username,)
+            ).fetchone()
+        return {
+            "turns": turns,
+            "summary": self.get_summary(username),
+            "last_active": activity[0] if activity else None
+        }
+
+    def import_user(self, username: str, record: Dict):
+        """
+        Add a user exported from another file, in one transaction
+
+        Turns get new ids in this file; the summary's through_id is moved to
+        the new id of the last turn it covered, so it still lines up.
+
+        Args:
+            username: User's username
+            record: What export_user returned
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                through_id = 0
+                summary = record["summary"]
+                for turn in record["turns"]:
+                    new_id = self._conn.execute(
+                        _INSERT,
+                        (username, turn["user_message"], turn["ai_response"], turn["timestamp"], turn["room_id"])
+                    ).lastrowid
+                    if summary and turn["id"] <= summary["through_id"]:
+                        through_id = new_id
+                if summary:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO summaries (username, summary, through_id, updated_at) VALUES (?, ?, ?, ?)",
+                        (username, summary["summary"], through_id, summary["updated_at"])
+                    )
+                if record["last_active"]:
+                    self._conn.execute(_TOUCH, (username, record["last_active"]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def migrate_from_json(self, json_path: str, owns: Optional[Callable[[str], bool]] = None,
+                          batch_size: int = 1000, stale_after: float = 60.0, poll_interval: float = 0.5) -> int:
+        """
+        One-shot import of the legacy memory_storage.json file
+
+        The import is recorded in the meta table so it only ever runs once,
+        and the source file is left untouched. One worker claims the import
+        and commits it a batch at a time, recording how far into the file it
+        got, so other workers' writes wait for one batch at most. Those
+        workers wait here until the import is done, and take it over from
+        the recorded position if the claim goes stale (its worker died).
+        The file is stream-parsed, so its size does not bound memory.
+
+        Args:
+            json_path: Path to the legacy JSON storage file
+            owns: Imports only the users this returns True for (used by shards)
+            batch_size: Source conversations per committed batch
+            stale_after: Seconds without progress after which a claim is taken over
+            poll_interval: Seconds between checks while another worker imports
+
+        Returns:
+            Number of conversations imported by this call
+        """
+        if not os.path.exists(json_path):
+            return 0
+
+        claim = f"{os.getpid()}:{id(self)}"
+        with self._lock:
+            while True:
+                progress = self._claim_migration(claim, stale_after)
+                if progress is not None:
+                    break
+                if self._migration_done():
+                    return 0
+                time.sleep(poll_interval)
+
+            position, imported = progress
+            if position:
+                logger.info(f"Resuming JSON migration at conversation {position}")
+
+            rows = []
+            seen = 0
+            for username, conv in iter_legacy_conversations(json_path):
+                seen += 1
+                if seen <= position:
+                    continue
+                if owns is None or owns(username):
+                    rows.append((
+                        username,
+                        conv.get("user_message", ""),
+                        conv.get("ai_response", ""),
+                        conv.get("timestamp", ""),
+                        conv.get("room_id", "default"),
+                    ))
+                if seen - position >= batch_size:
+                    imported += self._migrate_batch(claim, rows, seen, imported)
+                    position, rows = seen, []
+            imported += self._migrate_batch(claim, rows, seen, imported, done=json_path)
+
+        logger.info(f"Migrated {imported} conversations from {json_path}")
+        return imported
+
+    def _migration_done(self) -> bool:
+        """Whether the legacy JSON import has completed"""
+        return self._conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone() is not None
+
+    def _claim_migration(self, claim: str, stale_after: float) -> Optional[Tuple[int, int]]:
+        """
+        Take the JSON import unless it is done or another worker is making progress on it
+
+        Returns:
+            (source position, conversations imported so far) to resume from, or None
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._migration_done():
+                self._conn.execute("COMMIT")
+                return None
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'migrating_from_json'").fetchone()
+            position, imported = 0, 0
+            if row:
+                owner, heartbeat, position, imported = row[0].split()
+                position, imported = int(position), int(imported)
+                if time.time() - float(heartbeat) < stale_after:
+                    self._conn.execute("COMMIT")
+                    return None
+                logger.warning(f"JSON migration by {owner} stalled, taking it over")
+            self._write_migration_marker(claim, position, imported)
+            self._conn.execute("COMMIT")
+            return position, imported
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _write_migration_marker(self, claim: str, position: int, imported: int):
+        """Record the import's owner and progress, inside the caller's transaction"""
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('migrating_from_json', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (f"{claim} {time.time()} {position} {imported}",)
+        )
+
+    def _migrate_batch(self, claim: str, rows: List[tuple], position: int, imported: int,
+                       done: Optional[str] = None) -> int:
+        """
+        Commit one batch of the JSON import with its progress marker
+
+        Args:
+            claim: This worker's claim on the import
+            rows: Conversation rows to insert
+            position: Source conversations consumed once this batch is in
+            imported: Conversations imported before this batch
+            done: The source path, when this is the last batch
+
+        Returns:
+            Conversations this batch added (after trimming to the per-user cap)
+
+        Raises:
+            RuntimeError: If another worker took the import over meanwhile
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'migrating_from_json'").fetchone()
+            if not row or row[0].split()[0] != claim:
+                raise RuntimeError("JSON migration was taken over by another worker")
+
+            self._conn.executemany(_INSERT, rows)
+            # Keep only each user's newest turns, as the old importer did
+            added = len(rows) - self._trim_users({row[0] for row in rows})
+
+            if done is None:
+                self._write_migration_marker(claim, position, imported + added)
+            else:
+                self._backfill_activity()
+                self._conn.execute("DELETE FROM meta WHERE key = 'migrating_from_json'")
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                    (os.path.abspath(done),)
+                )
+            self._conn.execute("COMMIT")
+            return added
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+class ShardedConversationStore:
+    """
+    ConversationStore split across several SQLite files by username.
+
+    SQLite admits one writer per database at a time, so with many worker
+    processes a single file becomes the write bottleneck. Each user lives
+    in exactly one shard (see shard_for), which keeps per-user reads and
+    writes on a single file while saves for different users proceed in
+    parallel. Shard files sit next to db_path: memory_storage.db becomes
+    memory_storage.0.db, memory_storage.1.db, ...
+    """
+
+    def __init__(self, db_path: str, shards: int, max_conversations: int = 50, compact_every: int = 100,
+                 busy_timeout: float = 10.0, check_layout: bool = True):
+        """
+        Open (or create) every shard
+
+        Args:
+            db_path: Base path; the shard index is inserted before the extension
+            shards: Number of shard files
+            max_conversations: Conversations kept per user
+            compact_every: Number of appends between compaction passes, per shard
+            busy_timeout: Seconds to wait for another process's write to finish
+            check_layout: Refuse a changed layout (only reshard() opens files without it)
+
+        Raises:
+            ValueError: If existing shard files were created with a different
+                count, or the unsharded file still holds conversations
+        """
+        self.db_path = db_path
+        self.max_conversations = max_conversations
+        self.shards = [
+            ConversationStore(path, max_conversations, compact_every, busy_timeout)
+            for path in shard_paths(db_path, shards)
+        ]
+        if check_layout:
+            for index, shard in enumerate(self.shards):
+                shard.check_shard(index, shards, unsharded_path=db_path if index == 0 else None)
+
+    def _shard(self, username: str) -> ConversationStore:
+        return self.shards[shard_for(username, len(self.shards))]
+
+    def append(self, username: str, conversation: Dict):
+        """Append one conversation turn for a user"""
+        self._shard(username).append(username, conversation)
+
+    def append_many(self, items: List[Tuple[str, Dict]]):
+        """
+        Append several conversation turns, one transaction per shard touched
+
+        Args:
+            items: List of (username, conversation) pairs
+
+        Raises:
+            PartialWriteError: If a shard failed; the other shards' turns are written
+        """
+        by_shard: Dict[int, List[Tuple[str, Dict]]] = {}
+        for username, conversation in items:
+            by_shard.setdefault(shard_for(username, len(self.shards)), []).append((username, conversation))
+
+        remaining: List[Tuple[str, Dict]] = []
+        error = None
+        for index, shard_items in by_shard.items():
+            try:
+                self.shards[index].append_many(shard_items)
+            except Exception as e:
+                remaining.extend(shard_items)
+                error = e
+        if remaining:
+            raise PartialWriteError(remaining, error)
+
+    def recent(self, username: str, limit: int) -> List[Dict]:
+        """Get a user's most recent conversations, oldest first"""
+        return self._shard(username).recent(username, limit)
+
+    def turns_after(self, username: str, after_id: int) -> List[Dict]:
+        """Get a user's retained conversations newer than a row id (ids are per shard)"""
+        return self._shard(username).turns_after(username, after_id)
+
+    def latest_timestamp(self, username: str) -> Optional[str]:
+        """Timestamp of a user's newest stored turn, archived ones included, or None if there is none"""
+        return self._shard(username).latest_timestamp(username)
+
+    def get_summary(self, username: str) -> Optional[Dict]:
+        """Get a user's running summary"""
+        return self._shard(username).get_summary(username)
+
+    def set_summary(self, username: str, summary: str, through_id: int, updated_at: str):
+        """Store a user's running summary"""
+        self._shard(username).set_summary(username, summary, through_id, updated_at)
+
+    def stats(self, username: str) -> Dict:
+        """Get conversation count and first/last timestamps within the retained window"""
+        return self._shard(username).stats(username)
+
+    def compact(self, usernames: Optional[Iterable[str]] = None) -> int:
+        """
+        Drop conversations beyond the per-user cap
+
+        Args:
+            usernames: Users to compact, or None for every user
+
+        Returns:
+            Number of rows deleted
+        """
+        if usernames is None:
+            return sum(shard.compact() for shard in self.shards)
+
+        by_shard: Dict[int, List[str]] = {}
+        for username in usernames:
+            by_shard.setdefault(shard_for(username, len(self.shards)), []).append(username)
+        return sum(self.shards[index].compact(names) for index, names in by_shard.items())
+
+    def archive_idle(self, archive: "ColdArchive", idle_before: str, limit: int = 200) -> Tuple[int, int]:
+        """Archive idle users, one segment per shard (limit applies per shard)"""
+        selected = archived = 0
+        for shard in self.shards:
+            shard_selected, shard_archived = shard.archive_idle(archive, idle_before, limit)
+            selected += shard_selected
+            archived += shard_archived
+        return selected, archived
+
+    def rehydrate(self, username: str, archive: "ColdArchive") -> int:
+        """Bring an archived user's history back into their shard"""
+        return self._shard(username).rehydrate(username, archive)
+
+    def purge_archive(self, archive: "ColdArchive", archived_before: str) -> int:
+        """Forget users archived before a cutoff in every shard"""
+        return sum(shard.purge_archive(archive, archived_before) for shard in self.shards)
+
+    def release_space(self):
+        """Return free pages to the filesystem in every shard"""
+        for shard in self.shards:
+            shard.release_space()
+
+    def dedupe(self) -> int:
+        """Delete repeated turns in every shard"""
+        return sum(shard.dedupe() for shard in self.shards)
+
+    def vacuum(self):
+        """Rebuild every shard file"""
+        for shard in self.shards:
+            shard.vacuum()
+
+    def iter_conversations(self, page_size: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        """Stream every stored turn, shard by shard (a user's turns stay together)"""
+        for shard in self.shards:
+            yield from shard.iter_conversations(page_size)
+
+    def import_user(self, username: str, record: Dict):
+        """Add a user exported from another file to their shard"""
+        self._shard(username).import_user(username, record)
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        One-shot import of the legacy JSON file, each shard taking its own users
+
+        Returns:
+            Number of conversations imported
+        """
+        shards = len(self.shards)
+        return sum(
+            shard.migrate_from_json(json_path, owns=lambda username, index=index: shard_for(username, shards) == index)
+            for index, shard in enumerate(self.shards)
+        )
+
+    def close(self):
+        """Close every shard"""
+        for shard in self.shards:
+            shard.close()
+
+def open_conversation_store(db_path: str, shards: int = 1, **kwargs):
+    """
+    Open the conversation store, sharded when shards > 1
+
+    Args:
+        db_path: Database path (the base path when sharded)
+        shards: Number of shard files
+        **kwargs: max_conversations, compact_every, busy_timeout
+
+    Returns:
+        A ConversationStore or ShardedConversationStore
+    """
+    if shards > 1:
+        return ShardedConversationStore(db_path, shards, **kwargs)
+    store = ConversationStore(db_path, **kwargs)
+    try:
+        store.check_shard(0, 1)
+    except ValueError:
+        store.close()
+        raise
+    return store
+
+def reshard(db_path: str, shards: int, archive: Optional["ColdArchive"] = None,
+            suffix: str = ".pre-reshard", **kwargs) -> int:
+    """
+    Move every user between the unsharded file and `shards` shard files
+
+    Works in either direction (1 -> N or N -> 1; N -> M goes through 1).
+    Archived users are rehydrated on the way, since their archived turn ids
+    belong to the old file. Every worker must be stopped. The old files are
+    only renamed (with `suffix`) once everything has been copied, so an
+    interrupted run is retried by deleting the new files and running again.
+
+    Args:
+        db_path: MEMORY_DB_PATH
+        shards: The new MEMORY_SHARDS
+        archive: Cold archive holding the old files' archived users
+        suffix: Appended to the old files' names when they are retired
+        **kwargs: max_conversations, compact_every, busy_timeout
+
+    Returns:
+        Number of users moved
+
+    Raises:
+        ValueError: If there is nothing to move, the new files already hold
+            data, or archived users exist and no archive was given
+    """
+    if shards > 1:
+        sources = [db_path] if _holds_data(db_path) else []
+        targets = shard_paths(db_path, shards)
+    else:
+        old = _stored_shards(db_path)
+        sources = [path for path in shard_paths(db_path, old) if _holds_data(path)] if old > 1 else []
+        targets = [db_path]
+    if not sources:
+        raise ValueError(f"Nothing to move: the store is already laid out for MEMORY_SHARDS={shards}")
+    occupied = [path for path in targets if _holds_data(path)]
+    if occupied:
+        raise ValueError(f"{', '.join(occupied)} already hold data; move them aside before resharding")
+
+    opened = [ConversationStore(path, **kwargs) for path in sources]
+    try:
+        if not archive and any(source.has_archived() for source in opened):
+            raise ValueError("The store has archived users; pass the cold archive so they can be moved")
+
+        if shards > 1:
+            target = ShardedConversationStore(db_path, shards, check_layout=False, **kwargs)
+            for index, shard in enumerate(target.shards):
+                shard.set_shard(index, shards)
+        else:
+            target = ConversationStore(db_path, **kwargs)
+            target.set_shard(0, 1)
+
+        moved = 0
+        try:
+            for source in opened:
+                for username in source.usernames():
+                    if archive:
+                        source.rehydrate(username, archive)
+                    target.import_user(username, source.export_user(username))
+                    moved += 1
+                    if moved % 10_000 == 0:
+                        logger.info(f"Moved {moved} users...")
+                source.checkpoint()
+        finally:
+            target.close()
+    finally:
+        for source in opened:
+            source.close()
+
+    for path in sources:
+        for extra in ("", "-wal", "-shm"):
+            if os.path.exists(path + extra):
+                os.replace(path + extra, path + suffix + extra)
+    logger.info(f"Moved {moved} users into {len(targets)} file(s); old files kept with suffix {suffix}")
+    return moved
@@ -1,19 +1,91 @@
-from google import genai
-from google.genai import types
-from typing import Optional
+from typing import Optional, AsyncIterator, List, Dict, Tuple, TYPE_CHECKING
+import inspect
+import json
 import logging
+import threading
+import time
 from .config import Config
+from .context_assembler import estimate_tokens
+from .metrics import metrics
+from .model_router import ModelRouter, Route
+from .prompt_cache import PromptCache
+from .resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+from .response_cache import ResponseCache
+
+if TYPE_CHECKING:
+    from google.genai import types
 
 logger = logging.getLogger(__name__)
 
+# Errors meaning a cached_content reference is no longer usable
+_STALE_CACHE_STATUS_CODES = {400, 403, 404}
+
+# Structured output for batched replies: [{"index": int, "reply": str}, ...]
+_BATCH_REPLY_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "index": {"type": "INTEGER"},
+            "reply": {"type": "STRING"}
+        },
+        "required": ["index", "reply"]
+    }
+}
+
 class GeminiService:
     def __init__(self):
-        """Initialize Gemini API client"""
-        self.client = genai.Client(api_key=Config.GEMINI_API_KEY)
+        """Initialize Gemini service (the SDK is imported and the client created on first use)"""
+        self._client = None
+        self._client_lock = threading.Lock()
         self.model_name = Config.GEMINI_MODEL
         
-        # System prompt for the AI agent
-        self.system_prompt = """You are a helpful AI assistant in a group chat. 
+        # Simple turns go to the light model, everything else to GEMINI_MODEL
+        self.router = ModelRouter(
+            Config.GEMINI_LIGHT_MODEL,
+            self.model_name,
+            enabled=Config.MODEL_ROUTING,
+            light_max_words=Config.ROUTER_LIGHT_MAX_WORDS,
+            light_max_context_tokens=Config.ROUTER_LIGHT_MAX_CONTEXT_TOKENS,
+            prices=Config.MODEL_PRICES
+        )
+        
+        # Deadlines, retries, hedging and the circuit breaker for every model call
+        self.resilience = ResilientCaller(
+            "gemini",
+            self.model_name,
+            timeout=Config.GEMINI_TIMEOUT,
+            max_retries=Config.GEMINI_MAX_RETRIES,
+            retry_base_delay=Config.GEMINI_RETRY_BASE_DELAY,
+            retry_max_delay=Config.GEMINI_RETRY_MAX_DELAY,
+            hedging=Config.GEMINI_HEDGING,
+            hedge_quantile=Config.GEMINI_HEDGE_QUANTILE,
+            hedge_min_delay=Config.GEMINI_HEDGE_MIN_DELAY,
+            breaker=CircuitBreaker(
+                "gemini",
+                error_rate=Config.GEMINI_BREAKER_ERROR_RATE,
+                min_calls=Config.GEMINI_BREAKER_MIN_CALLS,
+                window=Config.GEMINI_BREAKER_WINDOW,
+                cooldown=Config.GEMINI_BREAKER_COOLDOWN,
+                probe_timeout=Config.GEMINI_BREAKER_PROBE_TIMEOUT
+            ),
+            fallback_model=Config.GEMINI_FALLBACK_MODEL
+        )
+        metrics.add_collector(self.resilience.collect_metrics)
+        
+        # Replies to repeated prompts are served from memory
+        self.response_cache = None
+        if Config.RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                max_size=Config.RESPONSE_CACHE_SIZE,
+                ttl=Config.RESPONSE_CACHE_TTL,
+                near_duplicates=Config.RESPONSE_CACHE_NEAR_DUPLICATES,
+                near_duplicate_threshold=Config.RESPONSE_CACHE_NEAR_DUPLICATE_THRESHOLD,
+                shared_prompts=Config.RESPONSE_CACHE_SHARED_PROMPTS
+            )
+        
+        # System prompt for the AI agent, sent as the system instruction
+        self.system_prompt = inspect.cleandoc("""You are a helpful AI assistant in a group chat. 
         You have access to conversation history and user context from previous interactions.
         
         Key guidelines:
@@ -23,9 +95,33 @@ class GeminiService:
         - If you remember something about the user, mention it naturally
         - Be helpful but not overly verbose in group settings
         
-        Current conversation context will be provided below."""
+        Each message may come with context remembered from earlier conversations and the
+        recent messages other people sent in the room, so you can follow the group conversation.""")
+        
+        # The fixed system instruction is kept in Gemini's context cache when it is large enough
+        self.prompt_cache = PromptCache(
+            lambda: self.client,
+            self.system_prompt,
+            ttl=Config.PROMPT_CACHE_TTL,
+            min_tokens=Config.PROMPT_CACHE_MIN_TOKENS,
+            enabled=Config.PROMPT_CACHE_ENABLED
+        )
+        metrics.add_collector(self.prompt_cache.collect_metrics)
+    
+    @property
+    def client(self):
+        """The genai client; importing the SDK takes around a second, so it is deferred until needed"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    from google import genai
+                    self._client = genai.Client(api_key=Config.GEMINI_API_KEY)
+                    logger.info(f"Gemini client ready in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return self._client
     
-    async def generate_response(self, message: str, context: str = "", username: str = "") -> str:
+    async def generate_response(self, message: str, context: str = "", username: str = "",
+                                room_context: str = "") -> str:
         """
         Generate AI response using Gemini
         
@@ -33,63 +129,375 @@ class GeminiService:
             message: User's current message
             context: Relevant conversation history/context
             username: Username of the person sending the message
+            room_context: Recent messages from the room, oldest first
             
         Returns:
             AI-generated response
         """
+        if self._is_shared_prompt(message):
+            # One reply serves every user, so it must not draw on this user's
+            # memories or the room's chat
+            context, room_context = "", ""
+        cached = self._cached_reply(message, context, username)
+        if cached is not None:
+            return cached
+        
         try:
-            # Build the full prompt
-            full_prompt = self._build_prompt(message, context, username)
+            # Build the request contents
+            with metrics.stage("prompt_build"):
+                contents = self._build_contents(message, context, username, room_context)
+            route = self.router.route(message, context, room_context)
+            self._log_prompt_size(contents, username, route)
             
-            # Generate response with new API
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=full_prompt,
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)  # Disable thinking for speed
-                )
-            )
+            # Use the async client so the event loop keeps serving other rooms
+            started = time.perf_counter()
+            with metrics.stage("model"):
+                try:
+                    response = await self.resilience.call(
+                        lambda model: self._generate(model, contents),
+                        model=route.model
+                    )
+                except Exception as e:
+                    heavier = self.router.escalate(route, e)
+                    if heavier is None:
+                        raise
+                    route, started = heavier, time.perf_counter()
+                    response = await self.resilience.call(
+                        lambda model: self._generate(model, contents),
+                        model=route.model
+                    )
+            self._record_usage(response, "chat")
+            self.router.record(route, time.perf_counter() - started, getattr(response, "usage_metadata", None))
             
             if response.text:
-                return response.text.strip()
+                reply = response.text.strip()
+                if self.response_cache:
+                    self.response_cache.put(message, reply, context, username)
+                return reply
             else:
                 logger.warning("Empty response from Gemini")
                 return "I'm sorry, I couldn't generate a response right now."
                 
+        except CircuitOpenError:
+            logger.warning("Gemini circuit open, not calling the model")
+            return "I'm experiencing some technical difficulties. Please try again."
         except Exception as e:
+            metrics.error("model")
             logger.error(f"Error generating response: {e}")
             return "I'm experiencing some technical difficulties. Please try again."
     
-    def _build_prompt(self, message: str, context: str, username: str) -> str:
-        """Build the complete prompt for Gemini"""
+    async def stream_response(self, message: str, context: str = "", username: str = "",
+                              room_context: str = "") -> AsyncIterator[str]:
+        """
+        Generate AI response using Gemini, yielding text chunks as they arrive
+        
+        Args:
+            message: User's current message
+            context: Relevant conversation history/context
+            username: Username of the person sending the message
+            room_context: Recent messages from the room, oldest first
+            
+        Yields:
+            Response text chunks; a single apology chunk if nothing could be generated
+        """
+        if self._is_shared_prompt(message):
+            # One reply serves every user, so it must not draw on this user's
+            # memories or the room's chat
+            context, room_context = "", ""
+        cached = self._cached_reply(message, context, username)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        produced = False
+        usage = None
+        try:
+            with metrics.stage("prompt_build"):
+                contents = self._build_contents(message, context, username, room_context)
+            route = self.router.route(message, context, room_context)
+            self._log_prompt_size(contents, username, route)
+            
+            started = route_started = time.perf_counter()
+            while True:
+                try:
+                    async for chunk in self.resilience.stream(
+                        lambda model: self._generate(model, contents, stream=True),
+                        model=route.model
+                    ):
+                        # Usage is cumulative, the last chunk carrying it has the totals
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        if chunk.text:
+                            if not produced:
+                                metrics.observe_stage("ttft", time.perf_counter() - started)
+                            produced = True
+                            parts.append(chunk.text)
+                            yield chunk.text
+                    break
+                except Exception as e:
+                    # Once text has gone out the reply cannot be restarted on another model
+                    heavier = None if produced else self.router.escalate(route, e)
+                    if heavier is None:
+                        raise
+                    route, route_started = heavier, time.perf_counter()
+            
+            metrics.observe_stage("model", time.perf_counter() - started)
+            self._record_usage_metadata(usage, "chat")
+            self.router.record(route, time.perf_counter() - route_started, usage)
+            
+            if not produced:
+                logger.warning("Empty response from Gemini")
+                yield "I'm sorry, I couldn't generate a response right now."
+            elif self.response_cache:
+                self.response_cache.put(message, "".join(parts).strip(), context, username)
+                
+        except CircuitOpenError:
+            logger.warning("Gemini circuit open, not calling the model")
+            if not produced:
+                yield "I'm experiencing some technical difficulties. Please try again."
+        except Exception as e:
+            metrics.error("model")
+            logger.error(f"Error streaming response: {e}")
+            if not produced:
+                yield "I'm experiencing some technical difficulties. Please try again."
+    
+    async def generate_batch_responses(self, requests: List[Dict], room_context: str = "") -> List[Optional[str]]:
+        """
+        Answer several users' messages with a single structured Gemini call
+        
+        The system prompt is sent once and the model returns a JSON array of
+        {index, reply} objects. Cached prompts are answered without the call.
+        
+        Args:
+            requests: Dicts with "username", "message" and "context"
+            room_context: Recent messages from the room, shared by all requests
+            
+        Returns:
+            Replies in request order; None where the model gave no usable reply
+        """
+        # Shared prompts are answered without the asker's memories (see generate_response)
+        requests = [{**r, "context": ""} if self._is_shared_prompt(r["message"]) else r for r in requests]
+        replies = [self._cached_reply(r["message"], r["context"], r["username"]) for r in requests]
+        pending = [i for i, reply in enumerate(replies) if reply is None]
+        if not pending:
+            return replies
+        
+        try:
+            with metrics.stage("prompt_build"):
+                contents = self._build_batch_contents([(i, requests[i]) for i in pending], room_context)
+            self._log_prompt_size(contents, f"batch of {len(pending)}")
+            
+            # Several users' turns in one answer always get the full model
+            route = Route(ModelRouter.HEAVY, self.model_name, "batch")
+            started = time.perf_counter()
+            with metrics.stage("model_batch"):
+                response = await self.resilience.call(
+                    lambda model: self._generate(
+                        model,
+                        contents,
+                        response_mime_type="application/json",
+                        response_schema=_BATCH_REPLY_SCHEMA
+                    )
+                )
+            self._record_usage(response, "batch")
+            self.router.record(route, time.perf_counter() - started, getattr(response, "usage_metadata", None))
+            
+            for item in json.loads(response.text or "[]"):
+                index, reply = item.get("index"), (item.get("reply") or "").strip()
+                if index in pending and reply and replies[index] is None:
+                    replies[index] = reply
+                    r = requests[index]
+                    # The batch saw the room chat, so its replies to shared prompts stay out of the shared tier
+                    if self.response_cache and not (room_context and self._is_shared_prompt(r["message"])):
+                        self.response_cache.put(r["message"], reply, r["context"], r["username"])
+                        
+        except Exception as e:
+            metrics.error("model_batch")
+            logger.error(f"Error generating batch response: {e}")
+        
+        return replies
+    
+    async def summarize_history(self, username: str, previous_summary: str, turns: List[Dict]) -> Optional[str]:
+        """
+        Fold conversation turns into a user's running summary
         
-        prompt_parts = [self.system_prompt]
+        Args:
+            username: User the turns belong to
+            previous_summary: Current summary text (may be empty)
+            turns: Conversation dicts to fold in, oldest first
+            
+        Returns:
+            Updated summary, or None if it could not be generated
+        """
+        transcript = "\n".join(
+            f"{username}: {turn['user_message']}\nAI: {turn['ai_response']}" for turn in turns
+        )
+        prompt = (
+            f"You maintain a short memory summary about the chat user {username}.\n"
+            f"Update the summary with anything worth remembering from the new conversation "
+            f"(facts, preferences, ongoing topics). Keep it under {Config.SUMMARY_MAX_WORDS} words, "
+            f"written as plain sentences, and drop small talk.\n\n"
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New conversation:\n{transcript}\n\n"
+            f"Updated summary:"
+        )
+        
+        try:
+            with metrics.stage("summary"):
+                response = await self.resilience.call(
+                    lambda model: self.client.aio.models.generate_content(
+                        model=model,
+                        contents=prompt,
+                        config=self._generation_config()
+                    )
+                )
+            self._record_usage(response, "summary")
+            return response.text.strip() if response.text else None
+        except Exception as e:
+            metrics.error("summary")
+            logger.error(f"Error summarizing history for {username}: {e}")
+            return None
+    
+    def _is_shared_prompt(self, message: str) -> bool:
+        """Whether a message is a common prompt answered the same for every user"""
+        return bool(self.response_cache) and self.response_cache.is_shared(message)
+    
+    def _cached_reply(self, message: str, context: str, username: str) -> Optional[str]:
+        """Look up a cached reply for this prompt"""
+        if not self.response_cache:
+            return None
+        
+        reply = self.response_cache.get(message, context, username)
+        metrics.inc("agent_response_cache_total", result="miss" if reply is None else "hit")
+        if reply is not None:
+            logger.info(f"⚡ Response cache hit for {username or 'unknown'}")
+        return reply
+    
+    def _record_usage(self, response, call: str):
+        """Count the tokens Gemini reports for a response"""
+        self._record_usage_metadata(getattr(response, "usage_metadata", None), call)
+    
+    def _record_usage_metadata(self, usage, call: str):
+        """Count prompt, output and cached tokens from a usage_metadata object"""
+        if usage is None:
+            return
+        for kind, field in (("prompt", "prompt_token_count"),
+                            ("output", "candidates_token_count"),
+                            ("cached", "cached_content_token_count")):
+            count = getattr(usage, field, None)
+            if count:
+                metrics.inc("agent_gemini_tokens_total", count, call=call, kind=kind)
+    
+    def _log_prompt_size(self, contents: List[Dict], username: str, route: Optional[Route] = None):
+        """Report the estimated size of a request's contents, and where it is routed"""
+        text = "\n".join(part["text"] for content in contents for part in content["parts"])
+        routing = f" → {route.model} ({route.reason})" if route else ""
+        logger.info(
+            f"📏 Prompt for {username or 'unknown'}: ~{estimate_tokens(text)} tokens, {len(text)} chars "
+            f"(+ ~{estimate_tokens(self.system_prompt)} token system prompt){routing}"
+        )
+    
+    def _generation_config(self, **overrides) -> "types.GenerateContentConfig":
+        """Generation settings shared by all chat requests"""
+        from google.genai import types
+        return types.GenerateContentConfig(
+            thinking_config=types.ThinkingConfig(thinking_budget=0),  # Disable thinking for speed
+            **overrides
+        )
+    
+    def _chat_config(self, model: str, use_cache: bool = True, **overrides) -> Tuple["types.GenerateContentConfig", Optional[str]]:
+        """
+        Generation settings for a chat request carrying the system prompt
+        
+        Returns:
+            The config, and the cached content name it references (None when the instruction is inline)
+        """
+        cached = self.prompt_cache.lookup(model) if use_cache else None
+        if cached:
+            return self._generation_config(cached_content=cached, **overrides), cached
+        return self._generation_config(system_instruction=self.system_prompt, **overrides), None
+    
+    async def _generate(self, model: str, contents: List[Dict], stream: bool = False, **overrides):
+        """
+        Send a chat request with the system prompt, from the context cache when possible
+        
+        If the API rejects the cache reference (the entry expired or was
+        deleted), the entry is dropped and the request is re-sent with the
+        instruction inline.
+        
+        Returns:
+            The response, or an async iterator of chunks when streaming
+        """
+        async def send(config):
+            if not stream:
+                return await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+            chunks = self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+            # Newer SDK versions return a coroutine resolving to the iterator
+            if inspect.isawaitable(chunks):
+                chunks = await chunks
+            return chunks
+        
+        config, cached = self._chat_config(model, **overrides)
+        try:
+            return await send(config)
+        except Exception as e:
+            if not cached or getattr(e, "code", None) not in _STALE_CACHE_STATUS_CODES:
+                raise
+            logger.warning(f"Prompt cache {cached} rejected ({e}), sending the system prompt inline")
+            self.prompt_cache.invalidate(model)
+            config, _ = self._chat_config(model, use_cache=False, **overrides)
+            return await send(config)
+    
+    def _build_contents(self, message: str, context: str, username: str, room_context: str = "") -> List[Dict]:
+        """Build the user turn for Gemini: remembered context, recent room chat, then the current message"""
+        parts = []
         
         # Add context if available
         if context:
-            prompt_parts.append(f"\nPrevious conversation context:\n{context}")
+            parts.append({"text": f"Previous conversation context:\n{context}"})
+        if room_context:
+            parts.append({"text": f"Recent messages in this room:\n{room_context}"})
         
         # Add current message
         if username:
-            prompt_parts.append(f"\nCurrent message from {username}: {message}")
+            parts.append({"text": f"Current message from {username}: {message}"})
         else:
-            prompt_parts.append(f"\nCurrent message: {message}")
+            parts.append({"text": f"Current message: {message}"})
+        
+        return [{"role": "user", "parts": parts}]
+    
+    def _build_batch_contents(self, requests: List[tuple], room_context: str = "") -> List[Dict]:
+        """Build one user turn answering several (index, request) pairs"""
+        parts = [{
+            "text": "Several people in the chat mentioned you at the same time. Answer each message "
+                    "separately, using only that person's own context. Return a JSON array with one "
+                    "object per message: {\"index\": <message index>, \"reply\": <your reply>}."
+        }]
+        if room_context:
+            parts.append({"text": f"Recent messages in this room:\n{room_context}"})
         
-        prompt_parts.append(f"\nPlease respond as the AI assistant:")
+        for index, request in requests:
+            lines = [f"### Message {index} from {request['username']}"]
+            if request["context"]:
+                lines.append(f"Previous conversation context:\n{request['context']}")
+            lines.append(f"Message: {request['message']}")
+            parts.append({"text": "\n".join(lines)})
         
-        return "\n".join(prompt_parts)
+        return [{"role": "user", "parts": parts}]
+    
+    async def aclose(self):
+        """Delete server-side prompt cache entries"""
+        await self.prompt_cache.aclose()
+    
+    def close(self):
+        """Delete server-side prompt cache entries without an event loop (process exit)"""
+        self.prompt_cache.close()
     
     def test_connection(self) -> bool:
-        """Test if Gemini API is working"""
+        """Test if Gemini API is working (a model metadata lookup, so no tokens are generated or billed)"""
         try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents="Hello, this is a test.",
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)
-                )
-            )
-            return bool(response.text)
+            model = self.client.models.get(model=self.model_name)
+            return bool(model.name)
         except Exception as e:
             logger.error(f"Gemini connection test failed: {e}")
             return False
\ No newline at end of file
@@ -0,0 +1,143 @@
+import json
+import re
+from typing import Any, Dict, IO, Iterator, Tuple
+
+_WHITESPACE = " \t\n\r"
+# Characters a JSON number can contain; one is only complete once something else follows it
+_NUMBER_RE = re.compile(r"[-+0-9.eE]+")
+
+class JsonStreamReader:
+    """
+    Incremental reader for one large JSON document.
+
+    Walks the document's structure token by token and decodes only the
+    values asked for, so memory stays bounded by the largest single value
+    rather than the whole file.
+    """
+
+    def __init__(self, stream: IO[str], chunk_size: int = 1 << 20):
+        """
+        Args:
+            stream: Text stream positioned at the start of the document
+            chunk_size: Characters read at a time
+        """
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Read another chunk, dropping what has been consumed; False at end of file"""
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or "" at end of file"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        """Consume one structural character"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r}, found {found or 'end of file'!r}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete value"""
+        self.peek()
+        while True:
+            # "1" of "1.5e3" decodes on its own: a number running into the end
+            # of the buffer may continue in the next chunk
+            number = _NUMBER_RE.match(self._buf, self._pos)
+            if number and number.end() == len(self._buf) and self._fill():
+                continue
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            if not self._fill():
+                # One last attempt now that the end of input is known
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                self._pos = end
+                return value
+
+    def items(self) -> Iterator[str]:
+        """
+        Walk an object's keys, leaving the reader at each key's value
+
+        The caller must consume every value (value(), items() or elements())
+        before asking for the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def elements(self) -> Iterator[Any]:
+        """Decode an array's elements one at a time"""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("]")
+            return
+
+def iter_legacy_conversations(path: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    Stream (username, conversation) pairs out of a legacy memory_storage.json
+
+    The file looks like {"users": {name: {"conversations": [...], ...}}};
+    turns are yielded in file order, grouped by user, one at a time.
+
+    Args:
+        path: Path to the JSON file
+
+    Yields:
+        (username, conversation dict) pairs
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = JsonStreamReader(f)
+        for key in reader.items():
+            if key != "users":
+                reader.value()
+                continue
+            for username in reader.items():
+                for field in reader.items():
+                    if field != "conversations":
+                        reader.value()
+                        continue
+                    for conversation in reader.elements():
+                        yield username, conversation
@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ColdArchive:
+    """
+    Compressed segment files holding long-idle users' history.
+
+    A sweep writes one segment for a batch of users. Each user's turns are a
+    separate gzip member (concatenated members are still a valid gzip file),
+    and the store records the member's offset and length, so one user is
+    rehydrated with a seek and a single decompress instead of reading the
+    whole segment. A segment is deleted once none of its users remain
+    archived in it.
+    """
+
+    def __init__(self, directory: str, compresslevel: int = 6):
+        """
+        Args:
+            directory: Where segment files live (created if missing)
+            compresslevel: gzip level, 1 (fastest) to 9 (smallest)
+        """
+        self.directory = directory
+        self.compresslevel = compresslevel
+        os.makedirs(directory, exist_ok=True)
+
+    def write_segment(self, users: List[Tuple[str, List[Dict]]]) -> Tuple[str, List[Tuple[str, int, int]]]:
+        """
+        Write a batch of users' turns to a new segment
+
+        Args:
+            users: (username, turns) pairs
+
+        Returns:
+            The segment name and (username, offset, length) for each user
+        """
+        # Unique across worker processes sharing the directory
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl.gz"
+        path = os.path.join(self.directory, name)
+        entries = []
+
+        with open(path + ".tmp", 'wb') as f:
+            for username, turns in users:
+                lines = "\n".join(json.dumps(turn, ensure_ascii=False) for turn in turns)
+                member = gzip.compress(lines.encode('utf-8'), compresslevel=self.compresslevel)
+                entries.append((username, f.tell(), len(member)))
+                f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        return name, entries
+
+    def read(self, segment: str, offset: int, length: int) -> List[Dict]:
+        """Read one user's turns back from a segment"""
+        with open(os.path.join(self.directory, segment), 'rb') as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        return [json.loads(line) for line in data.decode('utf-8').splitlines() if line]
+
+    def delete(self, segment: str):
+        """Remove a segment file that no longer holds archived users"""
+        try:
+            os.remove(os.path.join(self.directory, segment))
+            logger.debug(f"Deleted archive segment {segment}")
+        except FileNotFoundError:
+            pass
+
+def sweep(store, archive: ColdArchive, idle_after_days: float, purge_after_days: float = 0,
+          segment_users: int = 200) -> Dict:
+    """
+    Apply the retention policy once
+
+    Users idle for idle_after_days move from the store to archive segments,
+    segment_users per segment. With purge_after_days set, users archived
+    that long ago are forgotten entirely.
+
+    Args:
+        store: ConversationStore or ShardedConversationStore
+        archive: Where archived history goes
+        idle_after_days: Days without activity before a user is archived
+        purge_after_days: Days in the archive before deletion (0 keeps it forever)
+        segment_users: Users written per segment
+
+    Returns:
+        Dict with archived and purged user counts
+    """
+    now = datetime.now()
+    idle_before = (now - timedelta(days=idle_after_days)).isoformat()
+
+    archived = 0
+    while True:
+        selected, moved = store.archive_idle(archive, idle_before, segment_users)
+        archived += moved
+        # Short batches mean the idle users are used up; skipped users
+        # (active again, or archived by another worker) wait for the next sweep
+        if moved == 0 or moved < selected or selected < segment_users:
+            break
+
+    purged = 0
+    if purge_after_days > 0:
+        purged = store.purge_archive(archive, (now - timedelta(days=purge_after_days)).isoformat())
+
+    if archived or purged:
+        store.release_space()
+    return {"archived": archived, "purged": purged}
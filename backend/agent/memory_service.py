@@ -1,46 +1,126 @@
-import json
-import os
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import asyncio
+import importlib.util
 import logging
+import random
+import threading
+import time
 from .config import Config
+from .context_assembler import ContextAssembler
+from .memory_archive import ColdArchive, sweep
+from .conversation_store import open_conversation_store
+from .metrics import metrics
+from .resilience import backoff_delay
+from .ttl_cache import TTLCache
+from .vector_index import ConversationIndex
 
 logger = logging.getLogger(__name__)
 
 class MemoryService:
     def __init__(self):
-        """Initialize memory service - tries mem0, falls back to JSON"""
+        """Initialize memory service - tries mem0, falls back to local storage"""
         self.use_mem0 = False
         self.memory_client = None
-        self.json_storage_path = "memory_storage.json"
+        self._memory_client_lock = threading.Lock()
+        self.store = None
         
-        # Try to initialize mem0
+        # Retention tiers: active users' windows live in context_cache (hot),
+        # their history in the SQLite store (warm), and users idle for
+        # MEMORY_ARCHIVE_AFTER_DAYS in compressed archive segments (cold),
+        # restored on their next join or mention.
+        # Windows are cached per process: turns another worker saves for the
+        # same user (in a room it serves) show up here within CONTEXT_CACHE_TTL
+        self.context_cache = TTLCache(
+            max_size=Config.CONTEXT_CACHE_SIZE,
+            ttl=Config.CONTEXT_CACHE_TTL
+        )
+        self.assembler = ContextAssembler(
+            token_budget=Config.CONTEXT_TOKEN_BUDGET,
+            char_budget=Config.MAX_CONTEXT_LENGTH
+        )
+        
+        # mem0's client is blocking: its calls run on a dedicated bounded pool
+        self._mem0_executor = None
+        self._mem0_slots = None
+        self.mem0_timeouts = 0
+        
+        # In-flight window loads (shared by prefetch and lookups) and background work
+        self._inflight_loads = {}
+        self._background_tasks = set()
+        
+        # Rolling summaries: an async (username, previous_summary, turns) -> summary
+        # callable (set by the agent) folds older turns off the hot path
+        self.summarizer = None
+        self._summary_candidates = set()
+        self._summarizer_task = None
+        self.summaries_written = 0
+        
+        # Cold tier and its background sweeper
+        self.archive = None
+        self._sweeper_task = None
+        
+        # Write-behind queue: saves are persisted in batches by a background task
+        self._write_queue = None
+        self._writer_task = None
+        self.saved_batches = 0
+        self.saved_conversations = 0
+        
+        # Try to initialize mem0. Only the package's presence is checked here;
+        # it is imported and the client created on the mem0 pool at first use
         if Config.MEM0_API_KEY:
-            try:
-                from mem0 import MemoryClient
-                self.memory_client = MemoryClient(api_key=Config.MEM0_API_KEY)
+            if importlib.util.find_spec("mem0") is None:
+                logger.warning("mem0ai package not installed, falling back to local storage")
+            else:
+                self._mem0_executor = ThreadPoolExecutor(
+                    max_workers=Config.MEM0_MAX_WORKERS,
+                    thread_name_prefix="mem0"
+                )
+                self._mem0_slots = asyncio.Semaphore(Config.MEM0_MAX_WORKERS)
                 self.use_mem0 = True
-                logger.info("Initialized mem0 client")
-            except ImportError:
-                logger.warning("mem0ai package not installed, falling back to JSON storage")
-            except Exception as e:
-                logger.warning(f"Failed to initialize mem0: {e}, falling back to JSON storage")
+                logger.info("mem0 enabled (client created on first use)")
         
-        # Initialize JSON storage if not using mem0
+        # Local semantic retrieval over stored turns (needs numpy)
+        self.use_local_index = Config.LOCAL_SEMANTIC_SEARCH and ConversationIndex.available
+        if Config.LOCAL_SEMANTIC_SEARCH and not ConversationIndex.available:
+            logger.warning("numpy not installed, local context falls back to recent conversations only")
+        
+        # Local storage is always kept: it is the primary store without mem0
+        # and the fallback when a mem0 call misses its deadline
+        self._init_local_storage()
         if not self.use_mem0:
-            self._init_json_storage()
-            logger.info("Using JSON file storage for memory")
+            logger.info(f"Using local SQLite storage for memory ({Config.MEMORY_DB_PATH}, {Config.MEMORY_SHARDS} shard(s))")
     
-    def _init_json_storage(self):
-        """Initialize JSON file storage"""
-        if not os.path.exists(self.json_storage_path):
-            with open(self.json_storage_path, 'w') as f:
-                json.dump({"users": {}}, f)
+    def _init_local_storage(self):
+        """Open the local conversation store, migrating the legacy JSON file on first use"""
+        # Several worker processes share these files; with MEMORY_SHARDS > 1
+        # each user lives in one of several databases so writes spread out
+        self.store = open_conversation_store(
+            Config.MEMORY_DB_PATH,
+            Config.MEMORY_SHARDS,
+            max_conversations=Config.MAX_CONVERSATIONS_PER_USER,
+            compact_every=Config.MEMORY_COMPACT_EVERY,
+            busy_timeout=Config.MEMORY_BUSY_TIMEOUT
+        )
+        try:
+            self.store.migrate_from_json(Config.MEMORY_JSON_PATH)
+        except Exception as e:
+            logger.error(f"Error migrating JSON storage: {e}")
+        
+        if Config.MEMORY_ARCHIVE_AFTER_DAYS > 0:
+            try:
+                self.archive = ColdArchive(Config.MEMORY_ARCHIVE_DIR)
+            except Exception as e:
+                logger.error(f"Error opening memory archive, idle users will not be archived: {e}")
     
     async def get_relevant_context(self, username: str, current_message: str) -> str:
         """
         Retrieve relevant conversation context for the user
         
+        The user's recent window is served from the in-process cache when
+        possible; storage (or mem0) is only queried on a miss.
+        
         Args:
             username: User's username
             current_message: Current message to find relevant context for
@@ -48,149 +128,570 @@ class MemoryService:
         Returns:
             Formatted context string
         """
-        if self.use_mem0:
-            return await self._get_context_mem0(username, current_message)
-        else:
-            return self._get_context_json(username, current_message)
+        window = self.context_cache.get(username)
+        if window is None:
+            window = await self._get_or_load_window(username, current_message)
+            if window is None:
+                return ""
+        
+        related = self._search_related(window, current_message)
+        context, stats = self.assembler.assemble(self._build_candidates(username, window, related))
+        logger.info(
+            f"🧠 Context for {username}: ~{stats['tokens']} tokens, {stats['chars']} chars "
+            f"({stats['kept']} kept, {stats['truncated']} truncated, {stats['dropped']} dropped)"
+        )
+        return context
+    
+    async def prefetch(self, username: str):
+        """
+        Warm a user's context window ahead of their first message
+        
+        Args:
+            username: User's username
+        """
+        if username in self.context_cache:
+            return
+        await self._get_or_load_window(username, Config.PREFETCH_QUERY.format(username=username))
+    
+    def refresh_in_background(self, username: str, current_message: str):
+        """
+        Re-run the mem0 search for a user's latest message without blocking
+        
+        The local window is already kept current by save_conversation, so this
+        only does work in mem0 mode.
+        
+        Args:
+            username: User's username
+            current_message: Message to search memories for
+        """
+        if not self.use_mem0:
+            return
+        self._spawn(self._refresh_memories(username, current_message))
+    
+    async def _refresh_memories(self, username: str, current_message: str):
+        """Replace the cached mem0 memories for a user, keeping the recent turns"""
+        memories = await self._search_mem0(username, current_message)
+        window = self.context_cache.peek(username)
+        if memories is not None and window is not None:
+            window["memories"] = memories
+    
+    async def _get_or_load_window(self, username: str, current_message: str) -> Optional[Dict]:
+        """Load a window into the cache, sharing one in-flight load per user"""
+        task = self._inflight_loads.get(username)
+        if task is None:
+            task = asyncio.ensure_future(self._load_window(username, current_message))
+            self._inflight_loads[username] = task
+            task.add_done_callback(lambda _: self._inflight_loads.pop(username, None))
+        
+        window = await asyncio.shield(task)
+        
+        # Fallback windows are served but not cached so mem0 is retried next time
+        if window is not None and not window.get("fallback") and username not in self.context_cache:
+            self.context_cache.put(username, window)
+        return window
+    
+    def _spawn(self, coro):
+        """Run a coroutine in the background, keeping a reference until it finishes"""
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
     
     async def save_conversation(self, username: str, user_message: str, ai_response: str, room_id: str = "default"):
         """
         Save conversation to memory
         
+        The turn is visible to get_relevant_context immediately (through the
+        cache) and is queued for persistence; this only waits when the write
+        queue is full.
+        
         Args:
             username: User's username
             user_message: User's message
             ai_response: AI's response
             room_id: Chat room identifier
         """
+        conversation = {
+            "user_message": user_message,
+            "ai_response": ai_response,
+            "timestamp": datetime.now().isoformat(),
+            "room_id": room_id
+        }
+        
+        # Write-through: keep a cached window coherent without re-reading storage
+        window = self.context_cache.peek(username)
+        if window is not None:
+            window["turns"].append(conversation)
+            del window["turns"][:-Config.CONTEXT_WINDOW_TURNS]
+            if window.get("index") is not None:
+                window["index"].add(conversation)
+        
+        self._ensure_writer()
+        await self._write_queue.put((username, conversation))
+    
+    @property
+    def write_queue_depth(self) -> int:
+        """Number of conversations waiting to be persisted"""
+        return self._write_queue.qsize() if self._write_queue else 0
+    
+    def get_cache_stats(self) -> Dict:
+        """Get context cache counters"""
+        return self.context_cache.stats()
+    
+    async def flush(self):
+        """Wait until every queued conversation has been persisted"""
+        if self._write_queue:
+            await self._write_queue.join()
+    
+    async def aclose(self):
+        """Flush pending saves, stop background tasks and release resources"""
+        await self.flush()
+        for task in (self._writer_task, self._summarizer_task, self._sweeper_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._writer_task = None
+        self._summarizer_task = None
+        self._sweeper_task = None
+        self.close()
+    
+    def close(self):
+        """Release the mem0 worker pool and the local store"""
+        if self._mem0_executor:
+            self._mem0_executor.shutdown(wait=False, cancel_futures=True)
+        if self.store:
+            self.store.close()
+    
+    def _ensure_writer(self):
+        """Start the background writer on first use (must run inside the event loop)"""
+        if self._write_queue is None:
+            self._write_queue = asyncio.Queue(maxsize=Config.WRITE_QUEUE_MAX_SIZE)
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._run_writer())
+        if self.summarizer and Config.SUMMARIZE_HISTORY and (self._summarizer_task is None or self._summarizer_task.done()):
+            self._summarizer_task = asyncio.create_task(self._run_summarizer())
+        if self.archive and (self._sweeper_task is None or self._sweeper_task.done()):
+            self._sweeper_task = asyncio.create_task(self._run_sweeper())
+    
+    async def _run_sweeper(self):
+        """Periodically apply the retention policy (first pass jittered so workers don't line up)"""
+        await asyncio.sleep(random.uniform(0, Config.MEMORY_SWEEP_INTERVAL))
+        while True:
+            try:
+                await self.sweep_idle()
+            except Exception as e:
+                logger.error(f"Error in retention sweep: {e}")
+            await asyncio.sleep(Config.MEMORY_SWEEP_INTERVAL)
+    
+    async def sweep_idle(self) -> Dict:
+        """
+        Archive users idle past MEMORY_ARCHIVE_AFTER_DAYS and purge expired archives
+        
+        Returns:
+            Dict with archived and purged user counts
+        """
+        if not self.archive:
+            return {"archived": 0, "purged": 0}
+        
+        with metrics.stage("retention_sweep"):
+            result = await asyncio.to_thread(
+                sweep,
+                self.store,
+                self.archive,
+                Config.MEMORY_ARCHIVE_AFTER_DAYS,
+                Config.MEMORY_PURGE_AFTER_DAYS,
+                Config.MEMORY_ARCHIVE_SEGMENT_USERS
+            )
+        metrics.inc("agent_memory_archived_users_total", result["archived"])
+        metrics.inc("agent_memory_purged_users_total", result["purged"])
+        if result["archived"] or result["purged"]:
+            logger.info(f"🧊 Retention sweep: {result['archived']} users archived, {result['purged']} purged")
+        return result
+    
+    async def _rehydrate(self, username: str):
+        """Restore an archived user's history before their window is loaded"""
+        if not self.archive:
+            return
+        try:
+            restored = await asyncio.to_thread(self.store.rehydrate, username, self.archive)
+            if restored:
+                metrics.inc("agent_memory_rehydrated_users_total")
+                logger.info(f"🧊 Rehydrated {restored} archived conversations for {username}")
+        except Exception as e:
+            metrics.error("rehydrate")
+            logger.error(f"Error rehydrating archived history for {username}: {e}")
+    
+    async def _run_summarizer(self):
+        """Periodically fold older turns of recently active users into their running summary"""
+        while True:
+            await asyncio.sleep(Config.SUMMARY_INTERVAL)
+            try:
+                await self.summarize_pending()
+            except Exception as e:
+                logger.error(f"Error in summary pass: {e}")
+    
+    async def summarize_pending(self) -> int:
+        """
+        Run one summary pass over users saved since the previous pass
+        
+        Up to SUMMARY_BATCH_USERS users are summarized concurrently; the rest
+        stay queued for the next pass.
+        
+        Returns:
+            Number of summaries updated
+        """
+        if not self.summarizer or not self._summary_candidates:
+            return 0
+        
+        batch = []
+        while self._summary_candidates and len(batch) < Config.SUMMARY_BATCH_USERS:
+            batch.append(self._summary_candidates.pop())
+        
+        results = await asyncio.gather(*(self._summarize_user(username) for username in batch))
+        updated = sum(1 for ok in results if ok)
+        self.summaries_written += updated
+        return updated
+    
+    async def _summarize_user(self, username: str) -> bool:
+        """Fold a user's turns older than the last SUMMARY_KEEP_RECENT into their summary"""
+        try:
+            existing = await asyncio.to_thread(self.store.get_summary, username)
+            through_id = existing["through_id"] if existing else 0
+            turns = await asyncio.to_thread(self.store.turns_after, username, through_id)
+            
+            to_fold = turns[:-Config.SUMMARY_KEEP_RECENT] if Config.SUMMARY_KEEP_RECENT else turns
+            if len(to_fold) < Config.SUMMARY_MIN_TURNS:
+                return False
+            
+            summary = await self.summarizer(username, existing["summary"] if existing else "", to_fold)
+            if not summary:
+                return False
+            
+            await asyncio.to_thread(
+                self.store.set_summary, username, summary, to_fold[-1]["id"], datetime.now().isoformat()
+            )
+            
+            window = self.context_cache.peek(username)
+            if window is not None:
+                window["summary"] = summary
+            
+            logger.info(f"📝 Folded {len(to_fold)} turns into summary for {username}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error summarizing history for {username}: {e}")
+            return False
+    
+    async def _run_writer(self):
+        """Drain the write queue, persisting conversations in batches"""
+        while True:
+            batch = [await self._write_queue.get()]
+            
+            # Give concurrent replies a moment to join this batch
+            if Config.WRITE_BATCH_DELAY > 0:
+                await asyncio.sleep(Config.WRITE_BATCH_DELAY)
+            while len(batch) < Config.WRITE_BATCH_SIZE and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            
+            try:
+                with metrics.stage("persistence"):
+                    await self._persist_batch(batch)
+                self.saved_batches += 1
+                self.saved_conversations += len(batch)
+            except Exception as e:
+                logger.error(f"Dropping {len(batch)} conversations after {Config.WRITE_MAX_RETRIES + 1} failed attempts: {e}")
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+    
+    async def _persist_batch(self, batch: List[Tuple[str, Dict]]):
+        """Write a batch to the local store in one transaction and to mem0 once per user"""
+        await self._save_local_with_retries(batch)
+        self._summary_candidates.update(username for username, _ in batch)
+        
+        if self.use_mem0:
+            by_user = {}
+            for username, conversation in batch:
+                by_user.setdefault(username, []).append(conversation)
+            
+            await asyncio.gather(*(
+                self._save_conversations_mem0(username, conversations)
+                for username, conversations in by_user.items()
+            ))
+    
+    async def _save_local_with_retries(self, batch: List[Tuple[str, Dict]]):
+        """
+        Write a batch to the local store, retrying with backoff while it fails
+        
+        The writer holds the batch (and the queue backs up) until it is written
+        or WRITE_MAX_RETRIES further attempts have failed, so a locked or
+        briefly unavailable database does not lose saves.
+        
+        Raises:
+            Exception: The last error once retries are exhausted
+        """
+        pending = batch
+        for attempt in range(Config.WRITE_MAX_RETRIES + 1):
+            try:
+                await self._save_conversations_local(pending)
+                return
+            except Exception as e:
+                metrics.error("persistence")
+                # A sharded store reports the turns its failed shards did not write
+                pending = getattr(e, "remaining", pending)
+                if attempt == Config.WRITE_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, Config.WRITE_RETRY_BASE_DELAY, Config.WRITE_RETRY_MAX_DELAY)
+                logger.warning(f"Error saving {len(pending)} conversations to local storage ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+    
+    def get_memory_client(self):
+        """
+        Get the mem0 client, importing mem0 and creating it on first use
+        
+        Blocking (the import and client setup do network and disk work), so it
+        is called from the mem0 pool or a warm-up thread, never the event loop.
+        If the client cannot be created, mem0 is disabled for the rest of the
+        process and the local store is used instead.
+        """
+        if self.memory_client is None:
+            with self._memory_client_lock:
+                if self.memory_client is None:
+                    started = time.perf_counter()
+                    try:
+                        from mem0 import MemoryClient
+                        self.memory_client = MemoryClient(api_key=Config.MEM0_API_KEY)
+                    except Exception as e:
+                        self.use_mem0 = False
+                        logger.warning(f"Failed to initialize mem0: {e}, falling back to local storage")
+                        raise
+                    logger.info(f"Initialized mem0 client in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return self.memory_client
+    
+    async def _call_mem0(self, method: str, timeout: float, **kwargs) -> Any:
+        """
+        Run a blocking mem0 client method on the mem0 pool with a deadline
+        
+        A slot is held until the worker thread actually finishes, so calls that
+        outlive their deadline still count against the concurrency limit.
+        
+        Args:
+            method: Name of the MemoryClient method to call
+            timeout: Seconds before giving up
+            **kwargs: Arguments for the method
+        
+        Raises:
+            asyncio.TimeoutError: If the call (including waiting for a slot) misses the deadline
+        """
+        async def run():
+            await self._mem0_slots.acquire()
+            loop = asyncio.get_running_loop()
+            try:
+                future = self._mem0_executor.submit(lambda: getattr(self.get_memory_client(), method)(**kwargs))
+            except Exception:
+                self._mem0_slots.release()
+                raise
+            future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._mem0_slots.release))
+            return await asyncio.wrap_future(future)
+        
+        try:
+            return await asyncio.wait_for(run(), timeout)
+        except asyncio.TimeoutError:
+            self.mem0_timeouts += 1
+            raise
+    
+    async def _load_window(self, username: str, current_message: str) -> Optional[Dict]:
+        """
+        Load a user's context window from the backing store
+        
+        In mem0 mode the window holds the search results for the message that
+        caused the miss, plus turns saved since then (appended write-through).
+        
+        Returns:
+            Dict with "memories" and "turns" lists, or None if the backend failed
+        """
+        # Returning users may have been archived while idle (on join this
+        # runs from prefetch, so the mention usually finds them restored)
+        await self._rehydrate(username)
+        
         if self.use_mem0:
-            await self._save_conversation_mem0(username, user_message, ai_response, room_id)
+            memories = await self._search_mem0(username, current_message)
+            if memories is not None:
+                window = {"memories": memories, "turns": []}
+            else:
+                # mem0 failed or timed out: answer from the local mirror instead
+                window = await asyncio.to_thread(self._load_local_window, username)
+                if window is not None:
+                    window["fallback"] = True
         else:
-            self._save_conversation_json(username, user_message, ai_response, room_id)
+            window = await asyncio.to_thread(self._load_local_window, username)
+        
+        if window is not None:
+            window["summary"] = await asyncio.to_thread(self._load_summary, username)
+        return window
     
-    async def _get_context_mem0(self, username: str, current_message: str) -> str:
-        """Get context using mem0"""
+    def _load_summary(self, username: str) -> Optional[str]:
+        """Load a user's running summary text from local storage"""
+        try:
+            summary = self.store.get_summary(username)
+            return summary["summary"] if summary else None
+        except Exception as e:
+            logger.error(f"Error reading summary: {e}")
+            return None
+    
+    def _load_local_window(self, username: str) -> Optional[Dict]:
+        """Build a window from local storage, indexing the user's stored turns when enabled"""
+        if not self.use_local_index:
+            turns = self._load_recent_local(username, Config.CONTEXT_WINDOW_TURNS)
+            if turns is None:
+                return None
+            return {"memories": [], "turns": turns}
+        
+        history = self._load_recent_local(username, Config.MAX_CONVERSATIONS_PER_USER)
+        if history is None:
+            return None
+        
+        index = ConversationIndex(dim=Config.LOCAL_INDEX_DIM, max_items=Config.MAX_CONVERSATIONS_PER_USER)
+        index.add_many(history)
+        return {"memories": [], "turns": history[-Config.CONTEXT_WINDOW_TURNS:], "index": index}
+    
+    def _search_related(self, window: Dict, current_message: str) -> List[Tuple[float, Dict]]:
+        """Find older turns similar to the message that are not already in the recent window"""
+        index = window.get("index")
+        if index is None:
+            return []
+        
+        return index.search(
+            current_message,
+            k=Config.LOCAL_SEARCH_TOP_K,
+            min_score=Config.LOCAL_SEARCH_MIN_SCORE,
+            exclude=window["turns"]
+        )
+    
+    def _build_candidates(self, username: str, window: Dict, related: List[Tuple[float, Dict]]) -> List[Dict]:
+        """
+        Turn a context window into ranked candidates for the assembler
+        
+        The newest turns rank highest, then the running summary, then mem0
+        memories in search order, then older related turns by similarity.
+        """
+        candidates = []
+        
+        if window.get("summary"):
+            candidates.append({
+                "section": f"Summary of earlier conversations with {username}",
+                "text": window["summary"],
+                "score": 1.45,
+                "order": 0
+            })
+        
+        for i, text in enumerate(window["memories"]):
+            candidates.append({
+                "section": f"What I remember about {username}",
+                "text": f"- {text}",
+                "score": 1.2 - 0.05 * i,
+                "order": i
+            })
+        
+        # Related turns are shown oldest first, ranked by similarity
+        for i, (score, conv) in enumerate(sorted(related, key=lambda r: r[1]["timestamp"])):
+            candidates.append({
+                "section": f"Earlier conversations with {username} that may be relevant",
+                "text": f"User: {conv['user_message']}\nAI: {conv['ai_response']}",
+                "score": score,
+                "order": i
+            })
+        
+        turns = window["turns"]
+        for i, conv in enumerate(turns):
+            candidates.append({
+                "section": f"Recent conversation with {username}",
+                "text": f"User: {conv['user_message']}\nAI: {conv['ai_response']}",
+                "score": 1.5 - 0.1 * (len(turns) - 1 - i),
+                "order": i
+            })
+        
+        return candidates
+    
+    async def _search_mem0(self, username: str, current_message: str) -> Optional[List[str]]:
+        """Search mem0 for memories relevant to the message"""
         try:
             # Search for relevant memories
-            memories = self.memory_client.search(
+            memories = await self._call_mem0(
+                "search",
+                Config.MEM0_SEARCH_TIMEOUT,
                 query=current_message,
                 user_id=username,
                 limit=5
             )
             
-            if memories:
-                context_parts = []
-                for memory in memories:  # ✅ iterate list directly
-        # Depending on mem0 schema, key might be "memory", "content", or "text"
-                    text = memory.get("memory") or memory.get("content") or str(memory)
-                    context_parts.append(f"- {text}")
-    
-                return f"What I remember about {username}:\n" + "\n".join(context_parts)
-
+            # Depending on mem0 schema, key might be "memory", "content", or "text"
+            return [
+                memory.get("memory") or memory.get("content") or str(memory)
+                for memory in memories or []
+            ]
             
+        except asyncio.TimeoutError:
+            logger.warning(f"mem0 search for {username} timed out after {Config.MEM0_SEARCH_TIMEOUT}s, using local store")
+            return None
         except Exception as e:
             logger.error(f"Error retrieving mem0 context: {e}")
-            return ""
+            return None
     
-    def _get_context_json(self, username: str, current_message: str) -> str:
-        """Get context using JSON storage"""
+    def _load_recent_local(self, username: str, limit: int) -> Optional[List[Dict]]:
+        """Load the user's last few conversations from local storage"""
         try:
-            with open(self.json_storage_path, 'r') as f:
-                data = json.load(f)
-            
-            user_data = data.get("users", {}).get(username, {})
-            conversations = user_data.get("conversations", [])
-            
-            # Simple context: return last few conversations
-            if conversations:
-                recent_conversations = conversations[-3:]  # Last 3 conversations
-                context_parts = []
-                
-                for conv in recent_conversations:
-                    context_parts.append(f"User: {conv['user_message']}")
-                    context_parts.append(f"AI: {conv['ai_response']}")
-                
-                return f"Recent conversation with {username}:\n" + "\n".join(context_parts)
-            
-            return ""
-            
+            return self.store.recent(username, limit)
         except Exception as e:
-            logger.error(f"Error reading JSON context: {e}")
-            return ""
+            logger.error(f"Error reading local context: {e}")
+            return None
     
-    async def _save_conversation_mem0(self, username: str, user_message: str, ai_response: str, room_id: str):
-        """Save conversation using mem0"""
+    async def _save_conversations_mem0(self, username: str, conversations: List[Dict]):
+        """Save a user's queued conversations to mem0 in a single add call"""
         try:
-            # Create memory entry
-            conversation_summary = f"User asked: '{user_message}' and I responded: '{ai_response}'"
+            messages = []
+            for conversation in conversations:
+                messages.append({"role": "user", "content": conversation["user_message"]})
+                messages.append({"role": "assistant", "content": conversation["ai_response"]})
             
-            self.memory_client.add(
-                messages=[
-                    {"role": "user", "content": user_message},
-                    {"role": "assistant", "content": ai_response}
-                ],
+            await self._call_mem0(
+                "add",
+                Config.MEM0_SAVE_TIMEOUT,
+                messages=messages,
                 user_id=username,
                 metadata={
-                    "room_id": room_id,
-                    "timestamp": datetime.now().isoformat()
+                    "room_id": conversations[-1]["room_id"],
+                    "timestamp": conversations[-1]["timestamp"]
                 }
             )
             
+        except asyncio.TimeoutError:
+            logger.warning(f"mem0 save for {username} timed out after {Config.MEM0_SAVE_TIMEOUT}s (kept in local store)")
         except Exception as e:
             logger.error(f"Error saving to mem0: {e}")
     
-    def _save_conversation_json(self, username: str, user_message: str, ai_response: str, room_id: str):
-        """Save conversation using JSON storage"""
-        try:
-            # Read existing data
-            with open(self.json_storage_path, 'r') as f:
-                data = json.load(f)
-            
-            # Initialize user data if needed
-            if username not in data["users"]:
-                data["users"][username] = {"conversations": []}
-            
-            # Add new conversation
-            conversation = {
-                "user_message": user_message,
-                "ai_response": ai_response,
-                "timestamp": datetime.now().isoformat(),
-                "room_id": room_id
-            }
-            
-            data["users"][username]["conversations"].append(conversation)
-            
-            # Keep only last 50 conversations per user to prevent file bloat
-            if len(data["users"][username]["conversations"]) > 50:
-                data["users"][username]["conversations"] = data["users"][username]["conversations"][-50:]
-            
-            # Save back to file
-            with open(self.json_storage_path, 'w') as f:
-                json.dump(data, f, indent=2)
-                
-        except Exception as e:
-            logger.error(f"Error saving to JSON: {e}")
+    async def _save_conversations_local(self, batch: List[Tuple[str, Dict]]):
+        """
+        Save queued conversations to local storage
+        
+        Raises:
+            Exception: Whatever the store raised; nothing of the failed transaction was written
+        """
+        # One transaction per batch; the per-user cap is enforced by periodic compaction
+        await asyncio.to_thread(self.store.append_many, batch)
     
     def get_user_stats(self, username: str) -> Dict:
         """Get user statistics"""
-        if self.use_mem0:
-            # For mem0, this would require additional API calls
-            return {"storage": "mem0", "username": username}
-        else:
-            try:
-                with open(self.json_storage_path, 'r') as f:
-                    data = json.load(f)
-                
-                user_data = data.get("users", {}).get(username, {})
-                conversations = user_data.get("conversations", [])
-                
-                return {
-                    "storage": "json",
-                    "username": username,
-                    "total_conversations": len(conversations),
-                    "first_seen": conversations[0]["timestamp"] if conversations else None,
-                    "last_seen": conversations[-1]["timestamp"] if conversations else None
-                }
-            except Exception as e:
-                logger.error(f"Error getting user stats: {e}")
-                return {"storage": "json", "username": username, "error": str(e)}
\ No newline at end of file
+        # Counts come from the local store, which mirrors mem0 saves as well
+        storage = "mem0" if self.use_mem0 else "sqlite"
+        try:
+            return {
+                "storage": storage,
+                "username": username,
+                **self.store.stats(username)
+            }
+        except Exception as e:
+            logger.error(f"Error getting user stats: {e}")
+            return {"storage": storage, "username": username, "error": str(e)}
\ No newline at end of file
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit to a slow model call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Histogram every pipeline stage is recorded in, labelled by stage
+STAGE_METRIC = "agent_stage_seconds"
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Record one value"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+# A collector returns (name, type, labels, value) samples read at export time
+Sample = Tuple[str, str, Dict[str, str], float]
+
+class Metrics:
+    """
+    In-process metrics registry: labelled histograms, counters and collectors.
+
+    Updated from the event loop only. Exported as Prometheus text by the
+    metrics endpoint and summarized into the log periodically.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._collectors: List[Callable[[], List[Sample]]] = []
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a value in a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe_stage(self, stage: str, seconds: float):
+        """Record the latency of one pipeline stage"""
+        self.observe(STAGE_METRIC, seconds, stage=stage)
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block as a pipeline stage (also across awaits)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - started)
+
+    def error(self, stage: str):
+        """Count a failure in a pipeline stage"""
+        self.inc("agent_errors_total", stage=stage)
+
+    def add_collector(self, collector: Callable[[], List[Sample]]):
+        """Register a callable whose samples (cache stats, queue depths...) are read at export time"""
+        self._collectors.append(collector)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        """Get a histogram if anything was recorded in it"""
+        return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        # name -> (type, lines); a family's lines must be contiguous
+        families: Dict[str, Tuple[str, List[str]]] = {}
+
+        def family(name: str, kind: str) -> List[str]:
+            return families.setdefault(name, (kind, []))[1]
+
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            lines = family(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(histogram.bounds) + ["+Inf"], histogram.counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        for (name, labels), value in sorted(self._counters.items()):
+            family(name, "counter").append(f"{name}{_format_labels(labels)} {value:g}")
+
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, labels, value in samples:
+                family(name, kind).append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {value:g}")
+
+        output = []
+        for name, (kind, lines) in families.items():
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(lines)
+        return "\n".join(output) + "\n"
+
+    def summary(self) -> str:
+        """One-line digest of stage latencies and counters for the log"""
+        parts = []
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            if name != STAGE_METRIC or not histogram.count:
+                continue
+            stage = dict(labels).get("stage", name)
+            parts.append(
+                f"{stage} p50={histogram.quantile(0.5) * 1000:.0f}ms "
+                f"p95={histogram.quantile(0.95) * 1000:.0f}ms "
+                f"p99={histogram.quantile(0.99) * 1000:.0f}ms n={histogram.count}"
+            )
+        for (name, labels), value in sorted(self._counters.items()):
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            parts.append(f"{name}{{{label_text}}}={value:g}" if label_text else f"{name}={value:g}")
+        return " | ".join(parts) or "no samples yet"
+
+def _format_labels(labels: tuple) -> str:
+    """Render label pairs as {k="v",...}"""
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+# Process-wide registry shared by every room
+metrics = Metrics()
+
+_exporter_tasks: List[asyncio.Task] = []
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Answer one HTTP request: GET /metrics returns the Prometheus text"""
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+        path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+        if path.split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", metrics.render_prometheus().encode('utf-8')
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii') + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+async def _run_metrics_server():
+    """
+    Serve /metrics on the first free port from METRICS_PORT on. Every job
+    process exports its own registry, so several processes on one host each
+    take the next port in the range.
+    """
+    for port in range(Config.METRICS_PORT, Config.METRICS_PORT + Config.METRICS_PORT_RANGE):
+        try:
+            server = await asyncio.start_server(_serve_metrics, Config.METRICS_HOST, port)
+        except OSError:
+            continue
+        logger.info(f"📊 Metrics endpoint on http://{Config.METRICS_HOST}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+        return
+    logger.warning(f"No free metrics port in {Config.METRICS_PORT}-{Config.METRICS_PORT + Config.METRICS_PORT_RANGE - 1}")
+
+async def _run_metrics_log():
+    """Periodically write the metrics digest to the log"""
+    while True:
+        await asyncio.sleep(Config.METRICS_LOG_INTERVAL)
+        logger.info(f"📊 Metrics: {metrics.summary()}")
+
+def start_exporters():
+    """Start the metrics endpoint and log dump for this process, if configured (idempotent)"""
+    global _exporter_tasks
+    if any(not task.done() for task in _exporter_tasks):
+        return
+
+    _exporter_tasks = []
+    if Config.METRICS_PORT:
+        _exporter_tasks.append(asyncio.create_task(_run_metrics_server()))
+    if Config.METRICS_LOG_INTERVAL > 0:
+        _exporter_tasks.append(asyncio.create_task(_run_metrics_log()))
@@ -0,0 +1,175 @@
+import re
+import logging
+from typing import Dict, Optional, Tuple
+from .context_assembler import estimate_tokens
+from .metrics import metrics
+from .resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Whole-message social turns that need no reasoning
+_CHIT_CHAT_RE = re.compile(
+    r"^(hi|hey|hello|yo|sup|hiya|howdy|thanks|thank you|thx|ty|ok|okay|cool|nice|great|lol|haha|"
+    r"bye|good ?bye|see you|cya|good (morning|afternoon|evening|night)|gm|gn|"
+    r"how are you|how's it going|what's up|whats up)"
+    r"(\s+(there|all|everyone|again|buddy|friend|so much|a lot))?[\s!.,:)?]*$",
+    re.IGNORECASE
+)
+
+# Signs the user wants explanation, reasoning, recall or production of something
+_COMPLEX_RE = re.compile(
+    r"\b(why|how|explain|compare|difference|analy[sz]e|summari[sz]e|plan|design|write|code|debug|"
+    r"calculate|step|steps|pros|cons|recommend|should i|remember|last time|earlier|previous)\b",
+    re.IGNORECASE
+)
+
+class Route:
+    """Where one turn is sent, and why"""
+
+    __slots__ = ("name", "model", "reason")
+
+    def __init__(self, name: str, model: str, reason: str):
+        self.name = name
+        self.model = model
+        self.reason = reason
+
+class RouteStats:
+    """Running latency, token and cost totals for one route"""
+
+    __slots__ = ("calls", "seconds", "prompt_tokens", "output_tokens", "cost")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+class ModelRouter:
+    """
+    Picks a model per turn using cheap local heuristics.
+
+    Greetings and short statements with little context go to the light
+    model. Questions that ask for explanation or recall, long messages,
+    code and turns with a large prompt (remembered context plus room chat)
+    go to the heavy model. When in doubt a turn goes heavy, so routing never
+    downgrades a complex answer to save a few milliseconds, and a turn whose
+    light-model call fails is retried on the heavy model (see escalate).
+    """
+
+    LIGHT, HEAVY = "light", "heavy"
+
+    def __init__(self, light_model: str, heavy_model: str, enabled: bool = True,
+                 light_max_words: int = 12, light_max_context_tokens: int = 400,
+                 prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        """
+        Args:
+            light_model: Fast, cheap model for chit-chat
+            heavy_model: Full model for everything else
+            enabled: When False every turn goes to the heavy model
+            light_max_words: Longest message the light model may answer
+            light_max_context_tokens: Largest context plus room chat the light model may be given
+            prices: model -> (USD per 1M input tokens, USD per 1M output tokens), for cost estimates
+        """
+        self.light_model = light_model
+        self.heavy_model = heavy_model
+        self.enabled = enabled and bool(light_model) and light_model != heavy_model
+        self.light_max_words = light_max_words
+        self.light_max_context_tokens = light_max_context_tokens
+        self.prices = prices or {}
+        self._stats = {self.LIGHT: RouteStats(), self.HEAVY: RouteStats()}
+
+    def route(self, message: str, context: str = "", room_context: str = "") -> Route:
+        """Classify a turn and choose its model"""
+        route = self._classify(message, context, room_context)
+        metrics.inc("agent_route_total", route=route.name)
+        logger.debug(f"Routed to {route.name} ({route.model}): {route.reason}")
+        return route
+
+    def escalate(self, route: Route, error: Exception) -> Optional[Route]:
+        """
+        The heavy route to retry a failed light-model call on
+
+        Args:
+            route: Route of the failed call
+            error: What it failed with
+
+        Returns:
+            The heavy route, or None when the call already went heavy or the
+            circuit is open (it covers both models)
+        """
+        if route.name != self.LIGHT or isinstance(error, CircuitOpenError):
+            return None
+        metrics.inc("agent_route_escalations_total")
+        logger.warning(f"Light model {route.model} failed ({error!r}), retrying on {self.heavy_model}")
+        return Route(self.HEAVY, self.heavy_model, f"light model failed after {route.reason}")
+
+    def _classify(self, message: str, context: str, room_context: str) -> Route:
+        """Apply the routing heuristics, cheapest checks first"""
+        if not self.enabled:
+            return Route(self.HEAVY, self.heavy_model, "routing disabled")
+
+        message = message.strip()
+        if _CHIT_CHAT_RE.match(message):
+            return Route(self.LIGHT, self.light_model, "chit-chat")
+
+        words = len(message.split())
+        if "```" in message or "\n" in message:
+            return Route(self.HEAVY, self.heavy_model, "multi-line or code")
+        if words > self.light_max_words:
+            return Route(self.HEAVY, self.heavy_model, f"{words} words")
+        if _COMPLEX_RE.search(message):
+            return Route(self.HEAVY, self.heavy_model, "asks for reasoning or recall")
+        if (context or room_context) and \
+                estimate_tokens(context) + estimate_tokens(room_context) > self.light_max_context_tokens:
+            return Route(self.HEAVY, self.heavy_model, "large context")
+        if "?" in message:
+            # Short factual questions are fine on the light model; anything
+            # with several clauses is not
+            if message.count("?") > 1 or "," in message:
+                return Route(self.HEAVY, self.heavy_model, "compound question")
+            return Route(self.LIGHT, self.light_model, "short question")
+        return Route(self.LIGHT, self.light_model, "short statement")
+
+    def record(self, route: Route, seconds: float, usage=None):
+        """
+        Account one completed call to a route
+
+        Args:
+            route: Route the call went to
+            seconds: Model latency
+            usage: The response's usage_metadata, if any
+        """
+        stats = self._stats[route.name]
+        stats.calls += 1
+        stats.seconds += seconds
+        metrics.observe("agent_route_seconds", seconds, route=route.name)
+
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+        output_tokens = getattr(usage, "candidates_token_count", None) or 0
+        stats.prompt_tokens += prompt_tokens
+        stats.output_tokens += output_tokens
+        if prompt_tokens:
+            metrics.inc("agent_route_tokens_total", prompt_tokens, route=route.name, kind="prompt")
+        if output_tokens:
+            metrics.inc("agent_route_tokens_total", output_tokens, route=route.name, kind="output")
+
+        input_price, output_price = self.prices.get(route.model, (0.0, 0.0))
+        cost = (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
+        stats.cost += cost
+        if cost:
+            metrics.inc("agent_route_cost_usd_total", cost, route=route.name)
+
+    def stats(self) -> Dict:
+        """Per-route call counts, mean latency, tokens and estimated cost"""
+        return {
+            name: {
+                "model": self.light_model if name == self.LIGHT else self.heavy_model,
+                "calls": stats.calls,
+                "avg_latency": stats.seconds / stats.calls if stats.calls else 0.0,
+                "prompt_tokens": stats.prompt_tokens,
+                "output_tokens": stats.output_tokens,
+                "cost_usd": round(stats.cost, 6)
+            }
+            for name, stats in self._stats.items()
+        }
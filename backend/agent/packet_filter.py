@@ -0,0 +1,17 @@
+import re
+from .config import Config
+
+# Matched against raw packet bytes, so no decode or JSON parse is needed to
+# reject traffic that is not for the agent. Chat clients send the trigger as
+# literal text (JSON.stringify does not escape "@"), so a byte scan is exact
+# for every message the agent would answer.
+_TRIGGER_BYTES_RE = re.compile(re.escape(Config.AGENT_TRIGGER.encode('utf-8')), re.IGNORECASE)
+_TRIGGER_TEXT_RE = re.compile(re.escape(Config.AGENT_TRIGGER), re.IGNORECASE)
+
+def mentions_trigger(data: bytes) -> bool:
+    """Case-insensitive check for the agent trigger in a raw data packet"""
+    return _TRIGGER_BYTES_RE.search(data) is not None
+
+def strip_trigger(text: str) -> str:
+    """Remove every (case-insensitive) trigger mention from a message"""
+    return _TRIGGER_TEXT_RE.sub("", text).strip()
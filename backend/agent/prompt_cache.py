@@ -0,0 +1,165 @@
+import asyncio
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from .context_assembler import estimate_tokens
+from .metrics import Sample, metrics
+
+logger = logging.getLogger(__name__)
+
+# Entries this close to expiry are treated as gone, so requests don't race the server
+_EXPIRY_MARGIN = 30
+
+class PromptCache:
+    """
+    Gemini cached content holding the fixed system instruction, one entry per model.
+
+    Requests that find a live entry send `cached_content` instead of the
+    system instruction, so the prefix is not re-processed (or billed at the
+    full input rate) each time. Entries are created in the background on
+    first use; until one is ready, or if creation fails, requests send the
+    instruction inline. While an entry keeps being used, a background task
+    extends its TTL; entries that go unused simply expire on the server.
+
+    The API refuses to cache prompts below a model-dependent minimum size,
+    so a short instruction disables the cache up front instead of failing
+    on every attempt.
+    """
+
+    def __init__(self, client_getter: Callable[[], Any], system_instruction: str, ttl: int = 3600,
+                 min_tokens: int = 1024, enabled: bool = True, retry_after: float = 300.0):
+        """
+        Args:
+            client_getter: Returns the genai client (called lazily, off the import path)
+            system_instruction: Fixed instruction to cache
+            ttl: Seconds an entry lives on the server between refreshes
+            min_tokens: Smallest instruction worth (and allowed) caching
+            enabled: Whether to use cached content at all
+            retry_after: Seconds to wait before retrying a failed creation for a model
+        """
+        self._get_client = client_getter
+        self.system_instruction = system_instruction
+        self.ttl = ttl
+        self.retry_after = retry_after
+
+        instruction_tokens = estimate_tokens(system_instruction)
+        self.enabled = enabled and instruction_tokens >= min_tokens
+        if enabled and not self.enabled:
+            logger.info(
+                f"System prompt is ~{instruction_tokens} tokens, below the ~{min_tokens}-token minimum "
+                f"for context caching; it is sent as system_instruction instead"
+            )
+
+        self._names: Dict[str, str] = {}  # model -> cached content name
+        self._expires_at: Dict[str, float] = {}  # model -> monotonic expiry
+        self._used_since_refresh: Dict[str, bool] = {}
+        self._failed_until: Dict[str, float] = {}
+        self._creating: Dict[str, asyncio.Task] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def lookup(self, model: str) -> Optional[str]:
+        """
+        Name of a live cache entry for the model, or None
+
+        A miss starts creating the entry in the background, so the current
+        request goes out with the inline instruction instead of waiting.
+        Must be called from the event loop.
+        """
+        if not self.enabled:
+            return None
+
+        name = self._names.get(model)
+        if name and time.monotonic() < self._expires_at[model] - _EXPIRY_MARGIN:
+            self._used_since_refresh[model] = True
+            metrics.inc("agent_prompt_cache_total", result="hit")
+            return name
+
+        if name:
+            self.invalidate(model)
+        metrics.inc("agent_prompt_cache_total", result="miss")
+        self._ensure(model)
+        return None
+
+    def invalidate(self, model: str):
+        """Forget a model's entry (expired, or rejected by the API)"""
+        self._names.pop(model, None)
+        self._expires_at.pop(model, None)
+        self._used_since_refresh.pop(model, None)
+
+    def _ensure(self, model: str):
+        """Start creating an entry for the model unless one is in flight or recently failed"""
+        if model in self._creating or time.monotonic() < self._failed_until.get(model, 0):
+            return
+
+        task = asyncio.create_task(self._create(model))
+        self._creating[model] = task
+        task.add_done_callback(lambda _: self._creating.pop(model, None))
+
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._run_refresher())
+
+    async def _create(self, model: str):
+        """Create the cache entry for a model"""
+        from google.genai import types
+        try:
+            cache = await self._get_client().aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=self.system_instruction,
+                    display_name="chat-agent-system-prompt",
+                    ttl=f"{self.ttl}s"
+                )
+            )
+            self._names[model] = cache.name
+            self._expires_at[model] = time.monotonic() + self.ttl
+            self._used_since_refresh[model] = False
+            logger.info(f"🗄️ Cached system prompt for {model} as {cache.name} (ttl {self.ttl}s)")
+        except Exception as e:
+            self._failed_until[model] = time.monotonic() + self.retry_after
+            metrics.inc("agent_prompt_cache_errors_total", operation="create")
+            logger.warning(f"Could not cache the system prompt for {model}, sending it inline: {e}")
+
+    async def _run_refresher(self):
+        """Extend the TTL of entries that were used since the last pass"""
+        from google.genai import types
+        while self._names or self._creating:
+            await asyncio.sleep(self.ttl / 2)
+            for model, name in list(self._names.items()):
+                if not self._used_since_refresh.get(model):
+                    continue
+                try:
+                    await self._get_client().aio.caches.update(
+                        name=name,
+                        config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s")
+                    )
+                    self._expires_at[model] = time.monotonic() + self.ttl
+                    self._used_since_refresh[model] = False
+                except Exception as e:
+                    metrics.inc("agent_prompt_cache_errors_total", operation="refresh")
+                    logger.warning(f"Could not refresh prompt cache {name}, will recreate it on next use: {e}")
+                    self.invalidate(model)
+
+    async def aclose(self):
+        """Stop refreshing and delete the server-side entries (they are billed for storage)"""
+        for task in [self._refresh_task, *self._creating.values()]:
+            if task and not task.done():
+                task.cancel()
+        for model, name in list(self._names.items()):
+            try:
+                await self._get_client().aio.caches.delete(name=name)
+            except Exception as e:
+                logger.debug(f"Could not delete prompt cache {name}: {e}")
+            self.invalidate(model)
+
+    def close(self):
+        """Delete the server-side entries with the blocking client, for process exit when no loop runs"""
+        for model, name in list(self._names.items()):
+            try:
+                self._get_client().caches.delete(name=name)
+            except Exception as e:
+                logger.debug(f"Could not delete prompt cache {name}: {e}")
+            self.invalidate(model)
+
+    def collect_metrics(self) -> List[Sample]:
+        """Live entries for the metrics export"""
+        return [("agent_prompt_cache_entries", "gauge", {}, len(self._names))]
@@ -0,0 +1,394 @@
+import asyncio
+import random
+import sys
+import time
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, TypeVar
+from .metrics import Sample, metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# HTTP statuses worth another attempt: rate limited, or the service is having trouble
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open"""
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed call may succeed if repeated
+
+    Timeouts and connection errors are, including httpx transport errors
+    (which google.genai raises as is and which do not subclass
+    ConnectionError); SDK errors are judged by their HTTP status
+    (google.genai's APIError carries it as `code`). Anything else, such as
+    an invalid request, is not.
+    """
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # Not imported here: httpx is heavy, and only loaded once the SDK has sent a request
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    return _status(error) in RETRYABLE_STATUS_CODES
+
+def _status(error: BaseException) -> Optional[int]:
+    """HTTP status an SDK error carries, or None if the error did not come from a response"""
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return status if isinstance(status, int) else None
+
+def _record_outcome(breaker: "CircuitBreaker", error: BaseException):
+    """
+    Record a non-retryable error on the breaker
+
+    An error response (an invalid request) shows the backend is up, so it
+    counts as a success. Anything else, such as a TypeError from a bug in
+    the request factory, says nothing about the backend and is not recorded;
+    in particular it must not close a half-open circuit.
+    """
+    if _status(error) is not None:
+        breaker.record_success()
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker over a sliding time window.
+
+    Closed: calls flow and outcomes are recorded. When at least min_calls
+    outcomes in the window fail at error_rate or more, it opens and rejects
+    calls for cooldown seconds. Then it is half-open: one probe call is let
+    through, and its outcome closes or re-opens the circuit. A probe that
+    ends without an outcome (cancelled) hands the slot back with
+    release_probe(); one that never reports back is given up on after
+    probe_timeout seconds and another probe is let through.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, error_rate: float = 0.5, min_calls: int = 10,
+                 window: float = 30.0, cooldown: float = 15.0, probe_timeout: float = 60.0):
+        """
+        Args:
+            name: Label used in logs and metrics
+            error_rate: Failure fraction that opens the circuit
+            min_calls: Outcomes needed in the window before it can open
+            window: Seconds of outcomes considered
+            cooldown: Seconds the circuit stays open before a probe
+            probe_timeout: Seconds a probe may run before another is allowed
+        """
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._outcomes = deque()  # (monotonic time, succeeded)
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"🔌 Circuit {self.name} half-open, probing")
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                if time.monotonic() - self._probe_started < self.probe_timeout:
+                    return False
+                logger.warning(f"🔌 Circuit {self.name} probe never reported back, probing again")
+            self._probe_in_flight = True
+            self._probe_started = time.monotonic()
+        return True
+
+    @property
+    def probing(self) -> bool:
+        """Whether a half-open probe is running (the call just allowed is the probe)"""
+        return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def release_probe(self):
+        """Hand back the probe slot when the probe ended without an outcome"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        """Record a successful call"""
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self._outcomes.clear()
+            logger.info(f"🔌 Circuit {self.name} closed")
+        self._record(True)
+
+    def record_failure(self):
+        """Record a failed call, opening the circuit if the error rate is too high"""
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+
+        self._record(False)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+            self._open()
+
+    def _record(self, succeeded: bool):
+        now = time.monotonic()
+        self._outcomes.append((now, succeeded))
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+        self._probe_in_flight = False
+        metrics.inc("agent_circuit_opened_total", circuit=self.name)
+        logger.warning(f"🔌 Circuit {self.name} open for {self.cooldown:.0f}s")
+
+class LatencyTracker:
+    """Recent successful call latencies, for picking a hedge delay"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Latency quantile, or None until enough calls have been seen"""
+        if len(self._samples) < 20:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ResilientCaller:
+    """
+    Deadlines, retries, hedging and circuit breaking around one backend.
+
+    Calls are given as a factory taking the model name, so the same request
+    can be re-issued, duplicated for a hedge, or sent to the fallback model
+    while the circuit is open.
+    """
+
+    def __init__(self, name: str, model: str, timeout: float = 20.0, max_retries: int = 2,
+                 retry_base_delay: float = 0.25, retry_max_delay: float = 4.0,
+                 hedging: bool = False, hedge_quantile: float = 0.95, hedge_min_delay: float = 1.0,
+                 breaker: Optional[CircuitBreaker] = None, fallback_model: Optional[str] = None):
+        """
+        Args:
+            name: Label used in logs and metrics
+            model: Model normally called
+            timeout: Seconds each attempt may take
+            max_retries: Extra attempts after a retryable failure
+            retry_base_delay: Backoff before the first retry (doubling, jittered)
+            retry_max_delay: Longest backoff between attempts
+            hedging: Whether to send a duplicate request when the first is slow
+            hedge_quantile: Recent-latency quantile after which the duplicate is sent
+            hedge_min_delay: Floor for the hedge delay
+            breaker: Circuit breaker shared by calls to this backend
+            fallback_model: Cheaper model used while the circuit is open (None fails fast)
+        """
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker(name)
+        self.fallback_model = fallback_model
+        self.latencies = LatencyTracker()
+
+    async def call(self, request: Callable[[str], Awaitable[T]], model: Optional[str] = None) -> T:
+        """
+        Run a request with the resilience policy
+
+        Args:
+            request: Coroutine factory taking the model name
+            model: Model to use instead of the default
+
+        Returns:
+            The request's result
+
+        Raises:
+            CircuitOpenError: If the circuit is open and there is no fallback model
+            Exception: The last error once retries are exhausted, or a non-retryable error
+        """
+        model = model or self.model
+        if not self.breaker.allow():
+            return await self._call_fallback(request)
+
+        probe = self.breaker.probing
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = time.perf_counter()
+                try:
+                    result = await self._attempt(request, model)
+                except Exception as e:
+                    if not is_retryable(e):
+                        _record_outcome(self.breaker, e)
+                        raise
+                    self.breaker.record_failure()
+                    if isinstance(e, asyncio.TimeoutError):
+                        metrics.inc("agent_model_timeouts_total", backend=self.name)
+                    if attempt == self.max_retries or not self.breaker.allow():
+                        raise
+                    probe = probe or self.breaker.probing
+                    delay = backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay)
+                    metrics.inc("agent_model_retries_total", backend=self.name)
+                    logger.warning(f"🔁 {self.name} attempt {attempt + 1} failed ({e!r}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                else:
+                    self.breaker.record_success()
+                    self.latencies.add(time.perf_counter() - started)
+                    return result
+        finally:
+            # A cancelled probe records no outcome; without this the circuit stays half-open
+            if probe:
+                self.breaker.release_probe()
+
+    async def stream(self, request: Callable[[str], Awaitable[AsyncIterator[T]]],
+                     model: Optional[str] = None) -> AsyncIterator[T]:
+        """
+        Run a streaming request with the resilience policy
+
+        Every chunk must arrive within the timeout. Failures before the first
+        chunk are retried like a plain call; once output has been yielded an
+        error is raised as is, since the chunks cannot be taken back. Streams
+        are not hedged.
+
+        Args:
+            request: Coroutine factory taking the model name and resolving to an async iterator
+            model: Model to use instead of the default
+
+        Yields:
+            The stream's chunks
+
+        Raises:
+            CircuitOpenError: If the circuit is open and there is no fallback model
+        """
+        model = model or self.model
+        fallback = not self.breaker.allow()
+        if fallback:
+            if not self.fallback_model:
+                metrics.inc("agent_circuit_rejected_total", circuit=self.breaker.name)
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            metrics.inc("agent_model_fallbacks_total", backend=self.name, model=self.fallback_model)
+            model = self.fallback_model
+
+        # Cancellation, or the consumer closing the stream early, records no
+        # outcome; a probe hands its slot back so the circuit can be probed again
+        probe = not fallback and self.breaker.probing
+        try:
+            for attempt in range(1 if fallback else self.max_retries + 1):
+                started = time.perf_counter()
+                produced = False
+                try:
+                    iterator = (await asyncio.wait_for(request(model), self.timeout)).__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        produced = True
+                        yield chunk
+                except Exception as e:
+                    if fallback:
+                        raise
+                    if not is_retryable(e):
+                        _record_outcome(self.breaker, e)
+                        raise
+                    self.breaker.record_failure()
+                    if isinstance(e, asyncio.TimeoutError):
+                        metrics.inc("agent_model_timeouts_total", backend=self.name)
+                    if produced or attempt == self.max_retries or not self.breaker.allow():
+                        raise
+                    probe = probe or self.breaker.probing
+                    delay = backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay)
+                    metrics.inc("agent_model_retries_total", backend=self.name)
+                    logger.warning(f"🔁 {self.name} stream attempt {attempt + 1} failed ({e!r}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                else:
+                    if not fallback:
+                        self.breaker.record_success()
+                        self.latencies.add(time.perf_counter() - started)
+                    return
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging is off or not yet calibrated"""
+        if not self.hedging:
+            return None
+        quantile = self.latencies.quantile(self.hedge_quantile)
+        return None if quantile is None else max(self.hedge_min_delay, quantile)
+
+    async def _attempt(self, request: Callable[[str], Awaitable[T]], model: str) -> T:
+        """One attempt under the deadline, hedged once if it runs past the hedge delay"""
+        delay = self.hedge_delay()
+        if delay is None or delay >= self.timeout:
+            return await asyncio.wait_for(request(model), self.timeout)
+
+        deadline = time.monotonic() + self.timeout
+        tasks: List[asyncio.Task] = [asyncio.create_task(request(model))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                metrics.inc("agent_model_hedges_total", backend=self.name)
+                tasks.append(asyncio.create_task(request(model)))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            metrics.inc("agent_model_hedge_wins_total", backend=self.name,
+                                        winner="hedge" if task is tasks[1] else "original")
+                        return task.result()
+                    error = task.exception()
+                if not pending and error is not None:
+                    raise error
+            raise asyncio.TimeoutError()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _call_fallback(self, request: Callable[[str], Awaitable[T]]) -> T:
+        """Serve a request while the circuit is open"""
+        if not self.fallback_model:
+            metrics.inc("agent_circuit_rejected_total", circuit=self.breaker.name)
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        metrics.inc("agent_model_fallbacks_total", backend=self.name, model=self.fallback_model)
+        return await asyncio.wait_for(request(self.fallback_model), self.timeout)
+
+    def collect_metrics(self) -> List[Sample]:
+        """Circuit state for the metrics export (0 closed, 1 half-open, 2 open)"""
+        state = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}[self.breaker.state]
+        samples = [("agent_circuit_state", "gauge", {"circuit": self.breaker.name}, state)]
+        delay = self.hedge_delay()
+        if delay is not None:
+            samples.append(("agent_model_hedge_delay_seconds", "gauge", {"backend": self.name}, delay))
+        return samples
@@ -0,0 +1,146 @@
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from .ttl_cache import TTLCache
+
+_WORD_RE = re.compile(r"\w+")
+
+# Fingerprint of the shared tier, and what stands in for the asker's name in its replies
+_SHARED = "*"
+_USER_PLACEHOLDER = "\x00user\x00"
+
+def normalize_message(message: str) -> str:
+    """Lowercase a message and reduce it to its words, so casing, spacing and punctuation don't matter"""
+    return " ".join(_WORD_RE.findall(message.lower()))
+
+def context_fingerprint(username: str, context: str) -> str:
+    """Short stable hash of everything besides the message that shapes a reply"""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(username.encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(context.encode('utf-8'))
+    return digest.hexdigest()
+
+class ResponseCache:
+    """
+    Cache of generated replies keyed on normalized message plus context fingerprint.
+
+    Two tiers share one store. Common prompts listed in shared_prompts
+    ("hello", "what can you do") are keyed on the message alone, so one reply
+    serves every user and every repeat; the asker's name in such a reply is
+    swapped for the current asker's on the way out. Because the reply reaches
+    other users, it must be generated without the asker's context, and put()
+    refuses a shared prompt cached with a non-empty one.
+
+    Every other prompt is keyed on the user and their remembered context.
+    That context grows with each turn, so this tier only answers a prompt
+    repeated before the previous turn was remembered (a double-sent message,
+    a retried batch); the savings on common traffic come from the shared tier.
+
+    Exact matches are a dict lookup. With near_duplicates enabled, a miss also
+    compares the message's word set against recent messages cached for the
+    same fingerprint and reuses a reply whose Jaccard similarity is at least
+    the threshold.
+    """
+
+    def __init__(self, max_size: int = 2000, ttl: float = 600.0, near_duplicates: bool = False,
+                 near_duplicate_threshold: float = 0.8, near_duplicate_candidates: int = 32,
+                 shared_prompts: Iterable[str] = ()):
+        """
+        Args:
+            max_size: Maximum cached replies
+            ttl: Seconds a reply stays valid
+            near_duplicates: Whether to fall back to similar (not just identical) messages
+            near_duplicate_threshold: Minimum Jaccard similarity for a near-duplicate hit
+            near_duplicate_candidates: Recent messages compared per fingerprint
+            shared_prompts: Messages answered the same for everyone (normalized on the way in)
+        """
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self.shared_prompts = {normalize_message(prompt) for prompt in shared_prompts}
+        self.near_duplicates = near_duplicates
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.near_duplicate_candidates = near_duplicate_candidates
+
+        # fingerprint -> OrderedDict(normalized message -> word set), most recent last
+        self._recent_by_fingerprint = {}
+        self.near_duplicate_hits = 0
+        self.shared_hits = 0
+
+    def is_shared(self, message: str) -> bool:
+        """Whether a message is answered from the shared tier (and so must be generated without context)"""
+        return normalize_message(message) in self.shared_prompts
+
+    def _fingerprint(self, normalized: str, context: str, username: str) -> str:
+        """Cache tier for a message: shared for common prompts, otherwise per user and context"""
+        if normalized in self.shared_prompts:
+            return _SHARED
+        return context_fingerprint(username, context)
+
+    def get(self, message: str, context: str = "", username: str = "") -> Optional[str]:
+        """Return a cached reply for this message and context, or None"""
+        normalized = normalize_message(message)
+        fingerprint = self._fingerprint(normalized, context, username)
+
+        reply = self._cache.get((fingerprint, normalized))
+        if fingerprint == _SHARED:
+            if reply is None:
+                return None
+            self.shared_hits += 1
+            return reply.replace(_USER_PLACEHOLDER, username or "there")
+        if reply is not None or not self.near_duplicates:
+            return reply
+
+        words = set(normalized.split())
+        if not words:
+            return None
+
+        best_key, best_score = None, 0.0
+        for candidate, candidate_words in self._recent_by_fingerprint.get(fingerprint, {}).items():
+            score = len(words & candidate_words) / len(words | candidate_words)
+            if score > best_score:
+                best_key, best_score = candidate, score
+
+        if best_key is not None and best_score >= self.near_duplicate_threshold:
+            reply = self._cache.peek((fingerprint, best_key))
+            if reply is not None:
+                self.near_duplicate_hits += 1
+                return reply
+
+        return None
+
+    def put(self, message: str, reply: str, context: str = "", username: str = ""):
+        """Cache a reply for this message and context"""
+        normalized = normalize_message(message)
+        fingerprint = self._fingerprint(normalized, context, username)
+        if fingerprint == _SHARED:
+            # Served to everyone, so it must not draw on this user's history
+            if context:
+                return
+            # "Hi alice!" must not be served to bob as is
+            if username:
+                reply = re.sub(rf"(?<!\w){re.escape(username)}(?!\w)", _USER_PLACEHOLDER, reply)
+            self._cache.put((fingerprint, normalized), reply)
+            return
+
+        self._cache.put((fingerprint, normalized), reply)
+
+        if self.near_duplicates:
+            recent = self._recent_by_fingerprint.setdefault(fingerprint, OrderedDict())
+            recent[normalized] = set(normalized.split())
+            recent.move_to_end(normalized)
+            while len(recent) > self.near_duplicate_candidates:
+                recent.popitem(last=False)
+
+            # Keep the side index from outliving the cache itself
+            if len(self._recent_by_fingerprint) > self._cache.max_size:
+                self._recent_by_fingerprint.pop(next(iter(self._recent_by_fingerprint)))
+
+    def stats(self) -> Dict:
+        """Get cache counters"""
+        return {
+            **self._cache.stats(),
+            "near_duplicate_hits": self.near_duplicate_hits,
+            "shared_hits": self.shared_hits
+        }
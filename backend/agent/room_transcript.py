@@ -0,0 +1,137 @@
+import re
+import time
+from array import array
+from typing import Iterator, List, Optional, Tuple
+from .config import Config
+from .wire import decode, encode
+
+_WORD_RE = re.compile(r"\w+")
+
+class RoomTranscript:
+    """
+    Fixed-capacity ring buffer of a room's recent chat packets.
+
+    Recording is a few slot assignments on the data_received path: packets
+    are kept as the raw bytes they arrived as and only decoded when a prompt
+    needs room context. Memory per room is bounded by capacity * max_bytes.
+    """
+
+    __slots__ = ("capacity", "max_bytes", "_payloads", "_senders", "_times", "_next")
+
+    def __init__(self, capacity: int = 200, max_bytes: int = 2048):
+        """
+        Args:
+            capacity: Messages kept; the oldest is overwritten first
+            max_bytes: Larger packets are trimmed to this size when recorded
+        """
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._payloads: List[Optional[bytes]] = [None] * capacity
+        self._senders: List[Optional[str]] = [None] * capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._next = 0  # Messages ever recorded; the next slot is _next % capacity
+
+    def record(self, data: bytes, sender: Optional[str] = None):
+        """
+        Keep a raw chat packet
+
+        Args:
+            data: Packet bytes as received (JSON with a "text" field)
+            sender: Participant identity, if known
+        """
+        if len(data) > self.max_bytes:
+            data = self._trim(data)
+            if data is None:
+                return
+
+        slot = self._next % self.capacity
+        self._payloads[slot] = data
+        self._senders[slot] = sender
+        self._times[slot] = time.time()
+        self._next += 1
+
+    def record_text(self, sender: str, text: str):
+        """Keep a message that did not arrive as a packet (the agent's own replies)"""
+        self.record(encode({"text": text}), sender)
+
+    def __len__(self) -> int:
+        return min(self._next, self.capacity)
+
+    def lines(self, max_age: Optional[float] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Decode kept messages, newest first
+
+        Args:
+            max_age: Stop at messages older than this many seconds
+
+        Yields:
+            (sender, text) pairs; undecodable or empty packets are skipped
+        """
+        now = time.time()
+        for back in range(len(self)):
+            slot = (self._next - 1 - back) % self.capacity
+            if max_age is not None and now - self._times[slot] > max_age:
+                return
+            try:
+                message = decode(self._payloads[slot])
+                text = message.get("text")
+            except (ValueError, AttributeError):
+                continue
+            if text:
+                yield self._senders[slot] or message.get("sender") or "unknown", text
+
+    def context_for(self, username: str, message: str, max_lines: int = 12,
+                    max_chars: int = 1500, max_age: Optional[float] = 900) -> str:
+        """
+        Recent room chat to include in a prompt
+
+        The newest max_lines messages are taken, plus up to max_lines older
+        ones from participants named in the message, so "what did Sam say?"
+        finds Sam even after others kept chatting. The asker's own mentions
+        of the agent (the turn being answered) are left out.
+
+        Args:
+            username: User being answered
+            message: Their message, used to find named participants
+            max_lines: Most recent lines to include (and older named lines on top)
+            max_chars: Character budget for the whole block
+            max_age: Ignore messages older than this many seconds
+
+        Returns:
+            "sender: text" lines, oldest first, or an empty string
+        """
+        named = {word.lower() for word in _WORD_RE.findall(message)}
+        trigger = Config.AGENT_TRIGGER.lower()
+
+        picked = []  # newest first
+        chars = 0
+        recent = older = 0
+        for sender, text in self.lines(max_age):
+            if sender == username and trigger in text.lower():
+                continue
+
+            if recent < max_lines:
+                recent += 1
+            elif older < max_lines and named & {word.lower() for word in _WORD_RE.findall(sender)}:
+                older += 1
+            elif older >= max_lines:
+                break
+            else:
+                continue
+
+            line = f"{sender}: {' '.join(text.split())[:300]}"
+            chars += len(line) + 1
+            if chars > max_chars:
+                break
+            picked.append(line)
+
+        return "\n".join(reversed(picked))
+
+    def _trim(self, data: bytes) -> Optional[bytes]:
+        """Re-encode an oversized packet with its text shortened (rare, so the decode is fine)"""
+        try:
+            message = decode(data)
+            text = str(message.get("text", ""))[:self.max_bytes // 2]
+            return encode({"text": text, "sender": message.get("sender")})
+        except (ValueError, AttributeError):
+            return None
@@ -0,0 +1,115 @@
+import logging
+import multiprocessing.util
+import os
+import threading
+import time
+from typing import List, Optional
+from .config import Config
+from .gemini_service import GeminiService
+from .memory_service import MemoryService
+from .metrics import Sample, metrics
+
+logger = logging.getLogger(__name__)
+
+class Services:
+    """
+    Process-wide service clients shared by every room the worker handles.
+
+    One Gemini client (and its HTTP connection pool), one mem0 client, one
+    local store and one set of caches per process, instead of one per room.
+    """
+
+    def __init__(self):
+        self.gemini = GeminiService()
+        self.memory = MemoryService()
+        self.memory.summarizer = self.gemini.summarize_history
+        metrics.add_collector(self.collect_metrics)
+    
+    def collect_metrics(self) -> List[Sample]:
+        """Cache, queue and storage figures for the metrics export"""
+        samples = []
+        caches = {"context": self.memory.get_cache_stats()}
+        if self.gemini.response_cache:
+            caches["response"] = self.gemini.response_cache.stats()
+        for cache, stats in caches.items():
+            samples += [
+                ("agent_cache_entries", "gauge", {"cache": cache}, stats["size"]),
+                ("agent_cache_lookups_total", "counter", {"cache": cache, "result": "hit"}, stats["hits"]),
+                ("agent_cache_lookups_total", "counter", {"cache": cache, "result": "miss"}, stats["misses"]),
+                ("agent_cache_evictions_total", "counter", {"cache": cache}, stats["evictions"] + stats["expirations"])
+            ]
+        samples += [
+            ("agent_write_queue_depth", "gauge", {}, self.memory.write_queue_depth),
+            ("agent_saved_conversations_total", "counter", {}, self.memory.saved_conversations),
+            ("agent_mem0_timeouts_total", "counter", {}, self.memory.mem0_timeouts),
+            ("agent_summaries_written_total", "counter", {}, self.memory.summaries_written)
+        ]
+        return samples
+
+    def warm_up(self):
+        """
+        Import the SDKs and create the Gemini and mem0 clients on a background
+        thread, so the first message does not pay for them and the worker
+        does not wait for them before registering.
+        """
+        def run():
+            started = time.perf_counter()
+            try:
+                self.gemini.client
+                if self.memory.use_mem0:
+                    self.memory.get_memory_client()
+                logger.info(f"Service clients warmed up in {(time.perf_counter() - started) * 1000:.0f}ms")
+            except Exception as e:
+                logger.warning(f"Service warm-up failed: {e}")
+        
+        threading.Thread(target=run, name="services-warm-up", daemon=True).start()
+    
+    async def aclose(self):
+        """Flush pending work and release every client"""
+        await self.memory.aclose()
+        await self.gemini.aclose()
+
+    def close(self):
+        """Synchronous best-effort release, for process exit"""
+        self.memory.close()
+        self.gemini.close()
+
+_services: Optional[Services] = None
+_services_pid = None
+_services_finalizer: Optional[multiprocessing.util.Finalize] = None
+
+def get_services() -> Services:
+    """Get the process-wide services, creating them on first use"""
+    global _services, _services_pid, _services_finalizer
+    # Never reuse clients (sockets, SQLite handles) inherited across a fork
+    if _services is None or _services_pid != os.getpid():
+        _services = Services()
+        _services_pid = os.getpid()
+        # Released when the process exits, not when a job ends: the services
+        # outlive jobs. LiveKit job processes are multiprocessing children,
+        # which skip atexit handlers; multiprocessing's exit hook runs there
+        # (and from atexit in the main process)
+        _services_finalizer = multiprocessing.util.Finalize(None, _services.close, exitpriority=10)
+        logger.info("Shared services created")
+    return _services
+
+async def close_services():
+    """Close the process-wide services if they were created"""
+    global _services, _services_finalizer
+    if _services is not None:
+        _services_finalizer.cancel()
+        _services_finalizer = None
+        await _services.aclose()
+        _services = None
+
+def prewarm(proc):
+    """
+    LiveKit prewarm hook: build the shared services once per worker process,
+    before any job is assigned, so joining a room does not pay for it.
+    """
+    started = time.perf_counter()
+    services = get_services()
+    if Config.PREWARM_CLIENTS:
+        services.warm_up()
+    proc.userdata["services"] = services
+    logger.info(f"⏱️ Worker process prewarmed in {(time.perf_counter() - started) * 1000:.0f}ms")
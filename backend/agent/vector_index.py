@@ -0,0 +1,148 @@
+import importlib.util
+import re
+import zlib
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
+
+# numpy is imported by the functions that use it, so importing this module
+# (and the agent's services) does not pay for it until the first index is built
+if TYPE_CHECKING:
+    import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from have how i i'm is it it's me my
+of on or so that the this to was what when where which who why with you your
+""".split())
+
+def embed(text: str, dim: int) -> "np.ndarray":
+    """
+    Hash a text into a unit-length bag-of-words vector
+
+    Unigrams and bigrams are mapped to dim buckets with a signed hash, so no
+    vocabulary or model has to be trained or downloaded.
+
+    Args:
+        text: Text to embed
+        dim: Vector dimension
+
+    Returns:
+        float32 vector of shape (dim,)
+    """
+    import numpy as np
+
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    for feature in features:
+        h = zlib.crc32(feature.encode('utf-8'))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+class ConversationIndex:
+    """
+    In-memory cosine-similarity index over one user's conversations.
+
+    Vectors live in a single preallocated NumPy matrix, so a query is one
+    matrix-vector product plus a partial sort.
+    """
+
+    available = importlib.util.find_spec("numpy") is not None
+
+    def __init__(self, dim: int = 256, max_items: int = 5000):
+        """
+        Args:
+            dim: Embedding dimension
+            max_items: Conversations kept; the oldest are dropped beyond this
+        """
+        import numpy as np
+
+        self.dim = dim
+        self.max_items = max_items
+        self._vectors = np.zeros((16, dim), dtype=np.float32)
+        self._items = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, conversation: Dict):
+        """Index a single conversation turn"""
+        self.add_many([conversation])
+
+    def add_many(self, conversations: Iterable[Dict]):
+        """Index several conversation turns, oldest first"""
+        conversations = list(conversations)
+        if not conversations:
+            return
+
+        needed = len(self._items) + len(conversations)
+        if needed > self._vectors.shape[0]:
+            import numpy as np
+
+            capacity = self._vectors.shape[0]
+            while capacity < needed:
+                capacity *= 2
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:len(self._items)] = self._vectors[:len(self._items)]
+            self._vectors = grown
+
+        start = len(self._items)
+        for offset, conversation in enumerate(conversations):
+            self._vectors[start + offset] = embed(
+                f"{conversation['user_message']} {conversation['ai_response']}", self.dim
+            )
+        self._items.extend(conversations)
+
+        # Trim in bulk once well past the limit so appends stay amortized O(1)
+        if len(self._items) > self.max_items * 2:
+            drop = len(self._items) - self.max_items
+            self._vectors[:self.max_items] = self._vectors[drop:len(self._items)]
+            del self._items[:drop]
+
+    def search(self, query: str, k: int, min_score: float = 0.0, exclude: Iterable[Dict] = ()) -> List[Tuple[float, Dict]]:
+        """
+        Find the conversations most similar to a query
+
+        Args:
+            query: Text to search for
+            k: Maximum number of results
+            min_score: Minimum cosine similarity to include
+            exclude: Conversations (by identity) to leave out, e.g. ones already in context
+
+        Returns:
+            List of (score, conversation) pairs, best first
+        """
+        import numpy as np
+
+        count = len(self._items)
+        if count == 0 or k <= 0:
+            return []
+
+        excluded = {id(conversation) for conversation in exclude}
+        scores = self._vectors[:count] @ embed(query, self.dim)
+
+        wanted = min(count, k + len(excluded))
+        if wanted < count:
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            score = float(scores[i])
+            if score < min_score:
+                break
+            conversation = self._items[i]
+            if id(conversation) in excluded:
+                continue
+            results.append((score, conversation))
+            if len(results) == k:
+                break
+
+        return results
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from .metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Newest envelope this agent speaks. Version 1 adds "batch" packets; clients
+# announce theirs with a {"type": "hello", "v": N} packet on WIRE_TOPIC
+WIRE_VERSION = 1
+WIRE_TOPIC = "wire"
+
+_BATCH_PREFIX = b'{"v":1,"type":"batch","messages":['
+_BATCH_SUFFIX = b']}'
+
+def encode(message: Dict) -> bytes:
+    """Serialize a packet (orjson when installed, compact stdlib JSON otherwise)"""
+    if orjson is not None:
+        return orjson.dumps(message)
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+def decode(data: bytes) -> Any:
+    """
+    Parse a packet
+
+    Raises:
+        json.JSONDecodeError: If the payload is not valid JSON (orjson's error is a subclass)
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def split_message(message: Dict, max_bytes: int) -> List[Dict]:
+    """
+    Split a message too large for one packet into stream chunks
+
+    The pieces use the streaming protocol the frontend already renders
+    (same id, stream="delta", then stream="end" for a whole message), so no
+    reassembly logic is needed on the other side.
+
+    Args:
+        message: Packet dict with a "text" field
+        max_bytes: Largest encoded packet allowed
+
+    Returns:
+        The message itself if it fits, otherwise its chunks in order
+    """
+    if not message.get("text") or len(encode(message)) <= max_bytes:
+        return [message]
+
+    chunk = dict(message, id=message.get("id") or uuid.uuid4().hex, stream="delta")
+    parts = [dict(chunk, text=text) for text in _split_text(chunk, message["text"], max_bytes)]
+    if message.get("stream") is None:
+        parts.append(dict(chunk, text="", stream="end"))
+    return parts
+
+def _split_text(template: Dict, text: str, max_bytes: int) -> List[str]:
+    """Halve text (at a space when there is one nearby) until every piece's packet fits"""
+    if len(text) <= 1 or len(encode(dict(template, text=text))) <= max_bytes:
+        return [text]
+
+    middle = len(text) // 2
+    cut = text.rfind(" ", middle // 2, middle) + 1 or middle
+    return _split_text(template, text[:cut], max_bytes) + _split_text(template, text[cut:], max_bytes)
+
+class Outbox:
+    """
+    Ordered outbound packet queue for one room.
+
+    send() encodes and queues a message and returns at once; a single
+    flusher task publishes in order. Messages queued within `window` of each
+    other (a reply right behind a welcome, stream chunks of concurrent
+    replies) go out as one {"v": 1, "type": "batch", "messages": [...]}
+    packet when can_batch() says every participant understands it, up to
+    max_bytes per packet. Oversized messages are split into stream chunks.
+    """
+
+    def __init__(self, publish: Callable[[bytes], Awaitable[None]], max_bytes: int = 14000,
+                 window: float = 0.01, can_batch: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            publish: Sends one packet to the room
+            max_bytes: Largest packet published
+            window: Seconds to wait for more messages before flushing
+            can_batch: Whether batch packets may be sent right now
+        """
+        self._publish = publish
+        self.max_bytes = max_bytes
+        self.window = window
+        self._can_batch = can_batch or (lambda: False)
+        self._pending: Deque[bytes] = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def send(self, message: Dict):
+        """Queue a message for publishing (must be called from the event loop)"""
+        for part in split_message(message, self.max_bytes):
+            self._pending.append(encode(part))
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def flush(self):
+        """Wait until everything queued so far has been published"""
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+    async def _run(self):
+        await asyncio.sleep(self.window)
+        while self._pending:
+            packet, count = self._take(self._can_batch())
+            metrics.inc("agent_wire_packets_total", kind="batch" if count > 1 else "single")
+            metrics.inc("agent_wire_messages_total", count)
+            try:
+                with metrics.stage("publish"):
+                    await self._publish(packet)
+            except Exception as e:
+                metrics.error("publish")
+                logger.error(f"Error publishing {count} message(s): {e}")
+
+    def _take(self, batch: bool):
+        """Pop the next packet: one message, or as many as fit in a batch"""
+        first = self._pending.popleft()
+        if not batch or not self._pending:
+            return first, 1
+
+        items = [first]
+        size = len(_BATCH_PREFIX) + len(first) + len(_BATCH_SUFFIX)
+        while self._pending and size + len(self._pending[0]) + 1 <= self.max_bytes:
+            size += len(self._pending[0]) + 1
+            items.append(self._pending.popleft())
+
+        if len(items) == 1:
+            return first, 1
+        return _BATCH_PREFIX + b",".join(items) + _BATCH_SUFFIX, len(items)
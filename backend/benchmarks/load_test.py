@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the message pipeline
+
+Runs real ChatAgent sessions against in-process stand-ins: a fake LiveKit
+room (publish_data is captured, DataPackets are synthesized), a stub Gemini
+client with configurable latency and jitter, and a stub mem0 MemoryClient.
+Many simulated participants across many rooms send chat traffic, a fraction
+of which mentions the agent, and the harness reports throughput and
+end-to-end latency percentiles from packet arrival to the published reply.
+
+Nothing leaves the process: no LiveKit server, API keys or network needed
+(the backend's Python dependencies must be installed).
+
+Usage:
+    python benchmarks/load_test.py [--rooms 10] [--users 20] [--messages 20]
+        [--model-latency 0.6] [--jitter 0.3] [--mem0-latency 0.05] [--no-stream]
+"""
+
+import argparse
+import asyncio
+import importlib.machinery
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agent.config import Config
+
+WORDS = "hey did anyone see the game last night lol yes no maybe later lunch pizza meeting deploy".split()
+
+# Every mention carries a unique marker; the stub model echoes the markers of
+# the messages it is asked to answer, which is how a published reply is
+# matched to them. Markers in remembered or room context (other users'
+# mentions, possibly unanswered) must not be echoed
+_MARKER_RE = re.compile(r"msg-(\d+)")
+_BATCH_SECTION_RE = re.compile(r"### Message (\d+)")
+_CURRENT_MESSAGE = "Current message"
+_BATCH_MESSAGE = "\nMessage: "
+
+def _prompt_text(contents) -> str:
+    """Flatten whatever the service passes as contents into searchable text"""
+    if isinstance(contents, str):
+        return contents
+    return "\n\n".join(
+        part.get("text", "") for content in contents for part in content.get("parts", [])
+    )
+
+def _current_message(prompt: str) -> str:
+    """The part of a single-reply prompt holding the message being answered"""
+    start = prompt.rfind(_CURRENT_MESSAGE)
+    return prompt[start:] if start >= 0 else ""
+
+def _usage(prompt: str, reply: str):
+    return types.SimpleNamespace(
+        prompt_token_count=len(prompt) // 4,
+        candidates_token_count=len(reply) // 4,
+        cached_content_token_count=None
+    )
+
+class StubModels:
+    """Stand-in for genai.Client().aio.models with simulated latency"""
+
+    def __init__(self, latency: float, jitter: float, chunks: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunks = chunks
+        self.calls = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def _reply(self, prompt: str) -> str:
+        markers = sorted(set(_MARKER_RE.findall(prompt)), key=int)
+        return " ".join(f"msg-{m}" for m in markers) + " Sure, happy to help with that!"
+
+    async def generate_content(self, model: str, contents, config=None):
+        self.calls += 1
+        prompt = _prompt_text(contents)
+        await asyncio.sleep(self._delay())
+
+        if getattr(config, "response_mime_type", None) == "application/json":
+            # Batched call: answer every "### Message i" section separately
+            sections = _BATCH_SECTION_RE.split(prompt)[1:]
+            items = [
+                {"index": int(index), "reply": self._reply(body.rpartition(_BATCH_MESSAGE)[2])}
+                for index, body in zip(sections[::2], sections[1::2])
+            ]
+            text = json.dumps(items)
+        else:
+            text = self._reply(_current_message(prompt))
+        return types.SimpleNamespace(text=text, usage_metadata=_usage(prompt, text))
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        self.calls += 1
+        prompt = _prompt_text(contents)
+        reply = self._reply(_current_message(prompt))
+        words = reply.split(" ")
+        step = max(1, -(-len(words) // self.chunks))
+        total = self._delay()
+
+        async def stream():
+            # Time to first token is ~40% of the call, the rest spreads over the chunks
+            await asyncio.sleep(total * 0.4)
+            for i in range(0, len(words), step):
+                if i:
+                    await asyncio.sleep(total * 0.6 / self.chunks)
+                text = " ".join(words[i:i + step]) + ("" if i + step >= len(words) else " ")
+                last = i + step >= len(words)
+                yield types.SimpleNamespace(text=text, usage_metadata=_usage(prompt, reply) if last else None)
+        return stream()
+
+class StubGenaiClient:
+    """Stand-in for genai.Client: only the async surface the agent uses"""
+
+    def __init__(self, latency: float, jitter: float, chunks: int = 4):
+        self.aio = types.SimpleNamespace(models=StubModels(latency, jitter, chunks))
+
+class StubMemoryClient:
+    """Stand-in for mem0's blocking MemoryClient, kept in a dict"""
+
+    latency = 0.05
+
+    def __init__(self, api_key: str = ""):
+        self._memories: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+
+    def search(self, query: str, user_id: str, limit: int = 5) -> List[Dict]:
+        time.sleep(self.latency)
+        with self._lock:
+            return list(self._memories.get(user_id, [])[-limit:])
+
+    def add(self, messages: List[Dict], user_id: str, metadata: Optional[Dict] = None):
+        time.sleep(self.latency)
+        with self._lock:
+            self._memories.setdefault(user_id, []).extend(
+                {"memory": m["content"]} for m in messages if m["role"] == "user"
+            )
+
+def install_stub_mem0(latency: float):
+    """Make `from mem0 import MemoryClient` resolve to the stub"""
+    module = types.ModuleType("mem0")
+    module.__spec__ = importlib.machinery.ModuleSpec("mem0", None)
+    StubMemoryClient.latency = latency
+    module.MemoryClient = StubMemoryClient
+    sys.modules["mem0"] = module
+
+class LoadStats:
+    """Send/receive timestamps per marker"""
+
+    def __init__(self):
+        self.next_marker = 0
+        self.sent_at: Dict[str, float] = {}
+        self.first_token_at: Dict[str, float] = {}
+        self.answered_at: Dict[str, float] = {}
+        self.packets_sent = 0
+        self.packets_published = 0
+        self.batched_packets = 0
+
+    def new_marker(self) -> str:
+        self.next_marker += 1
+        marker = f"msg-{self.next_marker}"
+        self.sent_at[marker] = time.perf_counter()
+        return marker
+
+    def first_token(self, markers: List[str], at: Optional[float] = None):
+        at = at or time.perf_counter()
+        for marker in markers:
+            if marker in self.sent_at:
+                self.first_token_at.setdefault(marker, at)
+
+    def answered(self, markers: List[str]):
+        now = time.perf_counter()
+        for marker in markers:
+            if marker in self.sent_at:
+                self.answered_at.setdefault(marker, now)
+
+class FakeParticipant:
+    def __init__(self, identity: str):
+        self.identity = identity
+
+class FakeDataPacket:
+    __slots__ = ("data", "participant", "topic")
+
+    def __init__(self, data: bytes, participant: FakeParticipant, topic: Optional[str] = None):
+        self.data = data
+        self.participant = participant
+        self.topic = topic
+
+class FakeLocalParticipant:
+    """Captures everything the agent publishes and matches replies to messages"""
+
+    def __init__(self, stats: LoadStats, publish_latency: float):
+        self.stats = stats
+        self.publish_latency = publish_latency
+        self._streams: Dict[str, tuple] = {}  # message id -> (first delta time, markers seen so far)
+
+    async def publish_data(self, payload: bytes, reliable: bool = True, **kwargs):
+        if self.publish_latency:
+            await asyncio.sleep(self.publish_latency)
+        self.stats.packets_published += 1
+
+        message = json.loads(payload)
+        if message.get("type") == "batch":
+            self.stats.batched_packets += 1
+            for inner in message["messages"]:
+                self._match(inner)
+        else:
+            self._match(message)
+
+    def _match(self, message: Dict):
+        markers = [f"msg-{m}" for m in _MARKER_RE.findall(message.get("text", ""))]
+        stream = message.get("stream")
+        if stream == "delta":
+            # A marker can arrive in any chunk; its first token is the stream's first delta
+            first_at, seen = self._streams.setdefault(message["id"], (time.perf_counter(), []))
+            seen.extend(markers)
+        elif stream == "end":
+            first_at, seen = self._streams.pop(message["id"], (None, []))
+            self.stats.first_token(seen, first_at)
+            self.stats.answered(seen)
+        else:
+            self.stats.first_token(markers)
+            self.stats.answered(markers)
+
+class FakeRoom:
+    """The slice of rtc.Room the agent touches: name, participants, events, publishing"""
+
+    def __init__(self, name: str, stats: LoadStats, publish_latency: float):
+        self.name = name
+        self.remote_participants: Dict[str, FakeParticipant] = {}
+        self.local_participant = FakeLocalParticipant(stats, publish_latency)
+        self._handlers: Dict[str, List] = {}
+
+    def on(self, event: str):
+        def register(handler):
+            self._handlers.setdefault(event, []).append(handler)
+            return handler
+        return register
+
+    def emit(self, event: str, *args):
+        for handler in self._handlers.get(event, []):
+            handler(*args)
+
+class FakeJobContext:
+    def __init__(self, room: FakeRoom):
+        self.room = room
+        self.connected = asyncio.Event()
+
+    async def connect(self, **kwargs):
+        self.connected.set()
+
+async def simulate_user(room: FakeRoom, participant: FakeParticipant, stats: LoadStats, args):
+    """Send chat traffic for one participant; a fraction of it mentions the agent"""
+    for _ in range(args.messages):
+        await asyncio.sleep(random.expovariate(1 / args.think_time))
+        text = " ".join(random.choices(WORDS, k=random.randint(3, 15)))
+        if random.random() < args.mention_ratio:
+            text = f"{Config.AGENT_TRIGGER} {text} {stats.new_marker()}"
+        payload = json.dumps({"text": text, "sender": participant.identity, "isAI": False}).encode('utf-8')
+        stats.packets_sent += 1
+        room.emit("data_received", FakeDataPacket(payload, participant), participant)
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+async def run(args) -> int:
+    # Imported here so Config overrides and the stub mem0 are in place first
+    from agent.chat_agent import ChatAgent
+    from agent.metrics import metrics
+    from agent.services import close_services, get_services
+    from agent.wire import WIRE_TOPIC, WIRE_VERSION
+
+    services = get_services()
+    services.gemini._client = StubGenaiClient(args.model_latency, args.jitter)
+
+    stats = LoadStats()
+    rooms, agents, sessions = [], [], []
+    for r in range(args.rooms):
+        room = FakeRoom(f"load-room-{r}", stats, args.publish_latency)
+        ctx = FakeJobContext(room)
+        agent = ChatAgent(services)
+        sessions.append(asyncio.create_task(agent.start_session(ctx)))
+        await ctx.connected.wait()
+        rooms.append(room)
+        agents.append(agent)
+
+    # Everyone joins (exercising prefetch), then starts chatting
+    users = []
+    for room in rooms:
+        for u in range(args.users):
+            participant = FakeParticipant(f"{room.name}-user-{u}")
+            room.remote_participants[participant.identity] = participant
+            room.emit("participant_connected", participant)
+            if not args.legacy_clients:
+                hello = json.dumps({"type": "hello", "v": WIRE_VERSION}).encode('utf-8')
+                room.emit("data_received", FakeDataPacket(hello, participant, WIRE_TOPIC), participant)
+            users.append(simulate_user(room, participant, stats, args))
+
+    started = time.perf_counter()
+    await asyncio.gather(*users)
+    sending_done = time.perf_counter()
+
+    # Wait until every mention is answered or was turned away by admission control
+    deadline = sending_done + args.drain_timeout
+    while time.perf_counter() < deadline:
+        rejected = sum(a.admission.rate_limited + a.admission.dropped for a in agents)
+        if len(stats.answered_at) + rejected >= len(stats.sent_at):
+            break
+        await asyncio.sleep(0.02)
+    finished = time.perf_counter()
+
+    for session in sessions:
+        session.cancel()
+    await asyncio.gather(*sessions, return_exceptions=True)
+    await close_services()
+
+    latencies = [stats.answered_at[m] - stats.sent_at[m] for m in stats.answered_at]
+    ttfts = [stats.first_token_at[m] - stats.sent_at[m] for m in stats.first_token_at]
+    admission = {}
+    for agent in agents:
+        for key, value in agent.admission.stats().items():
+            admission[key] = admission.get(key, 0) + value
+    elapsed = finished - started
+
+    print(f"rooms: {args.rooms}, users/room: {args.users}, packets/user: {args.messages}, "
+          f"mention ratio: {args.mention_ratio:.0%}, streaming: {Config.STREAM_RESPONSES}, "
+          f"micro-batching: {Config.MICRO_BATCHING}")
+    print(f"stub model latency: {args.model_latency * 1000:.0f}ms ±{args.jitter * 1000:.0f}ms, "
+          f"stub mem0 latency: {args.mem0_latency * 1000:.0f}ms")
+    print("-" * 60)
+    print(f"packets sent:        {stats.packets_sent} ({stats.packets_sent / (sending_done - started):.0f}/s)")
+    print(f"mentions:            {len(stats.sent_at)}")
+    print(f"answered:            {len(latencies)} ({len(latencies) / elapsed:.1f}/s over {elapsed:.1f}s)")
+    print(f"unanswered:          {len(stats.sent_at) - len(latencies)} "
+          f"(rate limited {admission.get('rate_limited', 0)}, dropped {admission.get('dropped', 0)})")
+    print(f"coalesced / batches: {admission.get('coalesced', 0)} / {admission.get('batches', 0)}")
+    print(f"model calls:         {services.gemini._client.aio.models.calls} ("
+          + ", ".join(f"{name} {route['calls']}" for name, route in services.gemini.router.stats().items()) + ")")
+    print(f"packets published:   {stats.packets_published} ({stats.batched_packets} batched)")
+    print(f"end-to-end latency:  p50 {percentile(latencies, 0.5) * 1000:.0f}ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:.0f}ms  p99 {percentile(latencies, 0.99) * 1000:.0f}ms")
+    if Config.STREAM_RESPONSES:
+        print(f"first token:         p50 {percentile(ttfts, 0.5) * 1000:.0f}ms  "
+              f"p95 {percentile(ttfts, 0.95) * 1000:.0f}ms  p99 {percentile(ttfts, 0.99) * 1000:.0f}ms")
+    print("-" * 60)
+    print(f"stages: {metrics.summary()}")
+
+    return 0 if latencies or not stats.sent_at else 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20, help="participants per room")
+    parser.add_argument("--messages", type=int, default=20, help="packets sent by each participant")
+    parser.add_argument("--mention-ratio", type=float, default=0.2, help="fraction of packets that mention the agent")
+    parser.add_argument("--think-time", type=float, default=2.0, help="mean seconds between a participant's packets")
+    parser.add_argument("--model-latency", type=float, default=0.6, help="stub Gemini seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.3, help="uniform ± jitter on the model latency")
+    parser.add_argument("--mem0-latency", type=float, default=0.05, help="stub mem0 seconds per call")
+    parser.add_argument("--no-mem0", action="store_true", help="use the local store only")
+    parser.add_argument("--publish-latency", type=float, default=0.0, help="seconds per publish_data call")
+    parser.add_argument("--no-stream", action="store_true", help="publish whole replies instead of streaming")
+    parser.add_argument("--micro-batching", action="store_true", help="answer concurrent mentions in one call")
+    parser.add_argument("--legacy-clients", action="store_true", help="participants never announce wire v1 (no batch packets)")
+    parser.add_argument("--drain-timeout", type=float, default=15.0, help="seconds to wait for outstanding replies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the agent's own logging")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    # Isolated storage and stand-in backends; nothing touches the real store or network
+    workdir = tempfile.mkdtemp(prefix="agent-load-")
+    Config.MEMORY_DB_PATH = os.path.join(workdir, "memory.db")
+    Config.MEMORY_JSON_PATH = os.path.join(workdir, "missing.json")
+    Config.GEMINI_API_KEY = "load-test"
+    Config.MEM0_API_KEY = None if args.no_mem0 else "load-test"
+    Config.STREAM_RESPONSES = not args.no_stream
+    Config.MICRO_BATCHING = args.micro_batching
+    Config.METRICS_PORT = 0
+    Config.METRICS_LOG_INTERVAL = 0
+    if not args.no_mem0:
+        install_stub_mem0(args.mem0_latency)
+
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the data_received hot path
+
+Compares the per-packet cost of the original handling (UTF-8 decode,
+json.loads and the trigger-debug f-strings) against the raw-bytes trigger
+scan that now runs before anything else.
+
+Usage:
+    python benchmarks/prefilter_bench.py [--packets 20000] [--mention-ratio 0.01]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agent.config import Config
+from agent.packet_filter import mentions_trigger
+
+logger = logging.getLogger("prefilter_bench")
+logger.setLevel(logging.WARNING)  # Same as production with INFO disabled: formatting still happens
+
+WORDS = "hey did anyone see the game last night lol yes no maybe later lunch pizza meeting deploy".split()
+
+def make_packets(count: int, mention_ratio: float):
+    """Build realistic chat packets, a fraction of which mention the agent"""
+    packets = []
+    for i in range(count):
+        text = " ".join(random.choices(WORDS, k=random.randint(3, 25)))
+        if random.random() < mention_ratio:
+            text = f"{Config.AGENT_TRIGGER} {text}"
+        packets.append(json.dumps({"text": text, "sender": f"user{i % 50}", "isAI": False}).encode('utf-8'))
+    return packets
+
+def legacy_path(data: bytes) -> bool:
+    """What every packet cost before the fast path (up to the trigger check)"""
+    message_data = json.loads(data.decode('utf-8'))
+    username = message_data.get("sender", "unknown_user")
+    message_text = message_data.get("text", "")
+
+    logger.info(f"🔍 RECEIVED MESSAGE FROM {username}: '{message_text}'")
+    logger.info(f"📋 Full message_data: {message_data}")
+    if message_data.get("type") == "ai" or message_data.get("sender") == Config.AGENT_NAME:
+        return False
+    logger.info(f"🎯 TRIGGER DEBUG:")
+    logger.info(f"   - Message text: '{message_text}'")
+    logger.info(f"   - AGENT_TRIGGER: '{Config.AGENT_TRIGGER}'")
+    logger.info(f"   - Message lower: '{message_text.lower()}'")
+    logger.info(f"   - Trigger lower: '{Config.AGENT_TRIGGER.lower()}'")
+    logger.info(f"   - Contains trigger: {Config.AGENT_TRIGGER.lower() in message_text.lower()}")
+
+    if Config.AGENT_TRIGGER.lower() not in message_text.lower():
+        logger.info(f"❌ Agent not mentioned, ignoring message from {username}")
+        return False
+    return True
+
+def fast_path(data: bytes) -> bool:
+    """Raw-bytes trigger scan; only matching packets are decoded afterwards"""
+    if not mentions_trigger(data):
+        return False
+    message_data = json.loads(data.decode('utf-8'))
+    return Config.AGENT_TRIGGER.lower() in message_data.get("text", "").lower()
+
+def bench(fn, packets, repeat: int) -> float:
+    """Best-of-repeat nanoseconds per packet"""
+    runs = timeit.repeat(lambda: [fn(p) for p in packets], number=1, repeat=repeat)
+    return min(runs) / len(packets) * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packets", type=int, default=20000)
+    parser.add_argument("--mention-ratio", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    packets = make_packets(args.packets, args.mention_ratio)
+    assert [legacy_path(p) for p in packets] == [fast_path(p) for p in packets], "paths disagree"
+
+    legacy = bench(legacy_path, packets, args.repeat)
+    fast = bench(fast_path, packets, args.repeat)
+
+    print(f"packets: {args.packets}, mention ratio: {args.mention_ratio:.0%}")
+    print(f"before (decode + json + logging): {legacy:8.0f} ns/packet")
+    print(f"after  (byte-level trigger scan): {fast:8.0f} ns/packet")
+    print(f"speedup: {legacy / fast:.1f}x")
+
+if __name__ == "__main__":
+    main()
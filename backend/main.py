@@ -14,17 +14,26 @@ Environment variables required:
     - LIVEKIT_API_SECRET: Your LiveKit API secret
     - GEMINI_API_KEY: Your Google Gemini API key
     - MEM0_API_KEY: Your mem0 API key (optional, will fallback to JSON)
+
+Optional:
+    - AGENT_STARTUP_PROBE: off (default), background or blocking. Whether to
+      check the Gemini and memory services before the worker registers.
 """
 
+import time
+_process_started = time.perf_counter()
+
 import asyncio
 import logging
 import sys
+import threading
 from livekit.agents import cli, WorkerOptions
 from agent.config import Config
-from agent.gemini_service import GeminiService
-from agent.memory_service import MemoryService
+from agent.services import get_services, prewarm
 from agent.chat_agent import entrypoint
 
+_imports_done = time.perf_counter()
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -37,9 +46,15 @@ def test_services():
     """Test all services before starting the agent"""
     logger.info("Testing services...")
     
+    try:
+        services = get_services()
+    except Exception as e:
+        logger.error(f"❌ Service initialization: {e}")
+        return False
+    
     # Test Gemini
     try:
-        gemini = GeminiService()
+        gemini = services.gemini
         if gemini.test_connection():
             logger.info("✅ Gemini service: Connected")
         else:
@@ -51,8 +66,8 @@ def test_services():
     
     # Test Memory service
     try:
-        memory = MemoryService()
-        logger.info(f"✅ Memory service: Initialized ({'mem0' if memory.use_mem0 else 'JSON'})")
+        memory = services.memory
+        logger.info(f"✅ Memory service: Initialized ({'mem0' if memory.use_mem0 else 'SQLite'})")
     except Exception as e:
         logger.error(f"❌ Memory service: {e}")
         return False
@@ -60,21 +75,49 @@ def test_services():
     logger.info("All services tested successfully!")
     return True
 
+def run_startup_probe(mode: str) -> bool:
+    """
+    Run the service check according to the configured mode
+    
+    Args:
+        mode: "off" skips it, "background" runs it on a thread and only logs
+            the outcome, "blocking" runs it now
+        
+    Returns:
+        False only if a blocking check failed
+    """
+    if mode == "blocking":
+        return test_services()
+    if mode == "background":
+        threading.Thread(target=test_services, name="startup-probe", daemon=True).start()
+    elif mode != "off":
+        logger.warning(f"Unknown AGENT_STARTUP_PROBE '{mode}', skipping service check")
+    return True
+
 def main():
     """Main function"""
     print("🤖 AI Chat Agent Starting...")
     print("=" * 50)
     
     try:
+        timings = {"imports": _imports_done - _process_started}
+        
         # Validate configuration
         logger.info("Validating configuration...")
+        started = time.perf_counter()
         Config.validate()
+        timings["config"] = time.perf_counter() - started
         logger.info("✅ Configuration valid")
         
-        # Test services
-        if not test_services():
+        # Test services (job processes build their own clients, so this is only a health check)
+        started = time.perf_counter()
+        if not run_startup_probe(Config.STARTUP_PROBE):
             logger.error("Service tests failed. Exiting.")
             sys.exit(1)
+        timings[f"probe ({Config.STARTUP_PROBE})"] = time.perf_counter() - started
+        
+        timings["total"] = time.perf_counter() - _process_started
+        logger.info("⏱️ Startup: " + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items()))
         
         # Start the LiveKit agent
         logger.info("Starting LiveKit agent...")
@@ -85,7 +128,7 @@ def main():
         print("=" * 50)
         
         # Run the agent using LiveKit's CLI
-        cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+        cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
         
     except KeyboardInterrupt:
         logger.info("Agent stopped by user")
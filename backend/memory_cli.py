@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Memory store maintenance
+
+Streams conversations in and out of the local store (or a legacy
+memory_storage.json) one turn at a time, so memory use stays flat no matter
+how large the store is. Run it while the agent is stopped, or accept that
+turns saved during an export may or may not be included.
+
+Usage:
+    python memory_cli.py export [-o turns.jsonl] [--from-json memory_storage.json]
+    python memory_cli.py import turns.jsonl|memory_storage.json [--batch-size 1000]
+    python memory_cli.py dedupe
+    python memory_cli.py compact [--vacuum]
+    python memory_cli.py archive [--idle-days 30] [--purge-days 0]
+    python memory_cli.py reshard [--shards N]
+    python memory_cli.py push-mem0 [--from turns.jsonl] [--batch-size 20] [--workers 4] [--dry-run]
+
+Exported files are JSON Lines with one turn per line:
+    {"username": ..., "user_message": ..., "ai_response": ..., "timestamp": ..., "room_id": ...}
+grouped by user, oldest first. The store is the one the agent uses
+(MEMORY_DB_PATH, split over MEMORY_SHARDS files); users moved to the cold
+archive (MEMORY_ARCHIVE_DIR) are not part of an export until they return.
+
+Changing MEMORY_SHARDS from or to 1 needs `reshard` (with every worker
+stopped): the agent refuses to start while the old layout's files still
+hold conversations.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from agent.config import Config
+from agent.conversation_store import open_conversation_store, reshard
+from agent.json_stream import iter_legacy_conversations
+from agent.memory_archive import ColdArchive, sweep
+from agent.resilience import backoff_delay
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger("memory_cli")
+
+_FIELDS = ("user_message", "ai_response", "timestamp", "room_id")
+_PROGRESS_EVERY = 50_000
+
+def open_store(max_conversations: Optional[int] = None):
+    """Open the agent's conversation store"""
+    return open_conversation_store(
+        Config.MEMORY_DB_PATH,
+        Config.MEMORY_SHARDS,
+        max_conversations=max_conversations or Config.MAX_CONVERSATIONS_PER_USER,
+        compact_every=Config.MEMORY_COMPACT_EVERY,
+        busy_timeout=Config.MEMORY_BUSY_TIMEOUT
+    )
+
+def read_turns(path: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    Stream (username, conversation) pairs from a JSONL export or a legacy JSON file
+
+    Args:
+        path: .jsonl file ("-" for stdin), anything else is read as legacy JSON
+    """
+    if path != "-" and not path.endswith(".jsonl"):
+        yield from iter_legacy_conversations(path)
+        return
+
+    stream = sys.stdin if path == "-" else open(path, 'r', encoding='utf-8')
+    try:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                username = record.pop("username")
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Skipping line {line_number}: {e}")
+                continue
+            yield username, record
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def normalize(conversation: Dict) -> Dict:
+    """Fill in missing fields the way the legacy importer did"""
+    return {
+        "user_message": conversation.get("user_message", ""),
+        "ai_response": conversation.get("ai_response", ""),
+        "timestamp": conversation.get("timestamp", ""),
+        "room_id": conversation.get("room_id", "default")
+    }
+
+def turn_digest(username: str, conversation: Dict) -> bytes:
+    """Identity of a turn for de-duplication"""
+    h = hashlib.blake2b(digest_size=16)
+    for value in (username, *(conversation[field] for field in _FIELDS if field != "room_id")):
+        h.update(str(value).encode('utf-8'))
+        h.update(b"\0")
+    return h.digest()
+
+def cmd_export(args) -> int:
+    """Write every turn as JSON Lines"""
+    store = None if args.from_json else open_store()
+    source = iter_legacy_conversations(args.from_json) if args.from_json else store.iter_conversations()
+    out = sys.stdout if args.output == "-" else open(args.output, 'w', encoding='utf-8')
+    exported = 0
+    users = 0
+    last_user = None
+    try:
+        for username, conversation in source:
+            out.write(json.dumps({"username": username, **normalize(conversation)}, ensure_ascii=False))
+            out.write("\n")
+            exported += 1
+            if username != last_user:
+                users += 1
+                last_user = username
+            if exported % _PROGRESS_EVERY == 0:
+                logger.info(f"Exported {exported} turns...")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if store:
+            store.close()
+
+    logger.info(f"✅ Exported {exported} turns for {users} users")
+    return 0
+
+def cmd_import(args) -> int:
+    """
+    Append turns from a file to the store in batches
+
+    The store orders a user's turns by row id and the per-user cap keeps the
+    newest ids, so for users the store already has only turns newer than
+    their newest stored turn are imported: older ones would land after it
+    and push genuinely recent turns out. That also keeps turns already in
+    the store from being added twice.
+    """
+    store = open_store(args.max_conversations)
+    batch: List[Tuple[str, Dict]] = []
+    imported = duplicates = older = trimmed = users = 0
+    current_user = None
+    seen = set()
+    stored_until = None
+
+    def write():
+        nonlocal imported, trimmed, batch
+        store.append_many(batch)
+        imported += len(batch)
+        # Trimmed as the import goes, so no set of every imported user is kept
+        trimmed += store.compact({username for username, _ in batch})
+        batch = []
+
+    for username, conversation in read_turns(args.path):
+        conversation = normalize(conversation)
+
+        # Exports are grouped by user, so one user's state is held at a time
+        if username != current_user:
+            current_user, seen = username, set()
+            stored_until = store.latest_timestamp(username)
+            users += 1
+            if stored_until is not None:
+                logger.debug(f"{username} is already stored; importing turns after {stored_until} only")
+
+        if stored_until is not None and conversation["timestamp"] <= stored_until:
+            older += 1
+            continue
+
+        if not args.keep_duplicates:
+            digest = turn_digest(username, conversation)
+            if digest in seen:
+                duplicates += 1
+                continue
+            seen.add(digest)
+
+        batch.append((username, conversation))
+        if len(batch) >= args.batch_size:
+            write()
+            if imported % _PROGRESS_EVERY < args.batch_size:
+                logger.info(f"Imported {imported} turns...")
+
+    write()
+    store.close()
+    if older:
+        logger.warning(f"Skipped {older} turns not newer than history already stored for their user")
+    logger.info(
+        f"✅ Imported {imported} turns for {users} users "
+        f"({duplicates} duplicates skipped, {trimmed} beyond the per-user cap removed)"
+    )
+    return 0
+
+def cmd_dedupe(args) -> int:
+    """Remove repeated turns from the store"""
+    store = open_store()
+    deleted = store.dedupe()
+    store.close()
+    logger.info(f"✅ Removed {deleted} duplicate turns")
+    return 0
+
+def cmd_compact(args) -> int:
+    """Apply the per-user cap to every user and optionally reclaim disk space"""
+    store = open_store(args.max_conversations)
+    deleted = store.compact()
+    logger.info(f"✅ Removed {deleted} turns beyond {store.max_conversations} per user")
+    if args.vacuum:
+        started = time.perf_counter()
+        store.vacuum()
+        logger.info(f"✅ Vacuumed in {time.perf_counter() - started:.1f}s")
+    store.close()
+    return 0
+
+def cmd_archive(args) -> int:
+    """Run one retention sweep: archive idle users and purge expired archives"""
+    store = open_store()
+    result = sweep(
+        store,
+        ColdArchive(Config.MEMORY_ARCHIVE_DIR),
+        args.idle_days,
+        args.purge_days,
+        Config.MEMORY_ARCHIVE_SEGMENT_USERS
+    )
+    store.close()
+    logger.info(f"✅ Archived {result['archived']} idle users, purged {result['purged']}")
+    return 0
+
+def cmd_reshard(args) -> int:
+    """Move every user between the unsharded file and the shard files"""
+    shards = args.shards or Config.MEMORY_SHARDS
+    archive = ColdArchive(Config.MEMORY_ARCHIVE_DIR) if os.path.isdir(Config.MEMORY_ARCHIVE_DIR) else None
+    started = time.perf_counter()
+    try:
+        moved = reshard(
+            Config.MEMORY_DB_PATH,
+            shards,
+            archive,
+            max_conversations=Config.MAX_CONVERSATIONS_PER_USER,
+            compact_every=Config.MEMORY_COMPACT_EVERY,
+            busy_timeout=Config.MEMORY_BUSY_TIMEOUT
+        )
+    except ValueError as e:
+        logger.error(f"❌ {e}")
+        return 1
+    logger.info(f"✅ Moved {moved} users into {shards} shard(s) in {time.perf_counter() - started:.1f}s")
+    return 0
+
+def iter_user_batches(turns: Iterator[Tuple[str, Dict]], batch_size: int) -> Iterator[Tuple[str, List[Dict]]]:
+    """Group consecutive turns of the same user into batches of at most batch_size"""
+    username, batch = None, []
+    for turn_user, conversation in turns:
+        if batch and (turn_user != username or len(batch) >= batch_size):
+            yield username, batch
+            batch = []
+        username = turn_user
+        batch.append(normalize(conversation))
+    if batch:
+        yield username, batch
+
+def cmd_push_mem0(args) -> int:
+    """Bulk-add history to mem0, one add call per user batch, several in flight"""
+    if not Config.MEM0_API_KEY and not args.dry_run:
+        logger.error("❌ MEM0_API_KEY is not set")
+        return 1
+
+    store = None if args.source else open_store()
+    try:
+        return _push_mem0(args, read_turns(args.source) if args.source else store.iter_conversations())
+    finally:
+        if store:
+            store.close()
+
+def _push_mem0(args, turns: Iterator[Tuple[str, Dict]]) -> int:
+    """Push streamed turns to mem0 (or count the calls with --dry-run)"""
+    batches = iter_user_batches(turns, args.batch_size)
+
+    if args.dry_run:
+        calls = pushed = 0
+        for _, conversations in batches:
+            calls += 1
+            pushed += len(conversations)
+        logger.info(f"Would push {pushed} turns in {calls} mem0 calls")
+        return 0
+
+    from mem0 import MemoryClient
+    client = MemoryClient(api_key=Config.MEM0_API_KEY)
+
+    lock = threading.Lock()
+    totals = {"calls": 0, "turns": 0, "failed": 0}
+
+    def push(username: str, conversations: List[Dict]):
+        messages = []
+        for conversation in conversations:
+            messages.append({"role": "user", "content": conversation["user_message"]})
+            messages.append({"role": "assistant", "content": conversation["ai_response"]})
+
+        for attempt in range(args.retries + 1):
+            try:
+                client.add(
+                    messages=messages,
+                    user_id=username,
+                    metadata={
+                        "room_id": conversations[-1]["room_id"],
+                        "timestamp": conversations[-1]["timestamp"]
+                    }
+                )
+                with lock:
+                    totals["calls"] += 1
+                    totals["turns"] += len(conversations)
+                    if totals["calls"] % 100 == 0:
+                        logger.info(f"Pushed {totals['turns']} turns in {totals['calls']} calls...")
+                return
+            except Exception as e:
+                if attempt == args.retries:
+                    with lock:
+                        totals["failed"] += len(conversations)
+                    logger.error(f"❌ mem0 add for {username} failed after {attempt + 1} attempts: {e}")
+                    return
+                time.sleep(backoff_delay(attempt, 1.0, 30.0))
+
+    # At most 2x workers batches are held in memory while waiting for a thread
+    in_flight = threading.BoundedSemaphore(args.workers * 2)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="mem0-push") as executor:
+        for username, conversations in batches:
+            in_flight.acquire()
+            future = executor.submit(push, username, conversations)
+            future.add_done_callback(lambda _: in_flight.release())
+
+    logger.info(
+        f"✅ Pushed {totals['turns']} turns in {totals['calls']} mem0 calls "
+        f"({time.perf_counter() - started:.1f}s, {totals['failed']} turns failed)"
+    )
+    return 1 if totals["failed"] else 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Memory store maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write every turn as JSON Lines")
+    export.add_argument("-o", "--output", default="-", help="output file (default stdout)")
+    export.add_argument("--from-json", help="read a legacy memory_storage.json instead of the store")
+    export.set_defaults(handler=cmd_export)
+
+    importer = commands.add_parser("import", help="append turns from a .jsonl export or legacy JSON file")
+    importer.add_argument("path", help=".jsonl file (- for stdin) or legacy JSON file")
+    importer.add_argument("--batch-size", type=int, default=1000, help="turns per transaction")
+    importer.add_argument("--max-conversations", type=int, help="per-user cap (default MAX_CONVERSATIONS_PER_USER)")
+    importer.add_argument("--keep-duplicates", action="store_true", help="do not skip repeated turns")
+    importer.set_defaults(handler=cmd_import)
+
+    dedupe = commands.add_parser("dedupe", help="remove repeated turns from the store")
+    dedupe.set_defaults(handler=cmd_dedupe)
+
+    compact = commands.add_parser("compact", help="apply the per-user cap to every user")
+    compact.add_argument("--max-conversations", type=int, help="per-user cap (default MAX_CONVERSATIONS_PER_USER)")
+    compact.add_argument("--vacuum", action="store_true", help="rebuild the database files to reclaim space")
+    compact.set_defaults(handler=cmd_compact)
+
+    archive = commands.add_parser("archive", help="move idle users' history to compressed archive segments")
+    archive.add_argument("--idle-days", type=float, default=Config.MEMORY_ARCHIVE_AFTER_DAYS or 30,
+                         help="days without activity before a user is archived")
+    archive.add_argument("--purge-days", type=float, default=Config.MEMORY_PURGE_AFTER_DAYS,
+                         help="days archived before history is deleted (0 keeps it)")
+    archive.set_defaults(handler=cmd_archive)
+
+    resharder = commands.add_parser("reshard", help="move the store between one file and MEMORY_SHARDS files")
+    resharder.add_argument("--shards", type=int, help="new shard count (default MEMORY_SHARDS)")
+    resharder.set_defaults(handler=cmd_reshard)
+
+    push = commands.add_parser("push-mem0", help="bulk-add history to mem0")
+    push.add_argument("--from", dest="source", help="read a .jsonl export or legacy JSON file instead of the store")
+    push.add_argument("--batch-size", type=int, default=20, help="turns per mem0 add call")
+    push.add_argument("--workers", type=int, default=4, help="concurrent mem0 calls")
+    push.add_argument("--retries", type=int, default=3, help="retries per failed call")
+    push.add_argument("--dry-run", action="store_true", help="count calls without sending anything")
+    push.set_defaults(handler=cmd_push_mem0)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
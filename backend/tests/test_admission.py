@@ -0,0 +1,36 @@
+import pytest
+
+from agent.admission import RoomAdmission
+
+async def _noop(*args):
+    pass
+
+@pytest.mark.parametrize("burst, max_coalesced, expected", [
+    # Follow-ups spend the user's tokens like new turns
+    (3, 5, {"queued": 1, "coalesced": 2, "rate_limited": 47}),
+    # With tokens to spare, the turn still stops growing at max_coalesced
+    (100, 5, {"queued": 1, "coalesced": 4, "dropped": 45})
+])
+def test_flooding_user_is_bounded(burst, max_coalesced, expected):
+    admission = RoomAdmission(_noop, user_rate=0, user_burst=burst, max_coalesced=max_coalesced)
+
+    outcomes = {}
+    for i in range(50):
+        outcome = admission.submit("mallory", f"spam {i}")
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    assert outcomes == expected
+    assert len(admission._pending["mallory"].messages) == 1 + expected["coalesced"]
+
+    # Other users are unaffected
+    assert admission.submit("alice", "@agent hi") == "queued"
+
+def test_coalesced_turn_is_capped_by_characters():
+    admission = RoomAdmission(_noop, user_rate=0, user_burst=100, max_coalesced=100, max_turn_chars=100)
+
+    assert admission.submit("mallory", "x" * 60) == "queued"
+    assert admission.submit("mallory", "x" * 30) == "coalesced"
+    assert admission.submit("mallory", "x" * 30) == "dropped"
+
+    turn = admission._pending["mallory"]
+    assert len(turn.text) == turn.chars <= 100
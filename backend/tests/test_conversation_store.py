@@ -0,0 +1,166 @@
+import json
+
+import pytest
+
+from agent.conversation_store import (
+    ConversationStore, ShardedConversationStore, open_conversation_store, reshard, shard_for, shard_paths
+)
+from agent.memory_archive import ColdArchive
+
+USERS = [f"user{i}" for i in range(12)]
+
+def turn(i: int, room: str = "lobby") -> dict:
+    return {
+        "user_message": f"message {i}",
+        "ai_response": f"reply {i}",
+        "timestamp": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}",
+        "room_id": room
+    }
+
+def fill(store, turns: int = 8):
+    """Give every user `turns` turns, interleaved across users, and a summary of their first half"""
+    store.append_many([(username, turn(i)) for i in range(turns) for username in USERS])
+    for username in USERS:
+        through_id = store.turns_after(username, 0)[turns // 2 - 1]["id"]
+        store.set_summary(username, f"{username} said hello", through_id, "2024-01-02T00:00:00")
+
+def windows(store) -> dict:
+    """Each user's summary and the turns after it, which is what a prompt is built from"""
+    result = {}
+    for username in USERS:
+        summary = store.get_summary(username)
+        after = store.turns_after(username, summary["through_id"])
+        result[username] = (summary["summary"], [t["user_message"] for t in after])
+    return result
+
+def stored_counts(store) -> dict:
+    counts = {}
+    for username, _ in store.iter_conversations(page_size=7):
+        counts[username] = counts.get(username, 0) + 1
+    return counts
+
+def test_cap_holds_after_compaction(tmp_path):
+    store = ConversationStore(str(tmp_path / "m.db"), max_conversations=5, compact_every=4)
+    for i in range(23):
+        store.append("alice", turn(i))
+    store.compact()
+
+    assert stored_counts(store) == {"alice": 5}
+    assert [t["user_message"] for t in store.recent("alice", 10)] == [f"message {i}" for i in range(18, 23)]
+    store.close()
+
+def test_sharded_store_routes_each_user_to_one_shard(tmp_path):
+    store = ShardedConversationStore(str(tmp_path / "m.db"), 4)
+    fill(store, turns=3)
+
+    for username in USERS:
+        holding = [index for index, shard in enumerate(store.shards) if shard.recent(username, 10)]
+        assert holding == [shard_for(username, 4)]
+        assert len(store.recent(username, 10)) == 3
+    store.close()
+
+@pytest.mark.parametrize("shards", [2, 4])
+def test_reshard_round_trip_keeps_windows(tmp_path, shards):
+    db_path = str(tmp_path / "m.db")
+    store = open_conversation_store(db_path, max_conversations=6)
+    fill(store)
+    before = windows(store)
+    store.close()
+
+    assert reshard(db_path, shards, max_conversations=6) == len(USERS)
+    store = open_conversation_store(db_path, shards, max_conversations=6)
+    assert windows(store) == before
+    store.close()
+
+    assert reshard(db_path, 1, max_conversations=6) == len(USERS)
+    store = open_conversation_store(db_path, max_conversations=6)
+    assert windows(store) == before
+    store.close()
+
+def test_reshard_requires_the_archive_for_archived_users(tmp_path):
+    db_path = str(tmp_path / "m.db")
+    archive = ColdArchive(str(tmp_path / "archive"))
+    store = open_conversation_store(db_path)
+    fill(store)
+    before = windows(store)
+    store.archive_idle(archive, "2100-01-01T00:00:00", limit=3)
+    store.close()
+
+    with pytest.raises(ValueError):
+        reshard(db_path, 2)
+    assert reshard(db_path, 2, archive=archive) == len(USERS)
+
+    store = open_conversation_store(db_path, 2)
+    assert windows(store) == before
+    store.close()
+
+def test_rehydrate_restores_archived_history(tmp_path):
+    store = ConversationStore(str(tmp_path / "m.db"))
+    archive = ColdArchive(str(tmp_path / "archive"))
+    fill(store)
+    before = windows(store)
+
+    assert store.archive_idle(archive, "2100-01-01T00:00:00", limit=len(USERS)) == (len(USERS), len(USERS))
+    assert store.recent("user0", 10) == []
+    assert store.stats("user0")["total_conversations"] == 8
+
+    for username in USERS:
+        assert store.rehydrate(username, archive) == 8
+        assert store.rehydrate(username, archive) == 0
+    assert windows(store) == before
+    store.close()
+
+def test_migrate_from_json_imports_once_and_resumes(tmp_path, monkeypatch):
+    json_path = tmp_path / "memory_storage.json"
+    json_path.write_text(json.dumps({
+        "users": {username: {"conversations": [turn(i) for i in range(8)]} for username in USERS}
+    }))
+
+    store = ConversationStore(str(tmp_path / "m.db"), max_conversations=5)
+
+    # A worker that dies after its first batch leaves its claim and position behind
+    class Crash(Exception):
+        pass
+
+    batches = []
+    original = store._migrate_batch
+
+    def crash_after_first_batch(*args, **kwargs):
+        if batches:
+            raise Crash()
+        batches.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(store, "_migrate_batch", crash_after_first_batch)
+    with pytest.raises(Crash):
+        store.migrate_from_json(str(json_path), batch_size=20)
+    monkeypatch.undo()
+
+    assert store.migrate_from_json(str(json_path), batch_size=20, stale_after=0) == len(USERS) * 5
+    assert stored_counts(store) == {username: 5 for username in USERS}
+    assert store.migrate_from_json(str(json_path)) == 0
+    store.close()
+
+def test_sharded_layout_change_is_refused(tmp_path):
+    db_path = str(tmp_path / "m.db")
+    store = open_conversation_store(db_path)
+    store.append("alice", turn(0))
+    store.close()
+
+    with pytest.raises(ValueError):
+        open_conversation_store(db_path, 2)
+
+    reshard(db_path, 2)
+    with pytest.raises(ValueError):
+        open_conversation_store(db_path, 4)
+    with pytest.raises(ValueError):
+        ConversationStore(shard_paths(db_path, 2)[1]).check_shard(0, 2)
+
+def test_dedupe_keeps_the_first_copy(tmp_path):
+    store = ConversationStore(str(tmp_path / "m.db"))
+    store.append_many([("alice", turn(0)), ("alice", turn(1)), ("alice", turn(0)), ("bob", turn(0))])
+
+    assert store.dedupe() == 1
+    assert [t["user_message"] for t in store.recent("alice", 10)] == ["message 0", "message 1"]
+    assert stored_counts(store) == {"alice": 2, "bob": 1}
+    store.close()
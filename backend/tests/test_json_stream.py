@@ -0,0 +1,73 @@
+import io
+import json
+
+import pytest
+
+from agent.json_stream import JsonStreamReader, iter_legacy_conversations
+
+DOCUMENT = {
+    "version": 2,
+    "users": {
+        "alice": {
+            "conversations": [
+                {"user_message": "hi é中", "ai_response": 'hello "there"\n', "timestamp": "t1", "room_id": "r"},
+                {"user_message": "n", "ai_response": "", "score": -0.5e-3, "tags": [1.5e3, 2.25, 10, True, None]}
+            ],
+            "profile": {"joined": 12345678901234567890, "ratio": 1E+2, "big": 1e300}
+        },
+        "bob": {"conversations": []},
+        "": {"conversations": [{"user_message": "{[,:]}", "ai_response": "x"}]}
+    },
+    "trailer": [[], {}, 0, -1, 3.0]
+}
+
+def read_document(text: str, chunk_size: int):
+    """Rebuild the document with the reader's structural walk"""
+    reader = JsonStreamReader(io.StringIO(text), chunk_size)
+
+    def walk():
+        char = reader.peek()
+        if char == "{":
+            return {key: walk() for key in reader.items()}
+        if char == "[":
+            result = []
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+                return result
+            while True:
+                result.append(walk())
+                if reader.peek() == ",":
+                    reader.expect(",")
+                    continue
+                reader.expect("]")
+                return result
+        return reader.value()
+
+    return walk()
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_chunk_size_sweep_matches_json_loads(indent):
+    text = json.dumps(DOCUMENT, indent=indent, ensure_ascii=False)
+    expected = json.loads(text)
+    for chunk_size in range(1, len(text) + 2):
+        assert read_document(text, chunk_size) == expected, f"chunk_size={chunk_size}"
+
+def test_numbers_split_at_every_position():
+    text = "[1.5e3, 2.25, 10, -7, 6E-2]"
+    for chunk_size in range(1, len(text) + 1):
+        reader = JsonStreamReader(io.StringIO(text), chunk_size)
+        assert list(reader.elements()) == json.loads(text), f"chunk_size={chunk_size}"
+
+def test_top_level_number_at_end_of_input():
+    for chunk_size in (1, 2, 3, 100):
+        assert JsonStreamReader(io.StringIO("1.5e3"), chunk_size).value() == 1500.0
+
+def test_legacy_conversations_in_file_order(tmp_path):
+    path = tmp_path / "memory_storage.json"
+    path.write_text(json.dumps(DOCUMENT), encoding="utf-8")
+
+    pairs = list(iter_legacy_conversations(str(path)))
+
+    assert [username for username, _ in pairs] == ["alice", "alice", ""]
+    assert pairs[1][1]["tags"] == [1500.0, 2.25, 10, True, None]
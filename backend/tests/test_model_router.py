@@ -0,0 +1,29 @@
+import asyncio
+from types import SimpleNamespace
+
+from agent.gemini_service import GeminiService
+from agent.model_router import ModelRouter
+
+def test_room_chat_counts_toward_the_context_size():
+    router = ModelRouter("light", "heavy", light_max_context_tokens=100)
+    room_context = "\n".join(f"user{i}: a fairly long line of chat number {i}" for i in range(40))
+
+    assert router.route("sounds good to me").name == ModelRouter.LIGHT
+    assert router.route("sounds good to me", room_context=room_context).name == ModelRouter.HEAVY
+
+def test_failed_light_call_is_retried_on_the_heavy_model():
+    service = GeminiService()
+    service.resilience.max_retries = 0
+    models = []
+
+    async def generate(model, contents, stream=False, **overrides):
+        models.append(model)
+        if model == service.router.light_model:
+            raise ValueError("light model rejected the request")
+        return SimpleNamespace(text="Sure thing.", usage_metadata=None)
+
+    service._generate = generate
+
+    assert asyncio.run(service.generate_response("sounds good to me", "", "alice")) == "Sure thing."
+    assert models == [service.router.light_model, service.router.heavy_model]
+    assert service.router.stats()[ModelRouter.HEAVY]["calls"] == 1
@@ -0,0 +1,180 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from agent import resilience
+from agent.resilience import CircuitBreaker, ResilientCaller, is_retryable
+
+class FakeClock:
+    """Stands in for the resilience module's time, advanced by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+class ApiError(Exception):
+    """Shaped like google.genai's APIError: the HTTP status as `code`"""
+
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=fake.monotonic, perf_counter=fake.perf_counter))
+    return fake
+
+def half_open_breaker(clock, **kwargs) -> CircuitBreaker:
+    """A breaker that has opened and waited out its cooldown, but not yet admitted a probe"""
+    breaker = CircuitBreaker("test", error_rate=0.5, min_calls=2, window=10, cooldown=5, **kwargs)
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.advance(5)
+    return breaker
+
+def test_breaker_opens_probes_and_closes(clock):
+    breaker = CircuitBreaker("test", error_rate=0.5, min_calls=4, window=10, cooldown=5)
+    for succeeded in (True, True, False):
+        breaker.record_success() if succeeded else breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock.advance(5)
+    assert breaker.allow() and breaker.probing
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.times_opened == 2
+
+    clock.advance(5)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow() and breaker.allow()
+
+def test_breaker_forgets_outcomes_outside_the_window(clock):
+    breaker = CircuitBreaker("test", error_rate=0.5, min_calls=4, window=10, cooldown=5)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(11)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_probe_slot_is_released_or_times_out(clock):
+    breaker = half_open_breaker(clock, probe_timeout=30)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+
+    assert not breaker.allow()
+    clock.advance(30)
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+
+def test_cancelled_probe_hands_the_slot_back(clock):
+    breaker = half_open_breaker(clock)
+    caller = ResilientCaller("test", "model", breaker=breaker)
+
+    async def hang(model):
+        await asyncio.Event().wait()
+
+    async def run():
+        task = asyncio.create_task(caller.call(hang))
+        await asyncio.sleep(0)
+        assert not breaker.allow()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert breaker.allow()
+
+@pytest.mark.parametrize("error, state", [
+    # A bug on our side says nothing about the backend: still half-open, probe released
+    (TypeError("bad argument"), CircuitBreaker.HALF_OPEN),
+    # An error response means the backend is up
+    (ApiError(400), CircuitBreaker.CLOSED)
+])
+def test_non_retryable_errors(clock, error, state):
+    breaker = half_open_breaker(clock)
+    caller = ResilientCaller("test", "model", breaker=breaker)
+    calls = []
+
+    async def fail(model):
+        calls.append(model)
+        raise error
+
+    with pytest.raises(type(error)):
+        asyncio.run(caller.call(fail))
+    assert calls == ["model"]
+    assert breaker.state == state
+    assert breaker.allow()
+
+@pytest.mark.parametrize("error, retryable", [
+    (asyncio.TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (ApiError(429), True),
+    (ApiError(503), True),
+    (SimpleNamespace(status_code=502), True),
+    (ApiError(400), False),
+    (ApiError(404), False),
+    (ValueError("invalid"), False),
+    (TypeError("bug"), False)
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+def test_httpx_transport_errors_are_retryable():
+    httpx = pytest.importorskip("httpx")
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert not is_retryable(httpx.HTTPError("other"))
+
+def test_retries_then_succeeds():
+    caller = ResilientCaller("test", "model", max_retries=2, retry_base_delay=0, retry_max_delay=0)
+    calls = []
+
+    async def flaky(model):
+        calls.append(model)
+        if len(calls) < 3:
+            raise ApiError(503)
+        return "ok"
+
+    assert asyncio.run(caller.call(flaky)) == "ok"
+    assert len(calls) == 3
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+def test_slow_call_is_hedged():
+    caller = ResilientCaller("test", "model", timeout=2, hedging=True, hedge_min_delay=0.05)
+    for _ in range(20):
+        caller.latencies.add(0.01)
+    assert caller.hedge_delay() == 0.05
+
+    calls = []
+
+    async def first_slow(model):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+            return "original"
+        return "hedge"
+
+    started = time.monotonic()
+    assert asyncio.run(caller.call(first_slow)) == "hedge"
+    assert len(calls) == 2
+    assert time.monotonic() - started < 0.5
+
+def test_hedging_waits_for_calibration():
+    caller = ResilientCaller("test", "model", hedging=True)
+    assert caller.hedge_delay() is None
+    assert ResilientCaller("test", "model").hedge_delay() is None
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+from agent.gemini_service import GeminiService
+from agent.response_cache import ResponseCache
+
+def test_shared_prompt_hits_across_users_and_contexts():
+    cache = ResponseCache(shared_prompts=["hello", "what can you do"])
+    cache.put("Hello!", "Hi alice, how can I help?", username="alice")
+
+    assert cache.get("hello", context="alice's history, one turn longer", username="alice") == "Hi alice, how can I help?"
+    assert cache.get("HELLO", context="", username="bob") == "Hi bob, how can I help?"
+    assert cache.stats()["shared_hits"] == 2
+
+def test_personal_prompt_stays_per_user():
+    cache = ResponseCache(shared_prompts=["hello"])
+    cache.put("what is my name", "You are alice.", context="ctx", username="alice")
+
+    assert cache.get("what is my name", context="ctx", username="alice") == "You are alice."
+    assert cache.get("what is my name", context="ctx", username="bob") is None
+
+def test_shared_prompt_is_not_cached_with_context():
+    cache = ResponseCache(shared_prompts=["hello"])
+    cache.put("hello", "Hi alice, about your cat...", context="alice: my cat is sick", username="alice")
+
+    assert cache.get("hello", username="bob") is None
+
+def _prompt_text(contents):
+    return "\n".join(part["text"] for part in contents[0]["parts"])
+
+def test_pipeline_keeps_personalized_replies_per_user():
+    service = GeminiService()
+    prompts = []
+
+    async def generate(model, contents, stream=False, **overrides):
+        prompt = _prompt_text(contents)
+        prompts.append(prompt)
+        asker = prompt.rsplit("Current message from ", 1)[1].split(":", 1)[0]
+        if "Previous conversation context" in prompt or "Recent messages" in prompt:
+            return SimpleNamespace(text=f"{asker}, you said: {prompt.splitlines()[1]}", usage_metadata=None)
+        return SimpleNamespace(text=f"Hello {asker}!", usage_metadata=None)
+
+    service._generate = generate
+
+    async def run():
+        return [
+            await service.generate_response("hello", "alice: my cat is sick", "alice", "bob: hi all"),
+            await service.generate_response("Hello", "bob: my password is hunter2", "bob", "alice: hello"),
+            await service.generate_response("what did I say", "alice: my cat is sick", "alice", ""),
+            await service.generate_response("what did I say", "bob: my password is hunter2", "bob", ""),
+            await service.generate_response("what did I say", "alice: my cat is sick", "alice", "")
+        ]
+
+    replies = asyncio.run(run())
+
+    # The common prompt is generated once, from neither user's history nor the room chat
+    assert replies[:2] == ["Hello alice!", "Hello bob!"]
+    assert "cat" not in prompts[0] and "bob: hi all" not in prompts[0]
+
+    # Personalized replies are generated per user and only repeat for the same user and context
+    assert len(prompts) == 3
+    assert replies[2] == replies[4] == "alice, you said: alice: my cat is sick"
+    assert replies[3] == "bob, you said: bob: my password is hunter2"
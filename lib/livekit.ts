@@ -1,5 +1,10 @@
 import { Room, RoomEvent, DataPacket_Kind } from 'livekit-client';
 
+// Newest agent packet envelope this client understands (1 adds "batch" packets),
+// announced on its own topic so the agent only coalesces for clients that can unpack
+export const WIRE_VERSION = 1;
+const WIRE_TOPIC = 'wire';
+
 export class LiveKitClient {
   private room: Room | null = null;
   private onMessageCallback?: (message: any) => void;
@@ -8,13 +13,22 @@ export class LiveKitClient {
   async connect(wsUrl: string, token: string) {
     this.room = new Room();
     
-    this.room.on(RoomEvent.DataReceived, (payload, participant) => {
+    this.room.on(RoomEvent.DataReceived, (payload, participant, kind, topic) => {
+      // Other clients' version announcements are not chat messages
+      if (topic === WIRE_TOPIC) return;
+
       const message = JSON.parse(new TextDecoder().decode(payload));
-      this.onMessageCallback?.(message);
+      if (message.type === 'batch' && Array.isArray(message.messages)) {
+        message.messages.forEach((inner: any) => this.onMessageCallback?.(inner));
+      } else {
+        this.onMessageCallback?.(message);
+      }
     });
 
     this.room.on(RoomEvent.ParticipantConnected, () => {
       this.updateParticipants();
+      // The agent may join after us: repeat the announcement for it
+      this.announceWireVersion();
     });
 
     this.room.on(RoomEvent.ParticipantDisconnected, () => {
@@ -23,6 +37,14 @@ export class LiveKitClient {
 
     await this.room.connect(wsUrl, token);
     this.updateParticipants();
+    this.announceWireVersion();
+  }
+
+  private announceWireVersion() {
+    if (!this.room) return;
+
+    const hello = new TextEncoder().encode(JSON.stringify({ type: 'hello', v: WIRE_VERSION }));
+    this.room.localParticipant.publishData(hello, { reliable: true, topic: WIRE_TOPIC });
   }
 
   private updateParticipants() {
@@ -4,6 +4,7 @@ export interface Message {
     sender: string;
     timestamp: Date;
     isAI: boolean;
+    isStreaming?: boolean;
   }
   
   export interface Participant {